@@ -0,0 +1,169 @@
+import asyncio
+from dataclasses import dataclass
+import logging
+from typing import Sequence
+
+import discord
+from discord import Message
+
+from django.db import transaction
+from django.db.models import Q
+
+from bot.cache import RankingConfig, load_channel
+from bot.db import db
+from bot.parser import get_parser_set
+from website import models
+from website.scores import import_entries
+
+
+@dataclass
+class BackfillResult:
+    channel_id: int
+    messages: int = 0
+    entries: int = 0
+    pages: int = 0
+    complete: bool = False
+    error: str | None = None
+
+
+def scorable(message: Message, user_id: int, prefixes: tuple[str, ...]) -> bool:
+    """
+    The checks of the message listener: not our own messages, links or commands
+    """
+    if message.author.bot and message.author.id == user_id:
+        return False
+
+    if "http" in message.content:
+        return False
+
+    return not message.content.startswith(prefixes)
+
+def load_backfill(channel_id: int) -> tuple[tuple[RankingConfig, ...], dict[int, int | None]]:
+    """
+    The active rankings of a channel and the message each of them continues after,
+    None for a ranking that was never backfilled
+    """
+    rankings = load_channel(channel_id)
+    checkpoints = dict(models.RankingChannel.objects.filter(
+        channel_id = channel_id,
+        ranking_id__in = [ranking.id for ranking in rankings]
+    ).values_list("ranking_id", "backfilled_until"))
+    return rankings, {ranking.id: checkpoints.get(ranking.id) for ranking in rankings}
+
+def start_after(checkpoints: dict[int, int | None]) -> int | None:
+    """
+    The message to read the history after, the checkpoint of the ranking that is furthest behind
+    """
+    if not checkpoints or None in checkpoints.values():
+        return None
+    return min(checkpoints.values())
+
+@transaction.atomic
+def save_page(channel_id: int, ranking_ids: list[int], entries: list[tuple], last_message_id: int) -> int:
+    """
+    Insert and score the entries of a page and move the checkpoints that are behind past it in the same transaction,
+    so an interrupted backfill neither loses nor repeats a page
+    """
+    inserted = import_entries(entries)
+    models.RankingChannel.objects.filter(
+        Q(backfilled_until__isnull = True) | Q(backfilled_until__lt = last_message_id),
+        channel_id = channel_id,
+        ranking_id__in = ranking_ids
+    ).update(backfilled_until = last_message_id)
+    return inserted
+
+
+class Backfill:
+    """
+    Scores the messages channels got while the bot wasn't listening. The history of a channel is read oldest first
+    in pages from the ranking that is furthest behind, every page is inserted with one query and scored in the transaction
+    that moves the checkpoints of the channel's rankings past it, so the next run continues where the last one stopped.
+    A ranking only counts the messages after its own checkpoint. At most `concurrency` channels are read at the same time
+    and every channel waits `page_delay` seconds between pages, discord.py waits out the rate limits it hits.
+    """
+    def __init__(
+        self,
+        logger: logging.Logger,
+        user_id: int,
+        prefixes: Sequence[str] = ("°",),
+        concurrency: int = 2,
+        page_size: int = 100,
+        page_delay: float = 1.0
+    ) -> None:
+        self.logger = logger
+        self.user_id = user_id
+        self.prefixes = tuple(prefixes)
+        self.page_size = page_size
+        self.page_delay = page_delay
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._running: dict[int, asyncio.Future] = {}
+
+    async def run(self, channels: Sequence[discord.abc.Messageable]) -> list[BackfillResult]:
+        """
+        Backfill channels concurrently, a channel that is already being backfilled is joined instead of read twice
+        """
+        return list(await asyncio.gather(*(self.channel(channel) for channel in channels)))
+
+    async def channel(self, channel: discord.abc.Messageable) -> BackfillResult:
+        running = self._running.get(channel.id)
+        if running is not None:
+            return await asyncio.shield(running)
+
+        running = self._running[channel.id] = asyncio.ensure_future(self._channel(channel))
+        try:
+            return await asyncio.shield(running)
+        finally:
+            self._running.pop(channel.id, None)
+
+    async def _channel(self, channel: discord.abc.Messageable) -> BackfillResult:
+        result = BackfillResult(channel.id)
+        async with self.semaphore:
+            rankings, checkpoints = await db(load_backfill)(channel.id)
+            if not rankings:
+                result.complete = True
+                return result
+
+            ranking_ids = [ranking.id for ranking in rankings]
+            parser_set = get_parser_set(tuple(ranking.parser for ranking in rankings))
+            checkpoint = start_after(checkpoints)
+            after = discord.Object(id = checkpoint) if checkpoint is not None else None
+
+            try:
+                while True:
+                    messages = [
+                        message async for message in channel.history(limit = self.page_size, after = after, oldest_first = True)
+                    ]
+                    if not messages:
+                        break
+
+                    entries = []
+                    for message in messages:
+                        if not scorable(message, self.user_id, self.prefixes):
+                            continue
+
+                        for ranking, s in zip(rankings, parser_set.parse(message.content)):
+                            # a ranking only counts the messages after its own checkpoint
+                            if s is not None and (checkpoints[ranking.id] is None or message.id > checkpoints[ranking.id]):
+                                entries.append((ranking.id, message.author.id, message.id, s, message.created_at))
+
+                    result.entries += await db(save_page)(channel.id, ranking_ids, entries, messages[-1].id)
+                    result.messages += len(messages)
+                    result.pages += 1
+                    after = messages[-1]
+
+                    if len(messages) < self.page_size:
+                        break
+                    await asyncio.sleep(self.page_delay)
+
+                result.complete = True
+
+            except discord.HTTPException as e:
+                # the checkpoint keeps the pages that were saved, the next run continues from there
+                result.error = str(e)
+                self.logger.error(f"Failed to backfill channel {channel.id} after {result.pages} pages: {e}")
+
+            self.logger.info(
+                f"backfilled {result.messages} messages of channel {channel.id} into {result.entries} entries"
+                f"{'' if result.complete else ', incomplete'}"
+            )
+            return result
@@ -0,0 +1,220 @@
+from math import ceil
+import random
+import re
+from time import perf_counter
+from typing import Awaitable, Callable
+
+from asgiref.sync import async_to_sync
+from django.test.utils import setup_databases, teardown_databases
+
+from bot.fakes import FakeBot, FakeChannel, FakeContext, FakeGuild, FakeMessage, FakeRawMessageUpdate, FakeUser
+from bot.parser import get_parser, get_parser_set, to_float
+from website import seed as seeding
+from website.seed import MESSAGE_BASE, SeedResult
+
+NEW_MESSAGE_BASE = 2 * MESSAGE_BASE
+UNLINKED_CHANNEL_BASE = 9 * 10 ** 17
+
+TOKENS = [None, "€", "pt", "+"]
+MAPPINGS = [{}, {"kg": 2.0, "g": 0.002}, {"x": 3.0}, {"km": 1.0, "k": 1000.0}]
+WORDS = ["hello", "count", "ok", "the", "lift", "run", "well-done", "done", "a", "-", "pt", "€"]
+
+
+def legacy_parse_message(message: str, token: str = None, mappings: dict[str, float] = {}) -> float | None:
+    """
+    The parser before patterns were compiled and prefiltered, kept as the reference
+    the differential tests and benchmarks compare against
+    """
+    s = 0.0
+    matches = False
+    regex_string = rf"(?:{re.escape(token)}) ?(\d+(?:(?:\.|,)\d+)?(?:[eE][+-]?\d+)?)" if token is not None else r"([+-] ?\d+(?:(?:\.|,)\d+)?(?:[eE][+-]?\d+)?)"
+    if mappings:
+        regex_string += f" ?((?:{')|(?:'.join([re.escape(k) for k in mappings.keys()])}))?"
+
+    for match in re.finditer(regex_string, message):
+        matches = True
+        multiplier = 1.0 if (len(match.groups()) < 2) else mappings.get(match.group(2), 1)
+        s += to_float(match.group(1)) * multiplier
+
+    return s if matches else None
+
+def sample_messages(count: int, seed: int = 0) -> list[str]:
+    """
+    Generate chat messages, most of which score nothing, like a real channel
+    """
+    rng = random.Random(seed)
+
+    def number() -> str:
+        return rng.choice([
+            str(rng.randint(0, 100)),
+            f"{rng.randint(0, 100)}.{rng.randint(0, 99)}",
+            f"{rng.randint(0, 100)},{rng.randint(0, 9)}",
+            f"{rng.randint(1, 9)}e{rng.choice(['', '+', '-'])}{rng.randint(0, 3)}",
+        ])
+
+    def scored() -> str:
+        token = rng.choice(["+", "-", "+ ", "€", "€ ", "pt", "pt "])
+        suffix = rng.choice(["", "", " kg", "kg", " g", "x", " km", "k"])
+        return f"{token}{number()}{suffix}"
+
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(1, 12))]
+        if rng.random() < 0.3:
+            words.insert(rng.randint(0, len(words)), scored())
+        if rng.random() < 0.1:
+            words.append(number())
+        messages.append(" ".join(words))
+    return messages
+
+def throughput(function: Callable[[str], object], messages: list[str], repeat: int = 3) -> float:
+    """
+    Best messages per second over `repeat` runs
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        for message in messages:
+            function(message)
+        best = min(best, perf_counter() - start)
+    return len(messages) / best if best > 0 else float("inf")
+
+def bench_parser(count: int = 20000, seed: int = 0) -> dict[str, float]:
+    """
+    Messages per second scored against all sample rankings, with the legacy parser,
+    one compiled parser per ranking and a parser set for the whole channel
+    """
+    messages = sample_messages(count, seed)
+    rankings = list(zip(TOKENS, MAPPINGS))
+    parsers = tuple(get_parser(token, mappings) for token, mappings in rankings)
+    parser_set = get_parser_set(parsers)
+
+    def legacy(message: str) -> list[float | None]:
+        return [legacy_parse_message(message, token, mappings) for token, mappings in rankings]
+
+    def compiled(message: str) -> list[float | None]:
+        return [parser.parse(message) for parser in parsers]
+
+    return {
+        "messages": count,
+        "rankings": len(rankings),
+        "legacy_per_second": throughput(legacy, messages),
+        "compiled_per_second": throughput(compiled, messages),
+        "parser_set_per_second": throughput(parser_set.parse, messages),
+    }
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """
+    Latency percentiles (nearest rank) of samples in seconds, reported in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[max(0, ceil(p / 100 * len(ordered)) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+async def timed(calls: list[Callable[[], Awaitable]]) -> list[float]:
+    """
+    Run the calls one after the other and time each of them
+    """
+    samples = []
+    for call in calls:
+        start = perf_counter()
+        await call()
+        samples.append(perf_counter() - start)
+    return samples
+
+async def bench_handlers(seeded: SeedResult, iterations: int = 200, seed: int = 0) -> dict[str, dict[str, float]]:
+    """
+    Latency of the message listener, the edit listener and show against seeded data
+    """
+    from bot.extensions.ranking import Ranking
+
+    rng = random.Random(seed)
+    bot = FakeBot()
+    cog = Ranking(bot)
+
+    guild = FakeGuild(id = seeded.guild_ids[0])
+    members = [FakeUser(id = member, name = f"member {i}") for i, member in enumerate(seeded.members)]
+    guild.members = members
+    channels = [FakeChannel(id = channel_id, guild = guild, members = members) for channel_id in seeded.channel_ids]
+    # half of the traffic goes to channels without a ranking, like in a real guild
+    unlinked = [FakeChannel(id = UNLINKED_CHANNEL_BASE + i, guild = guild, members = members) for i in range(len(channels))]
+
+    contents = sample_messages(iterations, seed)
+    messages = [
+        FakeMessage(
+            id = NEW_MESSAGE_BASE + i,
+            content = content,
+            author = rng.choice(members),
+            channel = rng.choice(channels if i % 2 else unlinked)
+        )
+        for i, content in enumerate(contents)
+    ]
+
+    edits = []
+    for message_id in rng.sample(seeded.message_ids, min(iterations, len(seeded.message_ids))):
+        message = FakeMessage(
+            id = message_id,
+            content = f"+{rng.randint(1, 10)}",
+            author = rng.choice(members),
+            channel = rng.choice(channels)
+        )
+        edits.append(FakeRawMessageUpdate.edit(message))
+
+    contexts = [
+        FakeContext(channel = channels[i % len(channels)], author = members[0], bot = bot)
+        for i in range(max(1, iterations // 10))
+    ]
+
+    return {
+        "ranking_listener": summarize(await timed([
+            lambda message = message: cog.ranking_listener(message) for message in messages
+        ])),
+        "ranking_edit_listener": summarize(await timed([
+            lambda payload = payload: cog.ranking_edit_listener(payload) for payload in edits
+        ])),
+        "show": summarize(await timed([
+            lambda ctx = ctx: cog.show.callback(cog, ctx) for ctx in contexts
+        ])),
+    }
+
+def bench_database(
+    sizes: list[int],
+    iterations: int = 200,
+    channels: int = 10,
+    rankings: int = 20,
+    mappings: int = 3,
+    members: int = 1000,
+    seed: int = 0,
+) -> dict[str, dict]:
+    """
+    Seed a fresh test database for every number of entries and measure the handlers against it
+    """
+    results = {}
+    for size in sizes:
+        old_config = setup_databases(verbosity = 0, interactive = False)
+        try:
+            seeded = seeding.seed(
+                channels = channels,
+                rankings = rankings,
+                mappings = mappings,
+                members = members,
+                entries = size,
+                seed = seed
+            )
+            results[str(size)] = async_to_sync(bench_handlers)(seeded, iterations, seed)
+        finally:
+            teardown_databases(old_config, verbosity = 0)
+    return results
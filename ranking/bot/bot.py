@@ -1,12 +1,84 @@
 import asyncio
 from contextlib import suppress
 import logging
+from time import perf_counter
+import resource
+import traceback
 
 import discord
 from discord.ext import commands
 
+from django.conf import settings
+from django.db import connections
+
+from bot.db import maintain_connections, pool_stats
+from bot.metrics import serve_metrics
+from bot.profiler import Profiler
+from website.metrics import metrics
+
 
 logger = logging.getLogger("bot")
+# errors the handlers log count as failed invocations
+logger.addFilter(metrics.error_filter)
+
+IDENTIFY_INTERVAL = 5.0
+"""seconds discord wants between the identifies of a rate limit bucket"""
+
+
+def resident_memory() -> int:
+    """
+    Current resident memory of the process in bytes, the peak if the current value is unavailable
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def member_cache_flags(names: str) -> discord.MemberCacheFlags:
+    """
+    MemberCacheFlags with only the comma separated flags set
+    """
+    flags = discord.MemberCacheFlags.none()
+    for name in names.split(","):
+        if name.strip():
+            setattr(flags, name.strip(), True)
+    return flags
+
+
+def parse_shard_ids(value: str) -> list[int]:
+    """
+    Shard ids from a comma separated list of ids and inclusive ranges, e.g. "0-3,8"
+    """
+    shard_ids = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        shard_ids.extend(range(int(first), int(last or first) + 1))
+    return sorted(set(shard_ids))
+
+def shard_range(shard_count: int, process_index: int, process_count: int) -> list[int]:
+    """
+    The contiguous range of shards process `process_index` of `process_count` runs
+    """
+    if not 0 <= process_index < process_count:
+        raise ValueError(f"Process index {process_index} is not in 0..{process_count - 1}")
+    return list(range(process_index * shard_count // process_count, (process_index + 1) * shard_count // process_count))
+
+def identify_delay(shard_id: int, concurrency: int, initial: bool) -> float:
+    """
+    Seconds a shard waits before it identifies. Discord lets `concurrency` shards identify every 5 seconds,
+    one per bucket of shard_id % concurrency, so shards go in slots of that many consecutive ids instead of
+    one at a time. The first shard of a process waits for the slot of its id, so processes started together take turns.
+    """
+    concurrency = max(concurrency, 1)
+    if initial:
+        return shard_id // concurrency * IDENTIFY_INTERVAL
+    return IDENTIFY_INTERVAL if shard_id % concurrency == 0 else 0.0
 
 
 class Bot(commands.Bot):
@@ -19,6 +91,21 @@ class Bot(commands.Bot):
 
         help_command = commands.MinimalHelpCommand()
 
+        kwargs.setdefault("max_messages", settings.BOT_MAX_MESSAGES)
+        kwargs.setdefault("chunk_guilds_at_startup", settings.BOT_CHUNK_GUILDS_AT_STARTUP)
+        kwargs.setdefault("member_cache_flags", member_cache_flags(settings.BOT_MEMBER_CACHE_FLAGS))
+        self.message_cache_size = kwargs["max_messages"]
+        self.started = perf_counter()
+        self.ready_after: float | None = None
+        self.maintenance: asyncio.Task | None = None
+        self.metrics_runner = None
+        self.profiler = Profiler(
+            self,
+            max_seconds = settings.BOT_PROFILE_MAX_SECONDS,
+            interval = settings.BOT_PROFILE_INTERVAL_MS / 1000,
+            top = settings.BOT_PROFILE_TOP
+        )
+
         super().__init__(
             command_prefix = "°", 
             *args, 
@@ -33,6 +120,32 @@ class Bot(commands.Bot):
             await self.load_extension(ext)
             self.logger.info(f"loaded extension '{ext}'")
 
+    async def setup_hook(self) -> None:
+        self.logger.info(f"connecting with {resident_memory() / 2 ** 20:.1f} MiB resident")
+        self.maintenance = asyncio.create_task(
+            maintain_connections(self.logger, settings.BOT_DB_MAINTENANCE_INTERVAL)
+        )
+
+        metrics.register("db_pool", pool_stats)
+        if settings.BOT_METRICS_PORT:
+            try:
+                self.metrics_runner = await serve_metrics(
+                    metrics, self.logger, settings.BOT_METRICS_HOST, settings.BOT_METRICS_PORT, self.profiler
+                )
+            except OSError as e:
+                self.logger.error(f"Failed to serve metrics on port {settings.BOT_METRICS_PORT}: {e}")
+
+    async def on_ready(self) -> None:
+        if self.ready_after is None:
+            # on_ready fires again after every reconnect
+            self.ready_after = perf_counter() - self.started
+
+        self.logger.info(
+            f"ready in {self.ready_after:.1f}s with {resident_memory() / 2 ** 20:.1f} MiB resident, "
+            f"{len(self.guilds)} guilds, {sum(len(guild.members) for guild in self.guilds)} cached members, "
+            f"message cache {'disabled' if self.message_cache_size is None else f'of {self.message_cache_size} messages'}"
+        )
+
     async def close(self) -> None:
         extension_tasks = []
         for ext in list(self.extensions):
@@ -41,10 +154,74 @@ class Bot(commands.Bot):
 
         await asyncio.gather(*extension_tasks)
 
+        if self.maintenance is not None:
+            self.maintenance.cancel()
+        if self.metrics_runner is not None:
+            with suppress(Exception):
+                await self.metrics_runner.cleanup()
+        with suppress(Exception):
+            connections["default"].close_pool()
+
         return await super().close()
 
     async def on_error(self, event_method, /, *args, **kwargs):
-        self.logger.error(event_method)
+        metrics.error(event_method, "event")
+        self.logger.error(f"Unhandled error in {event_method}\n{traceback.format_exc()}")
 
     async def on_command_error(self, context, exception):
         self.logger.error(f"{context}\n{exception}")
+
+
+class ShardedBot(Bot, commands.AutoShardedBot):
+    """
+    The bot running several shards on one connection each. `shard_ids` is the part of the
+    `shard_count` shards this process runs, so the guilds can be split over several processes.
+    """
+    def __init__(self, *args, identify_concurrency: int = 0, **kwargs):
+        self.identify_concurrency = identify_concurrency
+        super().__init__(*args, **kwargs)
+
+    async def setup_hook(self) -> None:
+        if not self.identify_concurrency:
+            _, _, session_start_limit = await self.http.get_bot_gateway()
+            self.identify_concurrency = session_start_limit.get("max_concurrency", 1)
+
+        self.logger.info(
+            f"running shards {self.shard_ids or 'all'} of {self.shard_count or 'the recommended number'}, "
+            f"identifying {self.identify_concurrency} at a time"
+        )
+        await super().setup_hook()
+
+    async def before_identify_hook(self, shard_id: int | None, *, initial: bool = False) -> None:
+        await asyncio.sleep(identify_delay(shard_id or 0, self.identify_concurrency, initial))
+
+    async def on_shard_ready(self, shard_id: int) -> None:
+        self.logger.info(
+            f"shard {shard_id} ready after {perf_counter() - self.started:.1f}s "
+            f"with {sum(1 for guild in self.guilds if guild.shard_id == shard_id)} guilds"
+        )
+
+
+def create_bot(**kwargs) -> Bot:
+    """
+    The bot the settings ask for: unsharded without BOT_SHARD_COUNT, otherwise the shards of this process
+    from BOT_SHARD_IDS or the range of process BOT_PROCESS_INDEX out of BOT_PROCESS_COUNT
+    """
+    if not settings.BOT_SHARD_COUNT:
+        return Bot(**kwargs)
+
+    kwargs.setdefault("identify_concurrency", settings.BOT_IDENTIFY_CONCURRENCY)
+    if settings.BOT_SHARD_COUNT == "auto":
+        if settings.BOT_PROCESS_COUNT != 1 or settings.BOT_SHARD_IDS:
+            raise ValueError("BOT_SHARD_COUNT=auto runs every shard in one process, set a shard count to split them")
+        return ShardedBot(**kwargs)
+
+    shard_count = int(settings.BOT_SHARD_COUNT)
+    if settings.BOT_SHARD_IDS:
+        shard_ids = parse_shard_ids(settings.BOT_SHARD_IDS)
+    else:
+        shard_ids = shard_range(shard_count, settings.BOT_PROCESS_INDEX, settings.BOT_PROCESS_COUNT)
+
+    if not shard_ids or shard_ids[-1] >= shard_count:
+        raise ValueError(f"Shards {shard_ids} are not a part of the {shard_count} shards")
+    return ShardedBot(shard_count = shard_count, shard_ids = shard_ids, **kwargs)
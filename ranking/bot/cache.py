@@ -0,0 +1,339 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import threading
+
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from bot.db import db
+from bot.parser import MessageParser, get_parser
+from website import models
+
+
+@dataclass(frozen = True)
+class RankingConfig:
+    """
+    The part of a ranking the message listener needs to score a message
+    """
+    id: int
+    name: str
+    token: str | None
+    mappings: dict[str, float] = field(default_factory = dict)
+    parser: MessageParser = field(default = None, compare = False)
+
+    def __post_init__(self) -> None:
+        if self.parser is None:
+            object.__setattr__(self, "parser", get_parser(self.token, self.mappings))
+
+
+def channel_rankings(channel_id: int) -> QuerySet:
+    """
+    The active rankings of a channel, in the order they were linked
+    """
+    return models.Ranking.objects.filter(
+        rankingchannel__channel_id = channel_id,
+        active = True
+    ).order_by("rankingchannel__id")
+
+def load_channel(channel_id: int) -> tuple[RankingConfig, ...]:
+    """
+    Load the active rankings of a channel with their mappings
+    """
+    rankings = channel_rankings(channel_id).prefetch_related("mapping_set")
+
+    return tuple(
+        RankingConfig(
+            id = ranking.id,
+            name = ranking.name,
+            token = ranking.token,
+            mappings = {mapping.string: mapping.value for mapping in ranking.mapping_set.all()}
+        )
+        for ranking in rankings
+    )
+
+
+class ChannelCache:
+    """
+    LRU cache of the active rankings per channel id.
+    Channels without rankings are cached as an empty tuple, so their messages never reach the database.
+    """
+    def __init__(self, max_size: int = 4096) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[RankingConfig, ...]] = OrderedDict()
+        self._loading: dict[int, asyncio.Future] = {}
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, channel_id: int) -> tuple[RankingConfig, ...]:
+        """
+        Get the active rankings of a channel, loading them on a miss.
+        Concurrent misses for the same channel share a single load.
+        """
+        rankings = self._entries.get(channel_id)
+        if rankings is not None:
+            self._entries.move_to_end(channel_id)
+            self.hits += 1
+            return rankings
+
+        self.misses += 1
+        loading = self._loading.get(channel_id)
+        if loading is not None:
+            return await asyncio.shield(loading)
+
+        generation = self._generation
+        loading = asyncio.ensure_future(db(load_channel)(channel_id))
+        self._loading[channel_id] = loading
+        try:
+            rankings = await asyncio.shield(loading)
+        finally:
+            del self._loading[channel_id]
+
+        # Don't store what was loaded before an invalidation
+        if generation == self._generation:
+            self._entries[channel_id] = rankings
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+
+        return rankings
+
+    def invalidate(self, channel_id: int) -> None:
+        """
+        Forget a channel
+        """
+        self._generation += 1
+        self._entries.pop(channel_id, None)
+
+    def invalidate_ranking(self, ranking_id: int) -> None:
+        """
+        Forget every channel a ranking is cached in
+        """
+        self._generation += 1
+        for channel_id, rankings in list(self._entries.items()):
+            if any(ranking.id == ranking_id for ranking in rankings):
+                del self._entries[channel_id]
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def mark_reconfigured(ranking_ids: list[int]) -> None:
+    """
+    Tell the other bot processes that the channels, mappings or subrankings of rankings changed
+    """
+    models.Ranking.objects.filter(id__in = ranking_ids).update(config_version = F("config_version") + 1)
+
+
+class ConfigWatcher:
+    """
+    Finds the rankings another process reconfigured by comparing the config version of every ranking
+    with the one seen by the previous check. The first check only records the versions.
+    Until a process checks, it parses with the mappings and shows the windows it cached; the windows
+    an entry counts in are read in the transaction that writes it, so the scores never depend on a check.
+    """
+    def __init__(self) -> None:
+        self.checks = 0
+        self.changes = 0
+        self._versions: dict[int, int] | None = None
+
+    def check(self) -> list[int]:
+        """
+        The rankings whose configuration changed or that were deleted since the previous check
+        """
+        versions = dict(models.Ranking.objects.values_list("id", "config_version"))
+        previous, self._versions = self._versions, versions
+        self.checks += 1
+        if previous is None:
+            return []
+
+        changed = [ranking_id for ranking_id, version in versions.items() if previous.get(ranking_id, version) != version]
+        changed += [ranking_id for ranking_id in previous if ranking_id not in versions]
+        self.changes += len(changed)
+        return changed
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "rankings": len(self._versions or ()),
+            "checks": self.checks,
+            "changes": self.changes,
+        }
+
+
+def save_names(guild_id: int, users: list[tuple[int, str, bool]], ranking_ids: list[int]) -> None:
+    """
+    Store the (user, name, bot) of users in every given ranking of a guild
+    """
+    models.User.objects.bulk_create(
+        [
+            models.User(user = user, name = name, bot = bot, ranking_id = ranking_id, guild_id = guild_id)
+            for user, name, bot in users
+            for ranking_id in ranking_ids
+        ],
+        update_conflicts = True,
+        unique_fields = ["user", "ranking", "guild_id"],
+        update_fields = ["name", "bot", "updated_at"]
+    )
+
+def rename_user(guild_id: int, user: int, name: str, bot: bool) -> int:
+    # update() skips auto_now
+    return models.User.objects.filter(guild_id = guild_id, user = user).update(name = name, bot = bot, updated_at = timezone.now())
+
+def put_lru(entries: OrderedDict, key, value, max_size: int) -> int:
+    """
+    Store a key as the most recently used one, returns the number of keys evicted
+    """
+    entries[key] = value
+    entries.move_to_end(key)
+    evicted = 0
+    while len(entries) > max_size:
+        entries.popitem(last = False)
+        evicted += 1
+    return evicted
+
+
+class NameCache:
+    """
+    Display names and bot flags of the users that score in a guild, backed by `website.User`.
+    The names of a ranking are read once per guild, authors are written when they first score
+    in a ranking or their name changed, so neither needs the member list of a channel.
+    Every set it keeps holds at most `max_size` keys and forgets the least recently used ones;
+    a forgotten name is read again from the database, a forgotten stored row is written again.
+    """
+    def __init__(self, max_size: int = 100000) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._names: OrderedDict[tuple[int, int], tuple[str, bool]] = OrderedDict()
+        """(guild_id, user) -> (name, bot)"""
+        self._stored: OrderedDict[tuple[int, int, int], None] = OrderedDict()
+        """(guild_id, ranking_id, user) rows in the database"""
+        self._loaded: OrderedDict[tuple[int, int], None] = OrderedDict()
+        """(guild_id, ranking_id) read from the database"""
+        self._absent: OrderedDict[tuple[int, int], None] = OrderedDict()
+        """(guild_id, user) discord didn't know as a member"""
+        self._lock = threading.Lock()
+
+    def _put(self, entries: OrderedDict, key, value = None) -> None:
+        self.evictions += put_lru(entries, key, value, self.max_size)
+
+    def known(self, guild_id: int, user: int, name: str, bot: bool, ranking_ids: list[int]) -> bool:
+        """
+        Whether the name of a user is stored for all the given rankings, without touching the database
+        """
+        with self._lock:
+            if self._names.get((guild_id, user)) != (name, bot):
+                return False
+            stored = [(guild_id, ranking_id, user) for ranking_id in ranking_ids]
+            if not all(key in self._stored for key in stored):
+                return False
+
+            self._names.move_to_end((guild_id, user))
+            for key in stored:
+                self._stored.move_to_end(key)
+            return True
+
+    def remember(self, guild_id: int, users: list[tuple[int, str, bool]], ranking_ids: list[int]) -> None:
+        """
+        Store the (user, name, bot) of users in the given rankings
+        """
+        save_names(guild_id, users, ranking_ids)
+        with self._lock:
+            for user, name, bot in users:
+                self._put(self._names, (guild_id, user), (name, bot))
+                self._absent.pop((guild_id, user), None)
+                for ranking_id in ranking_ids:
+                    self._put(self._stored, (guild_id, ranking_id, user))
+
+    def is_absent(self, guild_id: int, user: int) -> bool:
+        return (guild_id, user) in self._absent
+
+    def mark_absent(self, guild_id: int, users: list[int]) -> None:
+        """
+        Remember users that are no longer members, so they aren't looked up on every show
+        """
+        with self._lock:
+            for user in users:
+                self._put(self._absent, (guild_id, user))
+
+    def rename(self, guild_id: int, user: int, name: str, bot: bool) -> None:
+        """
+        Update the name of a user in every ranking of a guild
+        """
+        rename_user(guild_id, user, name, bot)
+        with self._lock:
+            if (guild_id, user) in self._names:
+                self._names[(guild_id, user)] = (name, bot)
+
+    def resolve(self, guild_id: int, ranking_ids: list[int], users: list[int]) -> dict[int, tuple[str, bool]]:
+        """
+        The known names of the given users, the rankings not read before are read with one query.
+        Once the cache forgot names, the users it doesn't know are read again with one more query.
+        """
+        with self._lock:
+            missing = [ranking_id for ranking_id in ranking_ids if (guild_id, ranking_id) not in self._loaded]
+        if missing:
+            rows = list(models.User.objects.filter(
+                guild_id = guild_id,
+                ranking_id__in = missing
+            ).values_list("ranking_id", "user", "name", "bot"))
+            self._learn(guild_id, rows)
+            with self._lock:
+                for ranking_id in missing:
+                    self._put(self._loaded, (guild_id, ranking_id))
+
+        names = self._lookup(guild_id, users)
+        forgotten = [user for user in users if user not in names and not self.is_absent(guild_id, user)]
+        if self.evictions and forgotten:
+            rows = list(models.User.objects.filter(
+                guild_id = guild_id,
+                ranking_id__in = ranking_ids,
+                user__in = forgotten
+            ).values_list("ranking_id", "user", "name", "bot"))
+            self._learn(guild_id, rows)
+            names.update(self._lookup(guild_id, forgotten))
+
+        self.hits += len(names)
+        self.misses += len(users) - len(names)
+        return names
+
+    def _learn(self, guild_id: int, rows: list[tuple[int, int, str, bool]]) -> None:
+        with self._lock:
+            for ranking_id, user, name, bot in rows:
+                if (guild_id, user) not in self._names:
+                    self._put(self._names, (guild_id, user), (name, bot))
+                self._put(self._stored, (guild_id, ranking_id, user))
+
+    def _lookup(self, guild_id: int, users: list[int]) -> dict[int, tuple[str, bool]]:
+        names = {}
+        with self._lock:
+            for user in users:
+                name = self._names.get((guild_id, user))
+                if name is not None:
+                    self._names.move_to_end((guild_id, user))
+                    names[user] = name
+        return names
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._names),
+            "max_size": self.max_size,
+            "stored": len(self._stored),
+            "absent": len(self._absent),
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,89 @@
+from asgiref.sync import sync_to_async
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable
+
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+
+def pool():
+    """
+    The psycopg pool of the default database, None when connections aren't pooled
+    """
+    return getattr(connections[DEFAULT_DB_ALIAS], "pool", None)
+
+def pooled() -> bool:
+    return pool() is not None
+
+def _returning_connection(function: Callable) -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        try:
+            return function(*args, **kwargs)
+        finally:
+            # with CONN_MAX_AGE = 0 closing hands the connection back to the pool
+            connections.close_all()
+
+    return wrapper
+
+def db(function: Callable) -> Callable[..., Awaitable[Any]]:
+    """
+    Run a function that uses the ORM from async code.
+    With a pool the call runs on any worker thread and borrows a connection for just that call,
+    so concurrent events don't queue up behind the single thread sensitive connection.
+    """
+    if pooled():
+        return sync_to_async(_returning_connection(function), thread_sensitive = False)
+
+    return sync_to_async(function)
+
+def pool_stats() -> dict[str, float]:
+    """
+    Size, wait time and saturation of the pool, empty when connections aren't pooled
+    """
+    connection_pool = pool()
+    if connection_pool is None:
+        return {}
+
+    stats = connection_pool.get_stats()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    queued = stats.get("requests_queued", 0)
+    return {
+        "min_size": stats.get("pool_min", 0),
+        "max_size": stats.get("pool_max", 0),
+        "size": size,
+        "available": available,
+        "in_use": size - available,
+        "saturation": (size - available) / max(stats.get("pool_max", 1), 1),
+        "requests": stats.get("requests_num", 0),
+        "requests_waiting": stats.get("requests_waiting", 0),
+        "requests_queued": queued,
+        "requests_errors": stats.get("requests_errors", 0),
+        "requests_wait_ms": stats.get("requests_wait_ms", 0),
+        "average_wait_ms": stats.get("requests_wait_ms", 0) / queued if queued else 0.0,
+        "connections_lost": stats.get("connections_lost", 0),
+    }
+
+async def maintain_connections(logger: logging.Logger, interval: float = 60) -> None:
+    """
+    Drop stale connections in the background instead of before every event,
+    and log how busy the pool is so it can be sized for bursts
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # the thread sensitive connection used by the async ORM methods
+            await sync_to_async(close_old_connections)()
+            if pooled():
+                stats = pool_stats()
+                logger.info(
+                    f"database pool {stats['in_use']}/{stats['max_size']} in use, "
+                    f"saturation {stats['saturation']:.0%}, "
+                    f"{stats['requests_queued']} of {stats['requests']} requests waited "
+                    f"{stats['average_wait_ms']:.1f} ms on average"
+                )
+
+        except Exception as e:
+            logger.error(f"Failed to maintain database connections: {e}")
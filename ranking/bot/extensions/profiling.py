@@ -0,0 +1,45 @@
+import io
+
+import discord
+from discord.ext import commands
+
+from bot.bot import Bot
+
+
+class Profiling(commands.Cog):
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+
+    @commands.command()
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context, mode: str = "cpu", seconds: float = 10.0, *handlers: str):
+        """
+        ```
+        Profile the bot for some seconds and attach the busiest functions or the allocation sites that grew.
+        Only the owner of the bot can run it.
+        Usage: profile [cpu|memory] [seconds] [handlers...]
+
+        Arguments:
+        - mode: cpu samples the stacks, memory compares tracemalloc snapshots (default cpu)
+        - seconds: How long to profile (default 10)
+        - handlers: Only count the time or allocations of these commands and listeners, e.g. show ranking_listener (optional)
+        ```
+        """
+        try:
+            await ctx.send(f"Profiling {mode} for {seconds:g} seconds" + (f" of {', '.join(handlers)}" if handlers else ""))
+            summary = await self.bot.profiler.run(mode, seconds, handlers)
+
+        except (ValueError, RuntimeError) as e:
+            await ctx.send(f"Failed to profile: {e}")
+            return
+
+        except Exception as e:
+            await ctx.send("Failed to profile")
+            self.bot.logger.error(f"Failed to profile: {e}")
+            return
+
+        self.bot.logger.info(f"{ctx.author} took a {mode} profile of {seconds:g} seconds")
+        await ctx.send(file = discord.File(io.BytesIO(summary.encode()), filename = f"profile-{mode}.txt"))
+
+async def setup(bot: Bot):
+    await bot.add_cog(Profiling(bot))
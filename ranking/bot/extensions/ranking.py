@@ -1,114 +1,98 @@
-from asgiref.sync import sync_to_async as sta
 import asyncio
 from datetime import datetime, date, time
 import re
+from typing import Sequence
 
-from discord import Interaction, Message
+from discord import Guild, Interaction, Member, Message, RawMessageUpdateEvent, User
 from discord.ext import commands
 
+from bot.backfill import Backfill
 from bot.bot import Bot
+from bot.cache import ChannelCache, ConfigWatcher, NameCache, mark_reconfigured
+from bot.db import db
+from bot.leaderboard import Leaderboard, LeaderboardView, leaderboard_header, leaderboard_lines
+from bot.parser import get_parser_set
+from bot.reactions import ReactionDispatcher
+from bot.writer import EntryWriter, PendingMessage
 
 from website import models
+from website.metrics import metrics
+from website.ranks import Standing, ranks
+from website.scores import active_subrankings, create_entries, rebuild_windows, rescore_entries, standings
+from website.subrankings import resolver
 
-from django.db import close_old_connections
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
 
 import traceback
 
-def format_rankings(rankings: list[models.Ranking], users: dict[int, str]) -> str:
+def linked_rankings(channel_id: int) -> QuerySet:
     """
-    Format a list of rankings into a string
+    The rankings linked to a channel, active or not, in the order they were linked
     """
-    ranking_scores = {}
-    for ranking in rankings:
-        entries = models.Entry.objects.filter(
-            ranking_id = ranking.id,
-            user__in = users.keys(),
-            created_at__gte = ranking.from_time
-        )
-        scores = {user: {"score": 0, "last_updated": 0} for user in users.keys()}
-        for entry in entries:
-            scores[entry.user] = {
-                "score": entry.number + scores[entry.user]["score"],
-                "last_updated": max(entry.updated_at.timestamp(), scores[entry.user]["last_updated"])
-            }
-
-        ranking_scores[ranking.id] = {
-            "scores": scores,
-            "ranking": ranking
-        }
-    
-    s = ""
-    if len(ranking_scores) == 1:
-        ranking_id, ranking_info = list(ranking_scores.items())[0]
-        ranking = ranking_info["ranking"]
-        scores = ranking_info["scores"]
-        # Sort the scores by score and last_updated
-        sorted_scores = sorted(
-            sorted(
-                scores.items(),
-                key = lambda x: x[1]["last_updated"],
-            ),
-            key = lambda x: x[1]["score"],
-            reverse = not ranking.reverse_sort
-        )
+    return models.Ranking.objects.filter(rankingchannel__channel_id = channel_id).order_by("rankingchannel__id")
 
-        
-        s += f"## {ranking.name} {ranking.subranking_name} (#{ranking.id})\n"
-        for user_id, user_data in sorted_scores:
-            score = round(user_data["score"], 2)
-            if score != 0 or not users[user_id][1]:
-                s += f"1. {users[user_id][0]}: {round(user_data['score'], 2)}\n"
-        
+def target_rankings(channel_id: int, ranking_id: int | None) -> QuerySet:
+    """
+    The ranking a command names, or every ranking of the channel
+    """
+    if ranking_id is None:
+        return linked_rankings(channel_id)
+    return models.Ranking.objects.filter(id = ranking_id)
+
+def ranking_rows(
+    rankings: list[models.Ranking],
+    subrankings: dict[int, models.Subranking | None],
+    offset: int = 0,
+    limit: int | None = None
+) -> list[tuple]:
+    """
+    The ordered standings rows from `offset` on: (user, score) for a single ranking,
+    (user, total, [score per ranking]) for several
+    """
+    if len(rankings) == 1:
+        rows = standings(rankings, subrankings, not rankings[0].reverse_sort)
     else:
-        users = {user_id: {"score": 0, "last_updated": 0, "name": user_info[0], "string": "", "bot": user_info[1]} for user_id, user_info in users.items()}
-        for ranking_id, ranking_info in ranking_scores.items():
-            for user_id, user in ranking_info["scores"].items():
-                users[user_id]["score"] += user["score"]
-                users[user_id]["last_updated"] = max(users[user_id]["last_updated"], user["last_updated"])
-                display_token = ranking_info["ranking"].token if ranking_info["ranking"].token is not None else ('+' if user['score'] >= 0 else '')
-                users[user_id]["string"] += f" {display_token}{round(user['score'], 1)}"
-        
-        # Sort the scores by score and last_updated
-        sorted_scores = sorted(
-            sorted(
-                users.items(),
-                key = lambda x: x[1]["last_updated"],
-            ),
-            key = lambda x: x[1]["score"],
-            reverse = True
-        )
+        rows = standings(rankings, subrankings)
 
-        s += f"## Rankings\n"
-        for entry in sorted_scores:
-            if entry[1]["score"] != 0 or not entry[1]["bot"]:
-                s += f"1. {entry[1]['name']}: {entry[1]['string']} = {round(entry[1]['score'], 1)}\n"
-    
-    return s
+    if limit is not None:
+        rows = rows[offset:offset + limit]
+    elif offset:
+        rows = rows[offset:]
+
+    if len(rankings) == 1:
+        return [(row["user"], row["score"]) for row in rows]
 
-def to_float(number: str) -> float:
+    return [
+        (row["user"], row["score"], [
+            row[f"ranking_{ranking.id}"] if row[f"ranking_{ranking.id}"] is not None else 0
+            for ranking in rankings
+        ])
+        for row in rows
+    ]
+
+def format_rank(name: str, rankings: list[models.Ranking], standings: list[Standing | None], users: dict[int, tuple[str, bool]]) -> str:
     """
-    Convert a string to a float
+    Format the standing of a user in every ranking, `users` maps user ids to their (name, bot)
     """
-    try:
-        return float(number.replace(",", "."))
-    except ValueError:
-        return 0.0
-    except TypeError:
-        return 0.0
-
-def parse_message(message: str, token: str = None, mappings: dict[str, float] = {}) -> tuple[float, str]:
-    s = 0.0
-    matches = False
-    regex_string = f"(?:{re.escape(token)}) ?(\d+(?:(?:\.|,)\d+)?(?:[eE][+-]?\d+)?)" if token is not None else r"([+-] ?\d+(?:(?:\.|,)\d+)?(?:[eE][+-]?\d+)?)"
-    if mappings:
-        regex_string += f" ?((?:{')|(?:'.join([re.escape(k) for k in mappings.keys()])}))?"
-
-    for match in re.finditer(regex_string, message):
-        matches = True
-        multiplier = 1.0 if (len(match.groups()) < 2) else mappings.get(match.group(2), 1)
-        s += to_float(match.group(1)) * multiplier
-    
-    return s if matches else None
+    def user(user_id: int) -> str:
+        return (users.get(user_id) or (f"User {user_id}", False))[0]
+
+    s = f"## Rank of {name}\n"
+    for ranking, standing in zip(rankings, standings):
+        if standing is None:
+            s += f"- {ranking.name} (#{ranking.id}): no score yet\n"
+            continue
+
+        s += f"- {ranking.name} (#{ranking.id}): #{standing.position} of {standing.of} with {round(standing.score, 2)}"
+        if standing.above is not None:
+            s += f", {round(abs(standing.above.score - standing.score), 2)} behind {user(standing.above.user)}"
+        if standing.below is not None:
+            s += f", {round(abs(standing.score - standing.below.score), 2)} ahead of {user(standing.below.user)}"
+        s += "\n"
+
+    return s
 
 def parse_time(time_str: str) -> datetime:
     """
@@ -149,10 +133,13 @@ def parse_time(time_str: str) -> datetime:
                     
                     raise ValueError(f"Invalid time format: {time_str}. Expected format: YYYY/MM/DD-HH:MM:SS or DD/MM/YYYY-HH:MM:SS or <t:1234567890:f/d/t/r> or 'now' or 'today'.")
 
-def is_command(message: Message, bot: Bot) -> bool:
+def is_command(message: Message, bot: Bot, content: str = None) -> bool:
     """
-    Check if a message is a command
+    Check if a message is a command, `content` overrides the content of the message
     """
+    if content is None:
+        content = message.content
+
     prefixes = bot.command_prefix
     if callable(prefixes):
         prefixes = prefixes(bot, message)
@@ -161,7 +148,7 @@ def is_command(message: Message, bot: Bot) -> bool:
         prefixes = [prefixes]
     
     for prefix in prefixes:
-        if message.content.startswith(prefix):
+        if content.startswith(prefix):
             return True
     
     return False
@@ -169,13 +156,94 @@ def is_command(message: Message, bot: Bot) -> bool:
 class Ranking(commands.Cog):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
+        self.channels = ChannelCache(settings.RANKING_CHANNEL_CACHE_SIZE)
+        self.names = NameCache(settings.BOT_NAME_CACHE_SIZE)
+        self.config = ConfigWatcher()
+        self.watching: asyncio.Task | None = None
+        self.backfiller: Backfill | None = None
+        self.warming: asyncio.Task | None = None
+        self.reactions = ReactionDispatcher(
+            bot,
+            rate = settings.BOT_REACTION_RATE,
+            queue_size = settings.BOT_REACTION_QUEUE_SIZE
+        )
+        self.writer = None
+        if settings.RANKING_WRITE_BEHIND:
+            self.writer = EntryWriter(
+                bot.logger,
+                interval_ms = settings.RANKING_WRITE_BEHIND_INTERVAL_MS,
+                batch_size = settings.RANKING_WRITE_BEHIND_BATCH_SIZE,
+                queue_size = settings.RANKING_WRITE_BEHIND_QUEUE_SIZE,
+                reactions = self.reactions
+            )
+
+        for name, stats in (
+            ("channel_cache", self.channels.stats),
+            ("name_cache", self.names.stats),
+            ("config", self.config.stats),
+            ("reactions", self.reactions.stats),
+            ("rank_index", ranks.stats),
+        ):
+            metrics.register(name, stats)
+        if self.writer is not None:
+            metrics.register("writer", self.writer.stats)
 
     async def cog_load(self):
+        self.reactions.start()
+        if self.writer is not None:
+            self.writer.start()
+
+        # build the rank indexes in the background instead of on the first °rank
+        self.warming = asyncio.create_task(self.warm_ranks())
+        self.watching = asyncio.create_task(self.watch_config())
+        # the watcher forgets the windows of reconfigured rankings, reads don't need to check their version
+        resolver.check_versions = False
+
         command = self.bot.get_command("create")
         if command:
             command.help = self.create.__doc__
 
+    async def warm_ranks(self):
+        try:
+            users = await db(ranks.warm)()
+            self.bot.logger.info(f"indexed the ranks of {users} users")
+
+        except Exception as e:
+            self.bot.logger.error(f"Failed to build the rank indexes: {e}")
+
+    async def watch_config(self):
+        """
+        Drop the cached rankings another shard process reconfigured
+        """
+        while True:
+            try:
+                self.forget(await db(self.config.check)())
+
+            except Exception as e:
+                self.bot.logger.error(f"Failed to check the ranking configuration: {e}")
+
+            await asyncio.sleep(settings.BOT_CONFIG_POLL_INTERVAL)
+
+    def forget(self, ranking_ids: Sequence[int]):
+        for ranking_id in ranking_ids:
+            self.channels.invalidate_ranking(ranking_id)
+            resolver.invalidate(ranking_id)
+
+    async def cog_unload(self):
+        for task in (self.warming, self.watching):
+            if task is not None:
+                task.cancel()
+        resolver.check_versions = True
+
+        if self.writer is not None:
+            # flush the entries that are still buffered
+            await self.writer.close()
+
+        # remove the 🔁 reactions that are still shown and send the queued reactions
+        await self.reactions.close()
+
     @commands.command()
+    @metrics.timed("create", "command")
     async def create(self, ctx: commands.Context, name: str = None, token: str = None):
         """
         ```
@@ -186,7 +254,6 @@ class Ranking(commands.Cog):
         - token: The token of the ranking (optional)
         ```
         """
-        await sta(close_old_connections)()
         if not name:
             await ctx.send("Please provide a name for the ranking")
             return
@@ -199,7 +266,6 @@ class Ranking(commands.Cog):
                 active = True,
                 reverse_sort = False
             )
-            await ranking.asave()
             if not isinstance(ranking, models.Ranking):
                 await ctx.send("Failed to create ranking")
             
@@ -207,9 +273,12 @@ class Ranking(commands.Cog):
                 ranking_channel : models.RankingChannel = await models.RankingChannel.objects.acreate(
                     ranking = ranking,
                     channel_id = ctx.channel.id,
-                    guild_id = ctx.guild.id
+                    guild_id = ctx.guild.id,
+                    # a new ranking counts from now on, a backfill doesn't score the older messages
+                    backfilled_until = ctx.message.id
                 )
-                await ranking_channel.asave()
+                self.channels.invalidate(ctx.channel.id)
+                await db(mark_reconfigured)([ranking.id])
                 if not isinstance(ranking_channel, models.RankingChannel):
                     await ctx.send(f"Failed to link ranking (#{ranking.id}) to channel")
                 
@@ -221,6 +290,7 @@ class Ranking(commands.Cog):
             self.bot.logger.error(f"Failed to create ranking: {e}")
 
     @commands.command()
+    @metrics.timed("rankings", "command")
     async def rankings(self, ctx: commands.Context, inactive: str = None):
         """
         ```
@@ -230,28 +300,26 @@ class Ranking(commands.Cog):
         - inactive: If set to "all", list all rankings, including inactive ones
         ```
         """
-        await sta(close_old_connections)()
         try:
-            rankings = []
-            ranking_channels = await sta(models.RankingChannel.objects.filter)(channel_id = ctx.channel.id)
-            async for ranking_channel in ranking_channels:
-                ranking = await models.Ranking.objects.aget(id = ranking_channel.ranking_id)
-                if ranking.active or inactive == "all":
-                    rankings.append(
-                        f"- {ranking.name} (#{ranking.id})"
-                    )
+            linked = [ranking async for ranking in linked_rankings(ctx.channel.id)]
+            rankings = [
+                f"- {ranking.name} (#{ranking.id})"
+                for ranking in linked
+                if ranking.active or inactive == "all"
+            ]
 
             if len(rankings) == 0:
                 await ctx.send("No rankings found in this channel")
             
             else:
-                await ctx.send(f"## Current ranking{'s' if len(ranking_channels) > 1 else ''}\n" + "\n".join(rankings))
+                await ctx.send(f"## Current ranking{'s' if len(linked) > 1 else ''}\n" + "\n".join(rankings))
         
         except Exception as e:
             await ctx.send(f"Failed to list rankings")
             self.bot.logger.error(f"Failed to list rankings: {e}")
         
     @commands.command()
+    @metrics.timed("link", "command")
     async def link(self, ctx: commands.Context, ranking_id: int = None):
         """
         ```
@@ -261,7 +329,6 @@ class Ranking(commands.Cog):
         - ranking_id: The ID of the ranking to link
         ```
         """
-        await sta(close_old_connections)()
         if not ranking_id:
             await ctx.send("Please provide a ranking ID")
             return
@@ -277,7 +344,8 @@ class Ranking(commands.Cog):
                 channel_id = ctx.channel.id,
                 guild_id = ctx.guild.id
             )
-            await ranking_channel.asave()
+            self.channels.invalidate(ctx.channel.id)
+            await db(mark_reconfigured)([ranking.id])
             if not isinstance(ranking_channel, models.RankingChannel):
                 await ctx.send(f"Failed to link ranking (#{ranking_id}) to channel")
             
@@ -289,6 +357,58 @@ class Ranking(commands.Cog):
             self.bot.logger.error(f"Failed to link ranking: {e}")
 
     @commands.command()
+    @metrics.timed("backfill", "command")
+    async def backfill(self, ctx: commands.Context, ranking_id: int = None):
+        """
+        ```
+        Score the messages of the current channel that were posted while the bot was offline.
+        A backfill continues where the previous one stopped.
+
+        Arguments:
+        - ranking_id: Backfill every channel of this server the ranking is linked to instead (optional)
+        ```
+        """
+        try:
+            channels = [ctx.channel]
+            if ranking_id is not None:
+                channels = []
+                async for ranking_channel in models.RankingChannel.objects.filter(ranking_id = ranking_id, guild_id = ctx.guild.id):
+                    channel = self.bot.get_channel(ranking_channel.channel_id)
+                    if channel is None:
+                        channel = await self.bot.fetch_channel(ranking_channel.channel_id)
+                    channels.append(channel)
+
+                if not channels:
+                    await ctx.send(f"Ranking (#{ranking_id}) is not linked to a channel in this server")
+                    return
+
+            if self.backfiller is None:
+                self.backfiller = Backfill(
+                    self.bot.logger,
+                    self.bot.user.id,
+                    prefixes = (self.bot.command_prefix,),
+                    concurrency = settings.BOT_BACKFILL_CONCURRENCY,
+                    page_size = settings.BOT_BACKFILL_PAGE_SIZE,
+                    page_delay = settings.BOT_BACKFILL_PAGE_DELAY
+                )
+
+            await ctx.send(f"Backfilling {len(channels)} channel{'s' if len(channels) > 1 else ''}")
+            results = await self.backfiller.run(channels)
+
+            messages = sum(result.messages for result in results)
+            entries = sum(result.entries for result in results)
+            incomplete = sum(not result.complete for result in results)
+            await ctx.send(
+                f"Backfilled {messages} messages into {entries} new entries"
+                + (f", {incomplete} channel{'s' if incomplete > 1 else ''} stopped early, run it again to continue" if incomplete else "")
+            )
+
+        except Exception as e:
+            await ctx.send(f"Failed to backfill")
+            self.bot.logger.error(f"Failed to backfill: {e}")
+
+    @commands.command()
+    @metrics.timed("show", "command")
     async def show(self, ctx: commands.Context, ranking_id: int = None):
         """
         ```
@@ -298,16 +418,9 @@ class Ranking(commands.Cog):
         - ranking_id: The ID of the ranking to show (optional)
         ```
         """
-        await sta(close_old_connections)()
         rankings = []
         if ranking_id is None:
-            ranking_channels = await sta(models.RankingChannel.objects.filter)(
-                channel_id = ctx.channel.id
-            )
-            async for ranking_channel in ranking_channels:
-                rankings.append(
-                    await models.Ranking.objects.aget(id = ranking_channel.ranking_id)
-                )
+            rankings = [ranking async for ranking in linked_rankings(ctx.channel.id)]
         
         else:
             ranking : models.Ranking = await models.Ranking.objects.aget(id = ranking_id)
@@ -327,15 +440,64 @@ class Ranking(commands.Cog):
             rankings.append(ranking)
 
         try:
-            users = {m.id: (m.display_name, m.bot) for m in ctx.channel.members}
-            formatted_string = await sta(format_rankings)(rankings, users)
-            await ctx.send(formatted_string)
+            ranking_ids = [ranking.id for ranking in rankings]
+            subrankings = await db(active_subrankings)(ranking_ids)
+
+            async def fetch(offset: int, limit: int) -> list[tuple]:
+                return await db(ranking_rows)(rankings, subrankings, offset, limit)
+
+            async def render(rows: list[tuple]) -> list[str]:
+                users = await self.member_names(ctx.guild, ranking_ids, [row[0] for row in rows])
+                return list(leaderboard_lines(rankings, rows, users))
+
+            pages = Leaderboard(leaderboard_header(rankings, subrankings), fetch, render, settings.BOT_SHOW_PAGE_ROWS)
+            first = await pages.page(0)
+            if not await pages.has_page(1):
+                await ctx.send(first)
+                return
+
+            view = LeaderboardView(pages, timeout = settings.BOT_SHOW_TIMEOUT)
+            await view.update_buttons()
+            view.message = await ctx.send(first, view = view)
         
         except Exception as e:
             await ctx.send(f"Failed to show ranking")
             self.bot.logger.error(f"Failed to show ranking: {e}")
 
     @commands.command()
+    @metrics.timed("rank", "command")
+    async def rank(self, ctx: commands.Context, user: User = None, ranking_id: int = None):
+        """
+        ```
+        Show the position of a user in the ranking(s) in the current channel
+
+        Arguments:
+        - user: The user to show the position of (optional, yourself by default)
+        - ranking_id: The ID of the ranking (optional)
+        ```
+        """
+        user = user or ctx.author
+        try:
+            rankings = [ranking async for ranking in target_rankings(ctx.channel.id, ranking_id)]
+            if not rankings:
+                await ctx.send(f"Ranking with ID {ranking_id} not found" if ranking_id is not None else "No rankings found in this channel")
+                return
+
+            standings = await db(lambda: [ranks.standing(ranking, user.id) for ranking in rankings])()
+            neighbours = [
+                other.user
+                for standing in standings if standing is not None
+                for other in (standing.above, standing.below) if other is not None
+            ]
+            users = await self.member_names(ctx.guild, [ranking.id for ranking in rankings], neighbours)
+            await ctx.send(format_rank(user.display_name, rankings, standings, users))
+
+        except Exception as e:
+            await ctx.send(f"Failed to show rank")
+            self.bot.logger.error(f"Failed to show rank: {e}")
+
+    @commands.command()
+    @metrics.timed("add", "command")
     async def add(self, ctx: commands.Context, string: str = None, value: float = None, ranking_id: int = None):
         """
         ```
@@ -347,45 +509,34 @@ class Ranking(commands.Cog):
         - ranking_id: The ID of the ranking to add the mapping to (optional)
         ```
         """
-        await sta(close_old_connections)()
         if not string or not value:
             await ctx.send("Please provide a string and value")
             return
         
         
         try:
-            ranking_ids = [ranking_id]
-            if ranking_id is None:
-                ranking_ids = []
-                ranking_channels = await sta(models.RankingChannel.objects.filter)(
-                    channel_id = ctx.channel.id
-                )
-                async for ranking_channel in ranking_channels:
-                    ranking_ids.append(ranking_channel.ranking_id)
+            rankings = [ranking async for ranking in target_rankings(ctx.channel.id, ranking_id)]
+            if ranking_id is not None and not rankings:
+                await ctx.send(f"Failed to get ranking (#{ranking_id})")
+                return
 
-            for ranking_id in ranking_ids:
-                ranking : models.Ranking = await models.Ranking.objects.aget(id = ranking_id)
-                if not isinstance(ranking, models.Ranking):
-                    await ctx.send(f"Failed to get ranking (#{ranking_id})")
-                    return
-                
-                mapping : models.Mapping = await models.Mapping.objects.acreate(
-                    ranking = ranking,
-                    string = string,
-                    value = value
-                )
-                await mapping.asave()
-                if not isinstance(mapping, models.Mapping):
-                    await ctx.send(f"Failed to add mapping")
-                
-                else:
-                    await ctx.send(f"Added mapping {mapping.string} ({mapping.value}) to ranking {mapping.ranking.name} (#{mapping.ranking.id})")
+            mappings = await models.Mapping.objects.abulk_create(
+                models.Mapping(ranking = ranking, string = string, value = value)
+                for ranking in rankings
+            )
+            for ranking in rankings:
+                self.channels.invalidate_ranking(ranking.id)
+            await db(mark_reconfigured)([ranking.id for ranking in rankings])
+
+            for mapping in mappings:
+                await ctx.send(f"Added mapping {mapping.string} ({mapping.value}) to ranking {mapping.ranking.name} (#{mapping.ranking.id})")
         
         except Exception as e:
             await ctx.send(f"Failed to add mapping")
             self.bot.logger.error(f"Failed to add mapping: {e}")
     
     @commands.command()
+    @metrics.timed("list", "command")
     async def list(self, ctx: commands.Context, ranking_id: str = None):
         """
         ```
@@ -396,35 +547,20 @@ class Ranking(commands.Cog):
         ```
         """
         try:
-            s = ""
-            if ranking_id is None:
-                ranking_channels = await sta(models.RankingChannel.objects.filter)(
-                    channel_id = ctx.channel.id
-                )
-                async for ranking_channel in ranking_channels:
-                    ranking_mappings = await sta(models.Mapping.objects.filter)(
-                        ranking_id = ranking_channel.ranking_id
-                    )
-                    if not await ranking_mappings.acount():
-                        continue
-                    
-                    ranking = await models.Ranking.objects.aget(id = ranking_channel.ranking_id)
-                    s += f"## Modifiers for ranking {ranking.name} (#{ranking_channel.ranking_id})\n"
-                    s += "".join([f"- {mapping.string}: {mapping.value}\n" async for mapping in ranking_mappings])
-
-            else:
-                ranking_mappings = await sta(models.Mapping.objects.filter)(ranking_id = ranking_id)
-                if not await ranking_mappings.acount():
-                    await ctx.send(f"No modifiers found for ranking (#{ranking_id})")
-                    return
-                ranking = await models.Ranking.objects.aget(id = ranking_id)
-                s += f"## Modifiers for ranking {ranking.name} (#{ranking_id})\n"
-                s += "".join([f"- {mapping.string}: {mapping.value}\n" async for mapping in ranking_mappings])
-            
-            
-            self.bot.logger.info("Heyo")
-
-            if s == "":
+            parts = []
+            rankings = target_rankings(ctx.channel.id, int(ranking_id) if ranking_id is not None else None)
+            async for ranking in rankings.prefetch_related("mapping_set"):
+                mappings = ranking.mapping_set.all()
+                if not mappings:
+                    continue
+
+                parts.append(f"## Modifiers for ranking {ranking.name} (#{ranking.id})\n")
+                parts.extend(f"- {mapping.string}: {mapping.value}\n" for mapping in mappings)
+
+            s = "".join(parts)
+            if s == "" and ranking_id is not None:
+                await ctx.send(f"No modifiers found for ranking (#{ranking_id})")
+            elif s == "":
                 await ctx.send("No modifiers found for channel rankings")
             else:
                 await ctx.send(s)
@@ -434,6 +570,7 @@ class Ranking(commands.Cog):
             self.bot.logger.error(f"Failed to list modifiers: {e}")
     
     @commands.command()
+    @metrics.timed("count", "command")
     async def count(self, ctx: commands.Context, from_str: str = None, start_time_: str = None, name: str = None, ranking_id: str = None):
         """
         ```
@@ -457,40 +594,37 @@ class Ranking(commands.Cog):
         start_time = parse_time(start_time_)
         
         try:
-            ranking_ids = [ranking_id]
-            if ranking_id is None:
-                ranking_ids = []
-                ranking_channels = await sta(models.RankingChannel.objects.filter)(
-                    channel_id = ctx.channel.id
-                )
-                async for ranking_channel in ranking_channels:
-                    ranking_ids.append(ranking_channel.ranking_id)
+            rankings = [
+                ranking async for ranking in target_rankings(ctx.channel.id, int(ranking_id) if ranking_id is not None else None)
+            ]
+            if ranking_id is not None and not rankings:
+                await ctx.send(f"Failed to get ranking (#{ranking_id})")
+                return
 
-            for ranking_id in ranking_ids:
-                # limit the time of the current subranking(s)
-                current_subrankings = await sta(models.Subranking.objects.filter)(
-                    ranking_id = ranking_id,
+            ranking_ids = [ranking.id for ranking in rankings]
+            # the current subranking(s) end where the new subranking starts
+            closed = [
+                subranking_id async for subranking_id in models.Subranking.objects.filter(
+                    ranking_id__in = ranking_ids,
                     active_from__lte = start_time,
                     active_until__isnull = True
-                )
-                async for subranking in current_subrankings:
-                    # set the active_until time of the current subranking to the start_time of the new subranking
-                    subranking.active_until = start_time
-                    await subranking.asave()
-            
-                ranking : models.Ranking = await models.Ranking.objects.aget(id = ranking_id)
-                if not isinstance(ranking, models.Ranking):
-                    await ctx.send(f"Failed to get ranking (#{ranking_id})")
-                    return
-                
-                subranking : models.Subranking = await models.Subranking.objects.acreate(
-                    ranking = ranking,
-                    name = name,
-                    active_from = start_time,
-                    active_until = None
-                )
-                await subranking.asave()
-            
+                ).values_list("id", flat = True)
+            ]
+            await models.Subranking.objects.filter(id__in = closed).aupdate(active_until = start_time, updated_at = timezone.now())
+
+            created = await models.Subranking.objects.abulk_create(
+                models.Subranking(ranking = ranking, name = name, active_from = start_time, active_until = None)
+                for ranking in rankings
+            )
+            for ranking in rankings:
+                resolver.invalidate(ranking.id)
+            # entries may already exist in the new windows, recount the scores of the windows that changed from the rollups
+            await db(rebuild_windows)(ranking_ids, closed + [subranking.id for subranking in created])
+            for ranking in rankings:
+                self.channels.invalidate_ranking(ranking.id)
+            await db(mark_reconfigured)(ranking_ids)
+
+            for ranking in rankings:
                 await ctx.send(f"{ranking.name} (#{ranking.id}) will count from <t:{int(start_time.timestamp())}:f>")
 
         except Exception as e:
@@ -498,11 +632,11 @@ class Ranking(commands.Cog):
             self.bot.logger.error(f"Failed to create subranking: {e}")
 
     @commands.Cog.listener("on_message")
+    @metrics.timed("ranking_listener", "listener")
     async def ranking_listener(self, message: Message):
         """
         https://discordpy.readthedocs.io/en/stable/api.html#event-reference for a list of events
         """
-        await sta(close_old_connections)()
         if message.author.bot and message.author.id == self.bot.user.id:
             return
         
@@ -513,37 +647,27 @@ class Ranking(commands.Cog):
             return
         
         try:
-            ranking_channels = await sta(models.RankingChannel.objects.filter)(
-                channel_id = message.channel.id
-            )
-            async for ranking_channel in ranking_channels:
-                matches = False
-                ranking = await models.Ranking.objects.aget(id = ranking_channel.ranking_id)
-                if ranking.active:
-                    mappings = await sta(models.Mapping.objects.filter)(
-                        ranking_id = ranking.id
-                    )
-                    mapping_dict = {}
-                    async for mapping in mappings:
-                        mapping_dict[mapping.string] = mapping.value
+            rankings = await self.channels.get(message.channel.id)
+            if not rankings:
+                return
 
-                    s = parse_message(message.content, ranking.token, mapping_dict)
-                    
-                    if s is not None:
-                        matches = True
-                        entry : models.Entry = await models.Entry.objects.acreate(
-                            ranking = ranking,
-                            number = s,
-                            user = message.author.id,
-                            message_id = message.id
-                        )
-                        await entry.asave()
-                        if not isinstance(entry, models.Entry):
-                            await message.add_reaction("❌")
-                            self.bot.logger.error(f"Failed to create entry for {message.author.name} in {ranking.name}")
-                
-                if matches:
-                    await message.add_reaction("✅")
+            scores = get_parser_set(tuple(ranking.parser for ranking in rankings)).parse(message.content)
+            await self.remember_author(message, [ranking.id for ranking, s in zip(rankings, scores) if s is not None])
+            entries = [
+                (ranking.id, message.author.id, message.id, s)
+                for ranking, s in zip(rankings, scores)
+                if s is not None
+            ]
+            if self.writer is not None:
+                if entries:
+                    # the writer reacts once the entries are committed
+                    await self.writer.put(PendingMessage(message, entries))
+                return
+
+            if entries:
+                # one insert for every ranking the message scores in
+                await db(create_entries)(entries)
+                self.reactions.add(message, "✅")
         
         except Exception as e:
             self.bot.logger.error(f"Failed to parse message: {e}")
@@ -551,50 +675,115 @@ class Ranking(commands.Cog):
             self.bot.logger.error(f"{traceback.format_exc()}")
             return
 
-    @commands.Cog.listener("on_message_edit")
-    async def ranking_edit_listener(self, before: Message, message: Message):
+    async def remember_author(self, message: Message, ranking_ids: Sequence[int]):
+        """
+        Store the name of an author that scores, only when it isn't stored yet or changed
+        """
+        author = message.author
+        if not ranking_ids or message.guild is None:
+            return
+
+        if not self.names.known(message.guild.id, author.id, author.display_name, author.bot, ranking_ids):
+            await db(self.names.remember)(message.guild.id, [(author.id, author.display_name, author.bot)], ranking_ids)
+
+    async def member_names(self, guild: Guild | None, ranking_ids: Sequence[int], users: Sequence[int]) -> dict[int, tuple[str, bool]]:
+        """
+        Resolve the (name, bot) of scoring users from the name cache, then from the members discord has cached,
+        then by asking discord for the members that are still unknown
+        """
+        if guild is None or not users:
+            return {}
+
+        found = await db(self.names.resolve)(guild.id, ranking_ids, users)
+        missing = [user for user in users if user not in found and not self.names.is_absent(guild.id, user)]
+        if not missing:
+            return found
+
+        members = {}
+        for user in missing:
+            member = guild.get_member(user)
+            if member is not None:
+                members[user] = member
+
+        unknown = [user for user in missing if user not in members]
+        if unknown and settings.BOT_FETCH_MEMBERS:
+            # the gateway answers at most 100 members per request
+            for start in range(0, len(unknown), 100):
+                chunk = unknown[start:start + 100]
+                try:
+                    for member in await guild.query_members(user_ids = chunk, limit = len(chunk), cache = False):
+                        members[member.id] = member
+                except Exception as e:
+                    self.bot.logger.error(f"Failed to fetch members of guild {guild.id}: {e}")
+                    break
+
+        self.names.mark_absent(guild.id, [user for user in missing if user not in members])
+        if members:
+            resolved = [(member.id, member.display_name, member.bot) for member in members.values()]
+            await db(self.names.remember)(guild.id, resolved, ranking_ids)
+            found.update({user: (name, bot) for user, name, bot in resolved})
+
+        return found
+
+    @commands.Cog.listener()
+    @metrics.timed("on_member_update", "listener")
+    async def on_member_update(self, before: Member, after: Member):
         """
+        Keep the stored names of scoring users up to date
+        """
+        if before.display_name == after.display_name and before.bot == after.bot:
+            return
+
+        try:
+            await db(self.names.rename)(after.guild.id, after.id, after.display_name, after.bot)
+        
+        except Exception as e:
+            self.bot.logger.error(f"Failed to rename user {after.id}: {e}")
+
+    @commands.Cog.listener("on_raw_message_edit")
+    @metrics.timed("ranking_edit_listener", "listener")
+    async def ranking_edit_listener(self, payload: RawMessageUpdateEvent):
+        """
+        Rescore the entries of an edited message. The raw event fires for every edit,
+        also for messages that are no longer (or never were) in the message cache.
         https://discordpy.readthedocs.io/en/stable/api.html#event-reference for a list of events
         """
-        await sta(close_old_connections)()
-        if message.author.bot and message.author.id == self.bot.user.id:
+        content = payload.data.get("content")
+        if content is None:
+            # embed or pin updates don't change the content
             return
 
-        if "http" in message.content:
+        author = payload.data.get("author") or {}
+        if author.get("bot") and int(author.get("id", 0)) == self.bot.user.id:
+            return
+
+        if "http" in content:
             return
         
-        if is_command(message, self.bot):
+        if is_command(payload.cached_message, self.bot, content):
             return
         
         try:
-            message_entries = await sta(models.Entry.objects.filter)(
-                message_id = before.id
-            )
-            if await message_entries.acount() == 0:
+            rankings = await self.channels.get(payload.channel_id)
+            if not rankings:
                 return
 
-            async for entry in message_entries:
-                ranking = await models.Ranking.objects.aget(id = entry.ranking_id)
-                if ranking.active:
-                    s = parse_message(message.content, ranking.token)
-                    
-                    if s is not None:
-                        entry.number = s
-                        entry.message_id = message.id
-                        await entry.asave()
-            
-            asyncio.create_task(self.update_reactions(message))
+            scores = get_parser_set(tuple(ranking.parser for ranking in rankings)).parse(content)
+            numbers = {ranking.id: s for ranking, s in zip(rankings, scores) if s is not None}
+            if not numbers:
+                return
+
+            if await db(rescore_entries)(payload.message_id, numbers) == 0:
+                return
+
+            message = self.bot.get_partial_messageable(payload.channel_id).get_partial_message(payload.message_id)
+            self.reactions.flash(message, "🔁", settings.BOT_EDIT_REACTION_SECONDS)
         
         except Exception as e:
             self.bot.logger.error(f"Failed to parse message: {e}")
             # await message.add_reaction("❓")
             self.bot.logger.error(f"{traceback.format_exc()}")
             return
-    
-    async def update_reactions(self, message: Message):
-        await message.add_reaction("🔁")
-        await asyncio.sleep(20)
-        await message.remove_reaction("🔁", self.bot.user)
 
 async def setup(bot: Bot):
     await bot.add_cog(Ranking(bot))
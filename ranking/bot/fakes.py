@@ -0,0 +1,160 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+
+@dataclass
+class FakeUser:
+    id: int
+    name: str = "user"
+    bot: bool = False
+    guild: "FakeGuild | None" = None
+    """the guild of a member"""
+
+    @property
+    def display_name(self) -> str:
+        return self.name
+
+    @property
+    def mention(self) -> str:
+        return f"<@{self.id}>"
+
+
+@dataclass
+class FakeGuild:
+    id: int
+    members: list[FakeUser] = field(default_factory = list)
+    _index: dict[int, FakeUser] = field(default_factory = dict, repr = False)
+
+    def get_member(self, user_id: int) -> FakeUser | None:
+        # a dict lookup like the member cache of discord.py
+        if len(self._index) != len(self.members):
+            self._index = {member.id: member for member in self.members}
+        return self._index.get(user_id)
+
+    async def query_members(self, user_ids: list[int] = None, limit: int = 5, cache: bool = True, **kwargs) -> list[FakeUser]:
+        return [member for member in map(self.get_member, user_ids[:limit]) if member is not None]
+
+
+@dataclass
+class FakeChannel:
+    id: int
+    guild: FakeGuild | None = None
+    members: list[FakeUser] = field(default_factory = list)
+    sent: list[str] = field(default_factory = list)
+    messages: list["FakeMessage"] = field(default_factory = list)
+    history_requests: int = 0
+
+    async def history(self, limit: int = 100, after = None, oldest_first: bool = True, **kwargs):
+        """
+        The messages after `after`, oldest first like discord.py when `after` is given
+        """
+        self.history_requests += 1
+        messages = sorted(
+            (message for message in self.messages if after is None or message.id > after.id),
+            key = lambda message: message.id
+        )
+        for message in messages[:limit]:
+            yield message
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        self.sent.append(content)
+
+    def get_partial_message(self, message_id: int) -> "FakeMessage":
+        return FakeMessage(id = message_id, content = "", author = None, channel = self)
+
+
+@dataclass
+class FakeMessage:
+    """
+    Enough of a discord Message for the ranking cog
+    """
+    id: int
+    content: str
+    author: FakeUser
+    channel: FakeChannel
+    reactions: list[str] = field(default_factory = list)
+    created_at: datetime = field(default_factory = lambda: datetime.now(timezone.utc))
+
+    @property
+    def guild(self) -> FakeGuild | None:
+        return self.channel.guild
+
+    async def add_reaction(self, emoji: str) -> None:
+        self.reactions.append(emoji)
+
+    async def remove_reaction(self, emoji: str, member: FakeUser) -> None:
+        if emoji in self.reactions:
+            self.reactions.remove(emoji)
+
+
+@dataclass
+class FakeRawMessageUpdate:
+    """
+    Enough of a RawMessageUpdateEvent for the edit listener
+    """
+    message_id: int
+    channel_id: int
+    guild_id: int | None = None
+    data: dict = field(default_factory = dict)
+    cached_message: FakeMessage | None = None
+
+    @classmethod
+    def edit(cls, message: FakeMessage) -> "FakeRawMessageUpdate":
+        """
+        The event discord sends when `message` was edited to its current content
+        """
+        return cls(
+            message_id = message.id,
+            channel_id = message.channel.id,
+            guild_id = message.guild.id if message.guild else None,
+            data = {
+                "id": str(message.id),
+                "channel_id": str(message.channel.id),
+                "content": message.content,
+                "author": {"id": str(message.author.id), "bot": message.author.bot},
+            },
+        )
+
+
+@dataclass
+class FakeContext:
+    """
+    Enough of a commands.Context for the ranking cog
+    """
+    channel: FakeChannel
+    author: FakeUser
+    bot: "FakeBot | None" = None
+    message: "FakeMessage | None" = None
+
+    @property
+    def guild(self) -> FakeGuild | None:
+        return self.channel.guild
+
+    @property
+    def sent(self) -> list[str]:
+        return self.channel.sent
+
+    async def send(self, content: str = None, **kwargs) -> None:
+        await self.channel.send(content, **kwargs)
+
+
+@dataclass
+class FakeBot:
+    """
+    Enough of the Bot for the ranking cog to run without a gateway connection
+    """
+    user: FakeUser = field(default_factory = lambda: FakeUser(id = 1, name = "bot", bot = True))
+    command_prefix: str = "°"
+    logger: logging.Logger = field(default_factory = lambda: logging.getLogger("bot"))
+
+    channels: dict[int, FakeChannel] = field(default_factory = dict)
+
+    def get_command(self, name: str) -> None:
+        return None
+
+    def get_channel(self, channel_id: int) -> FakeChannel | None:
+        return self.channels.get(channel_id)
+
+    def get_partial_messageable(self, channel_id: int, **kwargs) -> FakeChannel:
+        return self.channels.get(channel_id) or FakeChannel(id = channel_id)
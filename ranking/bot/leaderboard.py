@@ -0,0 +1,183 @@
+from collections import deque
+from typing import Awaitable, Callable, Iterable, Iterator, Sequence
+
+import discord
+
+from website import models
+
+MESSAGE_LIMIT = 2000
+"""characters discord accepts in a message"""
+
+
+def leaderboard_header(rankings: Sequence[models.Ranking], subrankings: dict[int, models.Subranking | None]) -> str:
+    if len(rankings) == 1:
+        ranking = rankings[0]
+        subranking = subrankings[ranking.id]
+        return f"## {ranking.name} {subranking.name if subranking else ''} (#{ranking.id})\n"
+    return "## Rankings\n"
+
+def leaderboard_lines(
+    rankings: Sequence[models.Ranking],
+    rows: Iterable[tuple],
+    users: dict[int, tuple[str, bool]]
+) -> Iterator[str]:
+    """
+    The line of every row of `ranking_rows` that is shown, `users` maps user ids to their (name, bot)
+    """
+    def user(user_id: int) -> tuple[str, bool]:
+        return users.get(user_id) or (f"User {user_id}", False)
+
+    if len(rankings) == 1:
+        for user_id, user_score in rows:
+            score = round(user_score, 2)
+            name, bot = user(user_id)
+            if score != 0 or not bot:
+                yield f"1. {name}: {score}\n"
+        return
+
+    for user_id, user_score, ranking_scores in rows:
+        name, bot = user(user_id)
+        if user_score != 0 or not bot:
+            scores = "".join(
+                f" {ranking.token if ranking.token is not None else ('+' if score >= 0 else '')}{round(score, 1)}"
+                for ranking, score in zip(rankings, ranking_scores)
+            )
+            yield f"1. {name}: {scores} = {round(user_score, 1)}\n"
+
+
+class Leaderboard:
+    """
+    The pages of a leaderboard, rendered when they are first asked for. A page holds at most `page_rows` lines
+    and `limit` characters with the header. Rows are fetched `page_rows` at a time and named per fetch,
+    so showing the first page of a large ranking doesn't read or name the rest.
+    """
+    def __init__(
+        self,
+        header: str,
+        fetch: Callable[[int, int], Awaitable[list[tuple]]],
+        render: Callable[[list[tuple]], Awaitable[Iterable[str]]],
+        page_rows: int = 25,
+        limit: int = MESSAGE_LIMIT
+    ) -> None:
+        """
+        `fetch(offset, limit)` returns the next rows, `render(rows)` their lines
+        """
+        self.header = header
+        self.fetch = fetch
+        self.render = render
+        self.page_rows = page_rows
+        self.limit = limit
+        self.pages: list[str] = []
+        self._lines: deque[str] = deque()
+        self._offset = 0
+        self._exhausted = False
+
+    @property
+    def complete(self) -> bool:
+        """
+        Whether every page is rendered
+        """
+        return self._exhausted and not self._lines
+
+    async def page(self, index: int) -> str | None:
+        """
+        The page at a 0 based index, None past the last page. The first page of an empty leaderboard is the header.
+        """
+        while index >= len(self.pages) and not self.complete:
+            page = await self._next_page()
+            if page is None:
+                break
+            self.pages.append(page)
+
+        if index < len(self.pages):
+            return self.pages[index]
+        if index == 0:
+            return self.header
+        return None
+
+    async def has_page(self, index: int) -> bool:
+        if index < len(self.pages):
+            return True
+        if index > len(self.pages):
+            return await self.page(index) is not None
+
+        # the next page exists when a line is left for it
+        await self._fill()
+        return bool(self._lines)
+
+    async def _fill(self) -> None:
+        """
+        Fetch rows until a line is waiting or every row was read
+        """
+        while not self._lines and not self._exhausted:
+            rows = await self.fetch(self._offset, self.page_rows)
+            self._offset += len(rows)
+            self._exhausted = len(rows) < self.page_rows
+            self._lines.extend(await self.render(rows))
+
+    async def _next_page(self) -> str | None:
+        parts = [self.header]
+        size = len(self.header)
+        lines = 0
+        while lines < self.page_rows:
+            await self._fill()
+            if not self._lines:
+                break
+
+            line = self._lines[0]
+            if size + len(line) > self.limit:
+                if lines:
+                    break
+                # a single line longer than a page is cut
+                line = line[:self.limit - size - 2] + "…\n"
+            self._lines.popleft()
+            parts.append(line)
+            size += len(line)
+            lines += 1
+
+        return "".join(parts) if lines else None
+
+
+class LeaderboardView(discord.ui.View):
+    """
+    Previous and next buttons under a leaderboard message, a page is rendered the first time it is shown
+    """
+    def __init__(self, leaderboard: Leaderboard, timeout: float = 180) -> None:
+        super().__init__(timeout = timeout)
+        self.leaderboard = leaderboard
+        self.index = 0
+        self.message: discord.Message | None = None
+
+    async def update_buttons(self) -> None:
+        self.previous.disabled = self.index == 0
+        self.next.disabled = not await self.leaderboard.has_page(self.index + 1)
+        self.position.label = f"{self.index + 1}" if not self.leaderboard.complete else f"{self.index + 1}/{len(self.leaderboard.pages)}"
+
+    async def flip(self, step: int) -> str:
+        """
+        Move `step` pages, returns the page shown
+        """
+        page = await self.leaderboard.page(self.index + step)
+        if page is not None:
+            self.index += step
+        await self.update_buttons()
+        return await self.leaderboard.page(self.index)
+
+    @discord.ui.button(label = "◀", style = discord.ButtonStyle.secondary, disabled = True)
+    async def previous(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(content = await self.flip(-1), view = self)
+
+    @discord.ui.button(label = "1", style = discord.ButtonStyle.secondary, disabled = True)
+    async def position(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pass
+
+    @discord.ui.button(label = "▶", style = discord.ButtonStyle.secondary)
+    async def next(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(content = await self.flip(1), view = self)
+
+    async def on_timeout(self) -> None:
+        if self.message is not None:
+            try:
+                await self.message.edit(view = None)
+            except discord.HTTPException:
+                pass
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from os import getenv
+
+import discord
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.backfill import Backfill
+from bot.db import db
+from website import models
+
+def linked_channels(ranking_ids: list[int] | None) -> list[int]:
+    """
+    The channels of the given rankings (all active rankings if None)
+    """
+    ranking_channels = models.RankingChannel.objects.filter(ranking__active = True)
+    if ranking_ids:
+        ranking_channels = ranking_channels.filter(ranking_id__in = ranking_ids)
+    return list(ranking_channels.values_list("channel_id", flat = True).distinct().order_by("channel_id"))
+
+class Command(BaseCommand):
+    help = 'Score the messages linked channels got while the bot was offline, continuing where the last backfill stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('channel_ids', nargs = '*', type = int, help = 'Channels to backfill (default: every linked channel)')
+        parser.add_argument('--ranking', dest = 'ranking_ids', type = int, action = 'append', help = 'Only the channels of this ranking, can be repeated')
+        parser.add_argument('--concurrency', type = int, default = settings.BOT_BACKFILL_CONCURRENCY, help = 'Channels read at the same time')
+        parser.add_argument('--page-size', type = int, default = settings.BOT_BACKFILL_PAGE_SIZE, help = 'Messages per history request, at most 100')
+        parser.add_argument('--page-delay', type = float, default = settings.BOT_BACKFILL_PAGE_DELAY, help = 'Seconds between the history requests of a channel')
+
+    def handle(self, *args, channel_ids = None, ranking_ids = None, **options):
+        token = getenv("DISCORD_TOKEN")
+        if not token:
+            raise CommandError("DISCORD_TOKEN not set")
+
+        failed = asyncio.run(self.backfill(token, channel_ids, ranking_ids, **options))
+        if failed:
+            raise CommandError(f"{failed} channels are incomplete, run the command again to continue")
+
+        self.stdout.write(self.style.SUCCESS("Backfill complete"))
+
+    async def backfill(self, token: str, channel_ids: list[int], ranking_ids: list[int] | None, concurrency: int, page_size: int, page_delay: float, **options) -> int:
+        channel_ids = channel_ids or await db(linked_channels)(ranking_ids)
+
+        # the history is read over http, no gateway connection needed
+        client = discord.Client(intents = discord.Intents.none())
+        async with client:
+            await client.login(token)
+
+            channels = []
+            for channel_id in channel_ids:
+                try:
+                    channels.append(await client.fetch_channel(channel_id))
+                except discord.HTTPException as e:
+                    self.stderr.write(f"channel {channel_id}: {e}")
+
+            backfill = Backfill(
+                logging.getLogger("bot"),
+                client.user.id,
+                concurrency = concurrency,
+                page_size = min(page_size, 100),
+                page_delay = page_delay
+            )
+            results = await backfill.run(channels)
+
+        for result in results:
+            self.stdout.write(
+                f"channel {result.channel_id}: {result.messages} messages, {result.entries} new entries"
+                f"{'' if result.complete else f', incomplete: {result.error}'}"
+            )
+
+        return len(channel_ids) - sum(result.complete for result in results)
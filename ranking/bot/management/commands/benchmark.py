@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from bot.benchmark import bench_database, bench_parser
+
+def current_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output = True, text = True, check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class Command(BaseCommand):
+    help = 'Benchmark the bot hot paths against seeded test databases and print the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices = ['parser', 'database'], help = 'Only run one group of benchmarks')
+        parser.add_argument('--messages', type = int, default = 20000, help = 'Number of sample messages to parse')
+        parser.add_argument('--entries', default = '1000,10000,100000', help = 'Comma separated entry counts to seed')
+        parser.add_argument('--iterations', type = int, default = 200, help = 'Calls per handler and entry count')
+        parser.add_argument('--channels', type = int, default = 10)
+        parser.add_argument('--rankings', type = int, default = 20)
+        parser.add_argument('--mappings', type = int, default = 3)
+        parser.add_argument('--members', type = int, default = 1000)
+        parser.add_argument('--seed', type = int, default = 0)
+        parser.add_argument('--output', help = 'Write the results to this file instead of stdout')
+
+    def handle(self, *args, only = None, output = None, **options):
+        results = {
+            "meta": {
+                "commit": current_commit(),
+                "database": connection.vendor,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "options": {key: options[key] for key in ('messages', 'entries', 'iterations', 'channels', 'rankings', 'mappings', 'members', 'seed')},
+            },
+        }
+
+        if only in (None, 'parser'):
+            results["parser"] = bench_parser(options['messages'], options['seed'])
+
+        if only in (None, 'database'):
+            results["database"] = bench_database(
+                [int(size) for size in options['entries'].split(',')],
+                iterations = options['iterations'],
+                channels = options['channels'],
+                rankings = options['rankings'],
+                mappings = options['mappings'],
+                members = options['members'],
+                seed = options['seed'],
+            )
+
+        s = json.dumps(results, indent = 2)
+        if output:
+            with open(output, "w") as f:
+                f.write(s + "\n")
+        else:
+            self.stdout.write(s)
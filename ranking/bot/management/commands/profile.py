@@ -0,0 +1,40 @@
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bot.profiler import MODES
+
+class Command(BaseCommand):
+    help = 'Profile the running bot through its metrics endpoint and print the busiest functions or the allocation sites that grew'
+
+    def add_arguments(self, parser):
+        parser.add_argument('handlers', nargs = '*', help = 'Only count these commands and listeners, e.g. show ranking_listener')
+        parser.add_argument('--mode', choices = MODES, default = 'cpu', help = 'cpu samples the stacks, memory compares tracemalloc snapshots')
+        parser.add_argument('--seconds', type = float, default = 10.0, help = 'How long to profile')
+        parser.add_argument('--host', default = settings.BOT_METRICS_HOST, help = 'Host the bot serves its metrics on')
+        parser.add_argument('--port', type = int, default = settings.BOT_METRICS_PORT, help = 'Metrics port of the bot process to profile')
+        parser.add_argument('--output', help = 'Write the profile to this file instead of stdout')
+
+    def handle(self, *args, handlers = None, mode = 'cpu', seconds = 10.0, host = None, port = None, output = None, **options):
+        if not port:
+            raise CommandError("Set BOT_METRICS_PORT or pass --port, the bot only serves profiles next to its metrics")
+
+        query = urlencode({"mode": mode, "seconds": seconds, "handlers": ",".join(handlers or [])})
+        url = f"http://{host}:{port}/profile?{query}"
+        try:
+            # the bot answers once the profile is taken
+            with urlopen(url, timeout = seconds + 30) as response:
+                summary = response.read().decode()
+        except HTTPError as e:
+            raise CommandError(f"The bot refused to profile: {e.read().decode().strip()}")
+        except URLError as e:
+            raise CommandError(f"Failed to reach the bot on {host}:{port}: {e.reason}")
+
+        if output:
+            with open(output, "w") as f:
+                f.write(summary)
+        else:
+            self.stdout.write(summary, ending = "")
@@ -0,0 +1,43 @@
+import logging
+
+from aiohttp import web
+
+from bot.profiler import Profiler
+from website.metrics import CONTENT_TYPE, Metrics
+
+
+async def serve_metrics(
+    registry: Metrics,
+    logger: logging.Logger,
+    host: str,
+    port: int,
+    profiler: Profiler | None = None
+) -> web.AppRunner:
+    """
+    Serve the metrics of the bot process in the Prometheus text format on http://host:port/metrics.
+    With a profiler, http://host:port/profile?mode=cpu&seconds=10&handlers=show,rank profiles the process.
+    """
+    async def scrape(request: web.Request) -> web.Response:
+        return web.Response(body = registry.render().encode(), headers = {"Content-Type": CONTENT_TYPE})
+
+    async def profile(request: web.Request) -> web.Response:
+        handlers = [name for name in request.query.get("handlers", "").split(",") if name]
+        try:
+            summary = await profiler.run(request.query.get("mode", "cpu"), float(request.query.get("seconds", 10)), handlers)
+        except ValueError as e:
+            return web.Response(status = 400, text = f"{e}\n")
+        except RuntimeError as e:
+            return web.Response(status = 409, text = f"{e}\n")
+
+        logger.info(f"served a {request.query.get('mode', 'cpu')} profile")
+        return web.Response(text = summary)
+
+    app = web.Application()
+    app.router.add_get("/metrics", scrape)
+    if profiler is not None:
+        app.router.add_get("/profile", profile)
+    runner = web.AppRunner(app, access_log = None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"serving metrics on http://{host}:{port}/metrics")
+    return runner
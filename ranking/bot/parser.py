@@ -0,0 +1,113 @@
+from functools import lru_cache
+import re
+
+NUMBER = r"(\d+(?:(?:\.|,)\d+)?(?:[eE][+-]?\d+)?)"
+SIGNED_NUMBER = r"([+-] ?\d+(?:(?:\.|,)\d+)?(?:[eE][+-]?\d+)?)"
+
+
+def to_float(number: str) -> float:
+    """
+    Convert a string to a float
+    """
+    try:
+        return float(number.replace(",", "."))
+    except ValueError:
+        return 0.0
+    except TypeError:
+        return 0.0
+
+
+class MessageParser:
+    """
+    Scores messages for one token and set of mappings.
+    The pattern is compiled once and messages without the token (or without a sign for
+    the default +/- token) are rejected before the regex runs.
+    """
+    def __init__(self, token: str | None = None, mappings: dict[str, float] = {}) -> None:
+        self.token = token
+        self.mappings = dict(mappings)
+
+        regex_string = f"(?:{re.escape(token)}) ?{NUMBER}" if token is not None else SIGNED_NUMBER
+        if self.mappings:
+            regex_string += f" ?((?:{')|(?:'.join([re.escape(k) for k in self.mappings.keys()])}))?"
+
+        self.pattern = re.compile(regex_string)
+        self.needles = (token,) if token is not None else ("+", "-")
+
+    def __repr__(self) -> str:
+        return f"MessageParser({self.token!r}, {self.mappings!r})"
+
+    def could_match(self, message: str) -> bool:
+        """
+        Cheap check whether the message can contain a score at all
+        """
+        for needle in self.needles:
+            if needle in message:
+                return True
+        return False
+
+    def parse(self, message: str) -> float | None:
+        """
+        Sum the scores in a message, None if there are none
+        """
+        if not self.could_match(message):
+            return None
+
+        s = 0.0
+        matches = False
+        for match in self.pattern.finditer(message):
+            matches = True
+            multiplier = self.mappings.get(match.group(2), 1) if self.mappings else 1.0
+            s += to_float(match.group(1)) * multiplier
+
+        return s if matches else None
+
+
+class ParserSet:
+    """
+    Scores a message for several rankings at once.
+    Rankings sharing a token and mappings are parsed once, and a message containing none
+    of the tokens is rejected with a single pass over the needles.
+    """
+    def __init__(self, parsers: tuple[MessageParser, ...]) -> None:
+        self.parsers = parsers
+        self.unique = tuple(dict.fromkeys(parsers))
+        self.needles = tuple(dict.fromkeys(needle for parser in self.unique for needle in parser.needles))
+
+    def parse(self, message: str) -> list[float | None]:
+        """
+        Score the message for every parser, in order
+        """
+        for needle in self.needles:
+            if needle in message:
+                break
+        else:
+            return [None] * len(self.parsers)
+
+        if len(self.unique) == len(self.parsers):
+            return [parser.parse(message) for parser in self.parsers]
+
+        scores = {parser: parser.parse(message) for parser in self.unique}
+        return [scores[parser] for parser in self.parsers]
+
+
+@lru_cache(maxsize = 4096)
+def _get_parser(token: str | None, mappings: tuple[tuple[str, float], ...]) -> MessageParser:
+    return MessageParser(token, dict(mappings))
+
+def get_parser(token: str | None = None, mappings: dict[str, float] = {}) -> MessageParser:
+    """
+    Get the shared parser for a token and mappings.
+    The order of the mappings matters, it decides which of two overlapping mappings wins.
+    """
+    return _get_parser(token, tuple(mappings.items()))
+
+@lru_cache(maxsize = 4096)
+def get_parser_set(parsers: tuple[MessageParser, ...]) -> ParserSet:
+    """
+    Get the shared parser set for a tuple of parsers
+    """
+    return ParserSet(parsers)
+
+def parse_message(message: str, token: str = None, mappings: dict[str, float] = {}) -> float | None:
+    return get_parser(token, mappings).parse(message)
@@ -0,0 +1,186 @@
+import asyncio
+from collections import Counter
+import inspect
+import os
+import sys
+import threading
+import tracemalloc
+from types import CodeType
+from typing import Iterable
+
+from discord.ext import commands
+
+MODES = ("cpu", "memory")
+TRACEMALLOC_FRAMES = 25
+"""frames kept per allocation, deep enough to reach the handler from the database code it calls"""
+
+
+def handler_codes(bot: commands.Bot, names: Iterable[str]) -> dict[str, CodeType]:
+    """
+    The code of the commands and listeners with the given names, without the wrappers of `metrics.timed`
+    """
+    codes = {}
+    for name in names:
+        command = bot.get_command(name)
+        if command is not None:
+            codes[name] = inspect.unwrap(command.callback).__code__
+            continue
+
+        for cog in bot.cogs.values():
+            for _, listener in cog.get_listeners():
+                if listener.__name__ == name:
+                    codes[name] = inspect.unwrap(listener).__code__
+
+        if name not in codes:
+            raise ValueError(f"Unknown handler {name}")
+
+    return codes
+
+def location(code: CodeType) -> str:
+    filename = code.co_filename
+    try:
+        filename = os.path.relpath(filename)
+    except ValueError:
+        pass
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+def line_filters(codes: Iterable[CodeType]) -> list[tracemalloc.Filter]:
+    """
+    Keep the allocations made while one of the given functions was on the stack
+    """
+    return [
+        tracemalloc.Filter(True, code.co_filename, lineno, all_frames = True)
+        for code in codes
+        for lineno in sorted({line for _, _, line in code.co_lines() if line is not None})
+    ]
+
+
+class Sampler(threading.Thread):
+    """
+    Reads the stack of every other thread every `interval` seconds. If `codes` are given, a stack only counts
+    from the outermost of them inwards and only when it passes through one, so a handler is measured
+    while its code runs on the event loop. The database work it hands to other threads isn't attributed to it.
+    """
+    def __init__(self, interval: float, codes: set[CodeType] | None = None) -> None:
+        super().__init__(name = "profiler", daemon = True)
+        self.interval = interval
+        self.codes = codes
+        self.ticks = 0
+        self.samples = 0
+        self.own: Counter[CodeType] = Counter()
+        """samples a function was running in"""
+        self.total: Counter[CodeType] = Counter()
+        """samples a function was on the stack in"""
+        self._done = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        while not self._done.wait(self.interval):
+            self.ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != me:
+                    self.sample(frame)
+
+    def sample(self, frame) -> None:
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+
+        if self.codes:
+            handlers = [depth for depth, code in enumerate(stack) if code in self.codes]
+            if not handlers:
+                return
+            # the event loop and the task machinery above the handler are on every stack
+            stack = stack[:handlers[-1] + 1]
+
+        self.samples += 1
+        self.own[stack[0]] += 1
+        self.total.update(set(stack))
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+    def summary(self, top: int) -> list[str]:
+        lines = [f"{self.samples} samples of {self.ticks} ticks every {self.interval * 1000:g} ms", "", "  own%  total%  function"]
+        for code, own in self.own.most_common(top):
+            lines.append(f"{100 * own / self.samples:6.1f} {100 * self.total[code] / self.samples:7.1f}  {location(code)}")
+
+        lines += ["", "by time on the stack", " total%  function"]
+        for code, total in self.total.most_common(top):
+            lines.append(f"{100 * total / self.samples:7.1f}  {location(code)}")
+        return lines
+
+
+class Profiler:
+    """
+    Profiles the running bot for some seconds on demand: `cpu` samples the stacks of its threads,
+    `memory` compares `tracemalloc` snapshots taken before and after. Nothing runs while no profile is taken.
+    One profile runs at a time.
+    """
+    def __init__(self, bot: commands.Bot, max_seconds: float = 300.0, interval: float = 0.01, top: int = 30) -> None:
+        self.bot = bot
+        self.max_seconds = max_seconds
+        self.interval = interval
+        self.top = top
+        self.running: str | None = None
+
+    async def run(self, mode: str, seconds: float, handlers: Iterable[str] = ()) -> str:
+        """
+        Profile for `seconds`, limited to the named commands and listeners if given, and return the summary
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode}, use one of {', '.join(MODES)}")
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f"Profile for more than 0 and at most {self.max_seconds:g} seconds")
+        if self.running is not None:
+            raise RuntimeError(f"A {self.running} profile is already running")
+
+        codes = handler_codes(self.bot, handlers)
+        self.running = mode
+        try:
+            if mode == "cpu":
+                lines = await self.cpu(seconds, set(codes.values()))
+            else:
+                lines = await self.memory(seconds, list(codes.values()))
+        finally:
+            self.running = None
+
+        header = f"{mode} profile of {seconds:g} s" + (f" limited to {', '.join(codes)}" if codes else "")
+        return "\n".join([header, "", *lines]) + "\n"
+
+    async def cpu(self, seconds: float, codes: set[CodeType]) -> list[str]:
+        sampler = Sampler(self.interval, codes or None)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(sampler.stop)
+
+        if not sampler.samples:
+            return ["no samples, the handlers didn't run"]
+        return sampler.summary(self.top)
+
+    async def memory(self, seconds: float, codes: list[CodeType]) -> list[str]:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        try:
+            before = tracemalloc.take_snapshot()
+            await asyncio.sleep(seconds)
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), *line_filters(codes)]
+        stats = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+        growth = sum(stat.size_diff for stat in stats)
+        lines = [
+            f"{growth / 2 ** 10:+.1f} KiB allocated and not freed, {current / 2 ** 20:.1f} MiB traced, {peak / 2 ** 20:.1f} MiB peak",
+            "",
+        ]
+        lines += [str(stat) for stat in stats[:self.top] if stat.size_diff or stat.count_diff]
+        return lines
@@ -0,0 +1,291 @@
+import asyncio
+from collections import OrderedDict
+from contextlib import suppress
+import logging
+import math
+from typing import Any, Hashable
+
+from discord import Message, PartialMessage
+
+from bot.bot import Bot
+
+ReactionKey = tuple[int, str]
+"""(message_id, emoji)"""
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: a timer goes into the slot of the tick it expires in, so scheduling and cancelling
+    take O(1) and one task advancing the wheel every `tick` seconds expires all timers.
+    A timer further away than `slots` ticks stays in its slot until the wheel came around often enough.
+    """
+    def __init__(self, tick: float = 1.0, slots: int = 64) -> None:
+        self.tick = tick
+        self.slots: list[dict[Hashable, tuple[int, Any]]] = [{} for _ in range(slots)]
+        self.deadlines: dict[Hashable, int] = {}
+        """key -> tick the timer expires in"""
+        self.current: int | None = None
+        """last tick that was expired"""
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def schedule(self, key: Hashable, value: Any, now: float, delay: float) -> None:
+        """
+        Expire `value` `delay` seconds after `now`, replacing the timer of `key` if it has one
+        """
+        self.cancel(key)
+        # rounded up, a timer expires up to a tick late but never early
+        deadline = math.ceil((now + delay) / self.tick)
+        if self.current is not None:
+            # a timer never expires in a tick that was already expired
+            deadline = max(deadline, self.current + 1)
+        self.slots[deadline % len(self.slots)][key] = (deadline, value)
+        self.deadlines[key] = deadline
+
+    def cancel(self, key: Hashable) -> Any | None:
+        deadline = self.deadlines.pop(key, None)
+        if deadline is None:
+            return None
+        _, value = self.slots[deadline % len(self.slots)].pop(key)
+        return value
+
+    def advance(self, now: float) -> list[tuple[Hashable, Any]]:
+        """
+        Expire the timers of every tick up to `now`, returns their (key, value)
+        """
+        target = int(now // self.tick)
+        if self.current is None:
+            self.current = min([target, *self.deadlines.values()]) - 1
+
+        expired = []
+        # a full turn visits every slot, more turns would only visit them again
+        first = max(self.current + 1, target - len(self.slots) + 1)
+        for tick in range(first, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for key, (deadline, value) in list(slot.items()):
+                if deadline <= target:
+                    del slot[key]
+                    del self.deadlines[key]
+                    expired.append((key, value))
+
+        self.current = max(self.current, target)
+        return expired
+
+    def pop_all(self) -> list[tuple[Hashable, Any]]:
+        """
+        Remove every timer, returns their (key, value)
+        """
+        timers = [(key, value) for slot in self.slots for key, (_, value) in slot.items()]
+        for slot in self.slots:
+            slot.clear()
+        self.deadlines.clear()
+        return timers
+
+
+class ChannelQueue:
+    """
+    The calls waiting for one channel, its removals are sent before its adds
+    """
+    def __init__(self) -> None:
+        self.adds: OrderedDict[ReactionKey, Message | PartialMessage] = OrderedDict()
+        self.removes: OrderedDict[ReactionKey, Message | PartialMessage] = OrderedDict()
+        """(message_id, emoji) -> message, in the order they were queued"""
+        self.task: asyncio.Task | None = None
+        """sends the calls while any are queued"""
+
+    def __len__(self) -> int:
+        return len(self.adds) + len(self.removes)
+
+    def pop(self) -> tuple[ReactionKey, Message | PartialMessage, bool]:
+        """
+        The next (key, message, add) to send
+        """
+        if self.removes:
+            key, message = self.removes.popitem(last = False)
+            return key, message, False
+        key, message = self.adds.popitem(last = False)
+        return key, message, True
+
+
+class ReactionDispatcher:
+    """
+    Adds and removes the bot's reactions from a queue per channel, at most `rate` calls per second in each
+    channel, instead of awaiting every call inside the listeners. An add and a remove of the same reaction
+    that are both still queued cancel out, and a reaction queued twice is sent once. `flash` shows a reaction
+    for some seconds; its removal waits on a single timer wheel instead of a sleeping task per message,
+    and flashing the message again only moves the removal. At most `queue_size` adds wait, later ones are
+    dropped. Removals are never dropped and go before the adds of their channel, so no reaction stays behind.
+    """
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = 4.0,
+        queue_size: int = 1000,
+        tick: float = 1.0,
+        slots: int = 64
+    ) -> None:
+        self.bot = bot
+        self.logger: logging.Logger = bot.logger
+        self.rate = rate
+        self.queue_size = queue_size
+        self.wheel = TimerWheel(tick, slots)
+
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._channels: dict[int, ChannelQueue] = {}
+        """channel_id -> the calls waiting for it"""
+        self._size = 0
+        """calls queued over all channels"""
+        self._busy = 0
+        """calls being sent"""
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._running = False
+        self._tasks: list[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return self._size
+
+    def start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._tasks = [asyncio.create_task(self._expire())]
+        for channel_id, queue in self._channels.items():
+            self._wake(channel_id, queue)
+
+    def add(self, message: Message | PartialMessage, emoji: str) -> None:
+        self._queue(message, emoji, True)
+
+    def remove(self, message: Message | PartialMessage, emoji: str) -> None:
+        self._queue(message, emoji, False)
+
+    def flash(self, message: Message | PartialMessage, emoji: str, seconds: float) -> None:
+        """
+        Add a reaction now and remove it `seconds` after the last flash of the same message
+        """
+        key = (message.id, emoji)
+        if key not in self.wheel.deadlines:
+            self.add(message, emoji)
+        self.wheel.schedule(key, message, asyncio.get_running_loop().time(), seconds)
+
+    async def drain(self) -> None:
+        """
+        Wait until every queued call was sent
+        """
+        await self._idle.wait()
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Remove the flashed reactions now and send what is queued, for at most `timeout` seconds
+        """
+        for (_, emoji), message in self.wheel.pop_all():
+            self.remove(message, emoji)
+
+        if self._running:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.drain(), timeout)
+
+        self._running = False
+        tasks = self._tasks + [queue.task for queue in self._channels.values() if queue.task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": self._size,
+            "queue_size": self.queue_size,
+            "channels": len(self._channels),
+            "timers": len(self.wheel),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+    def _queue(self, message: Message | PartialMessage, emoji: str, add: bool) -> None:
+        key = (message.id, emoji)
+        channel_id = message.channel.id
+        queue = self._channels.get(channel_id)
+        if queue is None:
+            queue = self._channels[channel_id] = ChannelQueue()
+
+        same, opposite = (queue.adds, queue.removes) if add else (queue.removes, queue.adds)
+        if key in same:
+            # the same call twice is sent once
+            self.coalesced += 1
+            return
+
+        if key in opposite:
+            # an add and a remove that weren't sent yet cancel out
+            del opposite[key]
+            self._size -= 1
+            self.coalesced += 2
+            self._forget(channel_id, queue)
+            return
+
+        if add and self._size >= self.queue_size:
+            self.dropped += 1
+            self.logger.warning(f"Dropped reaction {emoji} on message {message.id}, {self._size} queued")
+            self._forget(channel_id, queue)
+            return
+
+        same[key] = message
+        self._size += 1
+        self._idle.clear()
+        self._wake(channel_id, queue)
+
+    def _wake(self, channel_id: int, queue: ChannelQueue) -> None:
+        if self._running and queue.task is None and queue:
+            queue.task = asyncio.create_task(self._send(channel_id, queue))
+
+    def _forget(self, channel_id: int, queue: ChannelQueue) -> None:
+        """
+        Drop the queue of a channel once it has nothing to send
+        """
+        if not queue and queue.task is None and self._channels.get(channel_id) is queue:
+            del self._channels[channel_id]
+        if not self._size and not self._busy:
+            self._idle.set()
+
+    async def _send(self, channel_id: int, queue: ChannelQueue) -> None:
+        try:
+            while queue:
+                (message_id, emoji), message, add = queue.pop()
+                self._size -= 1
+                self._busy += 1
+                try:
+                    if add:
+                        await message.add_reaction(emoji)
+                    else:
+                        await message.remove_reaction(emoji, self.bot.user)
+                    self.sent += 1
+
+                except Exception as e:
+                    self.failed += 1
+                    self.logger.error(f"Failed to {'add' if add else 'remove'} reaction {emoji} on message {message_id}: {e}")
+
+                finally:
+                    self._busy -= 1
+                    self._forget(channel_id, queue)
+
+                # pace the calls of the channel, discord.py additionally waits out the rate limits it is told about
+                await asyncio.sleep(1 / self.rate)
+        finally:
+            queue.task = None
+            self._forget(channel_id, queue)
+
+    async def _expire(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            for (_, emoji), message in self.wheel.advance(loop.time()):
+                self.remove(message, emoji)
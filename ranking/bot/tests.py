@@ -0,0 +1,826 @@
+import asyncio
+from datetime import timedelta
+from time import perf_counter
+
+from discord.ext import commands
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from bot.backfill import Backfill
+from bot.bot import Bot, ShardedBot, create_bot, identify_delay, parse_shard_ids, shard_range
+from bot.benchmark import MAPPINGS, TOKENS, legacy_parse_message, sample_messages
+from bot.cache import ChannelCache, NameCache, RankingConfig
+from bot.db import db
+from bot.fakes import FakeBot, FakeChannel, FakeContext, FakeGuild, FakeMessage, FakeRawMessageUpdate, FakeUser
+from bot.reactions import ReactionDispatcher, TimerWheel
+from bot.leaderboard import Leaderboard, LeaderboardView, leaderboard_lines
+from bot.parser import get_parser, get_parser_set, parse_message
+from bot.profiler import Profiler
+from bot.writer import EntryWriter, PendingMessage
+from website.models import Entry, Mapping, Ranking, RankingChannel, Score, Subranking
+from website.scores import active_subrankings, check_scores, create_entry, standings
+from website.metrics import metrics
+from website.ranks import ranks
+from website.seed import seed
+from website.subrankings import resolver
+
+
+class ParseMessageTest(SimpleTestCase):
+    messages = sample_messages(5000, seed = 1) + [
+        "",
+        "+1",
+        "-1",
+        "+ 1",
+        "- 2,5",
+        "+1e3 -2E-1",
+        "+1.5kg +2 g",
+        "€3 and €4,5",
+        "pt1pt2",
+        "no score here",
+        "well-done 3",
+        "++1",
+        "+1 kg+2kg",
+        "1 + 1 = 2",
+        "k+1k",
+        "+1k",
+        "+1km",
+    ]
+
+    def test_matches_legacy_parser(self):
+        for token in TOKENS:
+            for mappings in MAPPINGS:
+                for message in self.messages:
+                    with self.subTest(token = token, mappings = mappings, message = message):
+                        self.assertEqual(
+                            parse_message(message, token, mappings),
+                            legacy_parse_message(message, token, mappings)
+                        )
+
+    def test_parser_set_matches_single_parsers(self):
+        rankings = [(token, mappings) for token in TOKENS for mappings in MAPPINGS]
+        rankings += rankings[:3]
+        parser_set = get_parser_set(tuple(get_parser(token, mappings) for token, mappings in rankings))
+
+        for message in self.messages:
+            with self.subTest(message = message):
+                self.assertEqual(
+                    parser_set.parse(message),
+                    [legacy_parse_message(message, token, mappings) for token, mappings in rankings]
+                )
+
+    def test_parsers_are_shared(self):
+        self.assertIs(get_parser("€", {"kg": 2.0}), get_parser("€", {"kg": 2.0}))
+        self.assertIsNot(get_parser("€", {"kg": 2.0, "g": 1.0}), get_parser("€", {"g": 1.0, "kg": 2.0}))
+
+
+class ShowNamesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 1, rankings = 1, members = 30, entries = 300)
+
+    def setUp(self):
+        self.bot = FakeBot()
+        self.guild = FakeGuild(
+            id = self.seeded.guild_ids[0],
+            members = [FakeUser(id = member, name = f"member {i}") for i, member in enumerate(self.seeded.members)]
+        )
+        # show no longer reads the member list of the channel
+        self.channel = FakeChannel(id = self.seeded.channel_ids[0], guild = self.guild)
+
+    async def show(self, cog) -> str:
+        ctx = FakeContext(channel = self.channel, author = FakeUser(id = self.seeded.members[0]), bot = self.bot)
+        await cog.show.callback(cog, ctx)
+        return ctx.sent[-1]
+
+    async def test_names_outlive_the_member_cache(self):
+        from bot.extensions.ranking import Ranking
+
+        shown = await self.show(Ranking(self.bot))
+        self.assertIn("member 0", shown)
+        self.assertNotIn("User ", shown)
+
+        # a restarted bot that hasn't seen the members reads the stored names
+        self.guild.members = []
+        cog = Ranking(self.bot)
+        self.assertEqual(await self.show(cog), shown)
+
+        await db(cog.names.rename)(self.guild.id, self.seeded.members[0], "renamed", False)
+        self.assertIn("renamed", await self.show(cog))
+        self.assertIn("renamed", await self.show(Ranking(self.bot)))
+
+    async def test_commands_are_measured(self):
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        metrics.handlers.clear()
+        cog = RankingCog(self.bot)
+        await self.show(cog)
+        with self.assertRaises(Ranking.DoesNotExist):
+            await cog.show.callback(cog, FakeContext(channel = self.channel, author = FakeUser(2), bot = self.bot), 10 ** 6)
+
+        show = metrics.handlers[("command", "show")]
+        self.assertEqual(show.seconds.count, 2)
+        # the queries run on the threads of `db` and still count for the command
+        self.assertGreater(show.queries.sum, 1)
+        self.assertEqual(show.errors, 1)
+
+    async def test_rank(self):
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        ranks.indexes.clear()
+        resolver.invalidate()
+        cog = RankingCog(self.bot)
+        ctx = FakeContext(channel = self.channel, author = self.guild.members[3], bot = self.bot)
+        await cog.rank.callback(cog, ctx)
+        self.assertIn("Rank of member 3", ctx.sent[-1])
+        ranking = await Ranking.objects.aget(id = self.seeded.ranking_ids[0])
+        users = await db(lambda: len(standings([ranking], active_subrankings([ranking.id]))))()
+        self.assertRegex(ctx.sent[-1], rf"#\d+ of {users} with")
+        self.assertIn("member ", ctx.sent[-1].split("with", 1)[1])
+
+
+class ChannelCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ranking = Ranking.objects.create(name = "cached", token = "+")
+        RankingChannel.objects.create(ranking = cls.ranking, channel_id = 40, guild_id = 10)
+        cls.unlinked = Ranking.objects.create(name = "unlinked", token = "€")
+
+    def setUp(self):
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        resolver.invalidate()
+        self.bot = FakeBot()
+        self.channel = FakeChannel(id = 40, guild = FakeGuild(id = 10))
+        self.cog = RankingCog(self.bot)
+
+    def context(self) -> FakeContext:
+        message = FakeMessage(id = 5000, content = "°command", author = FakeUser(2), channel = self.channel)
+        return FakeContext(channel = self.channel, author = FakeUser(2), bot = self.bot, message = message)
+
+    async def cached(self) -> list[RankingConfig]:
+        """
+        The rankings of the channel after a command, which must have dropped the channel from the cache
+        """
+        self.assertNotIn(self.channel.id, self.cog.channels._entries)
+        return list(await self.cog.channels.get(self.channel.id))
+
+    async def test_unlinked_channel_is_cached_as_empty(self):
+        channel = FakeChannel(id = 41, guild = FakeGuild(id = 10))
+        metrics.handlers.pop(("listener", "ranking_listener"), None)
+        for message_id in (1, 2, 3):
+            await self.cog.ranking_listener(FakeMessage(id = message_id, content = "+1", author = FakeUser(2), channel = channel))
+            if message_id == 1:
+                first = metrics.handlers[("listener", "ranking_listener")].queries.sum
+                self.assertGreater(first, 0)
+
+        self.assertEqual(metrics.handlers[("listener", "ranking_listener")].queries.sum, first)
+        self.assertEqual(self.cog.channels.stats()["hits"], 2)
+        self.assertEqual(await Entry.objects.acount(), 0)
+
+    async def test_commands_invalidate_the_channel(self):
+        self.assertEqual([ranking.name for ranking in await self.cog.channels.get(self.channel.id)], ["cached"])
+
+        await self.cog.create.callback(self.cog, self.context(), "created", "pt")
+        self.assertEqual([ranking.name for ranking in await self.cached()], ["cached", "created"])
+
+        await self.cog.link.callback(self.cog, self.context(), self.unlinked.id)
+        self.assertEqual([ranking.name for ranking in await self.cached()], ["cached", "created", "unlinked"])
+
+        await self.cog.add.callback(self.cog, self.context(), "kg", 3.0, self.ranking.id)
+        self.assertEqual((await self.cached())[0].mappings, {"kg": 3.0})
+
+        await self.cog.count.callback(self.cog, self.context(), "from", "now", "week", str(self.ranking.id))
+        self.assertEqual(len(await self.cached()), 3)
+
+    async def test_load_that_raced_an_invalidation_is_not_stored(self):
+        cache = ChannelCache()
+        loading = asyncio.ensure_future(cache.get(self.channel.id))
+        # the load started and waits on the database
+        await asyncio.sleep(0)
+        self.assertIn(self.channel.id, cache._loading)
+        cache.invalidate(self.channel.id)
+
+        await loading
+        self.assertNotIn(self.channel.id, cache._entries)
+        await cache.get(self.channel.id)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+        await cache.get(self.channel.id)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+
+class NameCacheTest(TestCase):
+    def test_bounded_and_reads_forgotten_names_again(self):
+        from website.models import User
+
+        ranking = Ranking.objects.create(name = "names")
+        users = [(i, f"user {i}", False) for i in range(1, 11)]
+        writer = NameCache()
+        writer.remember(1, users, [ranking.id])
+
+        names = NameCache(max_size = 4)
+        self.assertEqual(len(names.resolve(1, [ranking.id], [1, 2, 3])), 3)
+        self.assertLessEqual(len(names._names), 4)
+        self.assertLessEqual(len(names._stored), 4)
+        self.assertGreater(names.evictions, 0)
+
+        # the names of a ranking read before are read again when they were forgotten
+        self.assertEqual(names.resolve(1, [ranking.id], [9, 10]), {9: ("user 9", False), 10: ("user 10", False)})
+        names.mark_absent(1, list(range(100, 110)))
+        self.assertLessEqual(len(names._absent), 4)
+
+        before = User.objects.get(guild_id = 1, user = 1, ranking = ranking).updated_at
+        names.rename(1, 1, "renamed", False)
+        renamed = User.objects.get(guild_id = 1, user = 1, ranking = ranking)
+        self.assertEqual(renamed.name, "renamed")
+        self.assertGreater(renamed.updated_at, before)
+
+
+class EditListenerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.points = Ranking.objects.create(name = "points", token = "+")
+        Mapping.objects.create(ranking = cls.points, string = "kg", value = 3)
+        cls.euros = Ranking.objects.create(name = "euros", token = "€")
+        for ranking in (cls.points, cls.euros):
+            RankingChannel.objects.create(ranking = ranking, channel_id = 30, guild_id = 10)
+        # "+2kg €1"
+        create_entry(cls.points.id, 2, 1, 6)
+        create_entry(cls.euros.id, 2, 1, 1)
+
+    def setUp(self):
+        resolver.invalidate()
+        self.bot = FakeBot()
+        self.channel = FakeChannel(id = 30, guild = FakeGuild(id = 10))
+
+    async def edit(self, content: str) -> int:
+        """
+        Edit message 1 and return the number of 🔁 it flashes
+        """
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        cog = RankingCog(self.bot)
+        await cog.ranking_edit_listener(FakeRawMessageUpdate.edit(
+            FakeMessage(id = 1, content = content, author = FakeUser(2), channel = self.channel)
+        ))
+        flashed = cog.reactions.stats()["timers"]
+        await cog.reactions.close(timeout = 0)
+        return flashed
+
+    async def numbers(self) -> list[tuple[float, float]]:
+        """
+        (entry number, all-time total) of user 2 in points and euros
+        """
+        return [
+            (
+                (await Entry.objects.aget(ranking = ranking, message_id = 1)).number,
+                (await Score.objects.aget(ranking = ranking, subranking = None, user = 2)).total
+            )
+            for ranking in (self.points, self.euros)
+        ]
+
+    async def test_edit_rescores_every_ranking_with_its_mappings(self):
+        self.assertEqual(await self.edit("+1kg €4"), 1)
+        self.assertEqual(await self.numbers(), [(3, 3), (4, 4)])
+        self.assertEqual(await db(check_scores)([self.points.id, self.euros.id]), [])
+
+    async def test_edit_that_removes_a_token_keeps_its_entry(self):
+        self.assertEqual(await self.edit("+1kg"), 1)
+        self.assertEqual(await self.numbers(), [(3, 3), (1, 1)])
+
+        self.assertEqual(await self.edit("no score"), 0)
+        self.assertEqual(await self.numbers(), [(3, 3), (1, 1)])
+        self.assertEqual(await db(check_scores)([self.points.id, self.euros.id]), [])
+
+
+class BackfillTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.ranking = Ranking.objects.create(name = "backfill")
+        cls.subranking = Subranking.objects.create(ranking = cls.ranking, name = "week", active_from = now - timedelta(days = 7, hours = 12))
+        RankingChannel.objects.create(ranking = cls.ranking, channel_id = 20, guild_id = 10)
+        resolver.invalidate()
+
+    def setUp(self):
+        self.bot = FakeBot()
+        self.channel = FakeChannel(id = 20, guild = FakeGuild(id = 10))
+        self.users = [FakeUser(id = 100 + i) for i in range(3)]
+        self.now = timezone.now()
+
+    def post(self, message_id: int, content: str, days_ago: int, author: FakeUser = None) -> FakeMessage:
+        message = FakeMessage(
+            id = message_id,
+            content = content,
+            author = author or self.users[message_id % len(self.users)],
+            channel = self.channel,
+            created_at = self.now - timedelta(days = days_ago)
+        )
+        self.channel.messages.append(message)
+        return message
+
+    def backfill(self) -> Backfill:
+        return Backfill(self.bot.logger, self.bot.user.id, page_size = 3, page_delay = 0)
+
+    async def test_backfill_resumes_after_the_checkpoint(self):
+        for i in range(10):
+            self.post(1000 + i, f"+{i + 1}", 10 - i)
+        self.post(1010, "°show", 0)
+        self.post(1011, "+5 http://example.com", 0)
+        self.post(1012, "+5", 0, self.bot.user)
+        # scored live before the bot went down
+        await db(create_entry)(self.ranking.id, self.users[1000 % 3].id, 1000, 1)
+
+        [result] = await self.backfill().run([self.channel])
+        self.assertTrue(result.complete)
+        self.assertEqual(result.messages, 13)
+        self.assertEqual(result.entries, 9)
+        self.assertEqual(await Entry.objects.filter(ranking = self.ranking).acount(), 10)
+        self.assertEqual(await db(check_scores)([self.ranking.id]), [])
+
+        # only the messages of the last week count in the subranking, and the entry that was scored live
+        week = await db(lambda: sum(Score.objects.filter(subranking = self.subranking).values_list("total", flat = True)))()
+        self.assertEqual(week, sum(range(4, 11)) + 1)
+
+        self.post(1013, "+20", 0)
+        requests = self.channel.history_requests
+        [result] = await self.backfill().run([self.channel])
+        self.assertEqual((result.messages, result.entries), (1, 1))
+        self.assertEqual(self.channel.history_requests, requests + 1)
+        self.assertEqual(await db(check_scores)([self.ranking.id]), [])
+
+    async def test_rankings_count_from_their_own_checkpoint(self):
+        for i in range(10):
+            self.post(1000 + i, "+1", 10 - i)
+        # made with °create at message 1005, while the linked ranking was never backfilled
+        created = await Ranking.objects.acreate(name = "created")
+        await RankingChannel.objects.acreate(ranking = created, channel_id = 20, guild_id = 10, backfilled_until = 1005)
+        resolver.invalidate()
+
+        [result] = await self.backfill().run([self.channel])
+        self.assertEqual(result.entries, 10 + 4)
+        self.assertEqual(await Entry.objects.filter(ranking = self.ranking).acount(), 10)
+        self.assertEqual(
+            [message_id async for message_id in Entry.objects.filter(ranking = created).order_by("message_id").values_list("message_id", flat = True)],
+            [1006, 1007, 1008, 1009]
+        )
+        self.assertEqual(await db(check_scores)([self.ranking.id, created.id]), [])
+        checkpoints = {link.ranking_id: link.backfilled_until async for link in RankingChannel.objects.filter(channel_id = 20)}
+        self.assertEqual(checkpoints, {self.ranking.id: 1009, created.id: 1009})
+
+    async def test_live_entries_of_the_page_are_not_imported_again(self):
+        self.post(1000, "+2", 1)
+        self.post(1001, "+3", 1)
+        # scored live by a transaction that committed while the page was inserted
+        await db(create_entry)(self.ranking.id, self.users[1001 % 3].id, 1001, 3)
+        later = timezone.now() + timedelta(minutes = 1)
+        await Entry.objects.filter(message_id = 1001).aupdate(created_at = later)
+
+        [result] = await self.backfill().run([self.channel])
+        self.assertEqual(result.entries, 1)
+        self.assertEqual((await Entry.objects.aget(message_id = 1001)).created_at, later)
+        self.assertEqual(await db(check_scores)([self.ranking.id]), [])
+
+    async def test_command(self):
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        self.post(1000, "+3", 1)
+        ctx = FakeContext(channel = self.channel, author = self.users[0], bot = self.bot)
+        cog = RankingCog(self.bot)
+        await cog.backfill.callback(cog, ctx)
+        self.assertEqual(ctx.sent[-1], "Backfilled 1 messages into 1 new entries")
+
+
+class ShardingTest(SimpleTestCase):
+    def test_processes_split_the_shards(self):
+        for shard_count, process_count in ((16, 4), (10, 3), (2, 2), (1, 1)):
+            shard_ids = [shard_range(shard_count, index, process_count) for index in range(process_count)]
+            self.assertEqual(sum(shard_ids, []), list(range(shard_count)))
+            self.assertLessEqual(max(map(len, shard_ids)) - min(map(len, shard_ids)), 1)
+
+        self.assertEqual(parse_shard_ids("0-3, 8,2"), [0, 1, 2, 3, 8])
+        with self.assertRaises(ValueError):
+            shard_range(4, 2, 2)
+
+    @override_settings(BOT_SHARD_COUNT = "8", BOT_SHARD_IDS = "", BOT_PROCESS_INDEX = 1, BOT_PROCESS_COUNT = 2, BOT_IDENTIFY_CONCURRENCY = 2)
+    def test_create_bot(self):
+        bot = create_bot()
+        self.assertIsInstance(bot, ShardedBot)
+        self.assertEqual((bot.shard_count, bot.shard_ids, bot.identify_concurrency), (8, [4, 5, 6, 7], 2))
+
+        with self.settings(BOT_SHARD_IDS = "6-8"), self.assertRaises(ValueError):
+            create_bot()
+        with self.settings(BOT_SHARD_COUNT = ""):
+            self.assertNotIsInstance(create_bot(), ShardedBot)
+
+    def test_identify_delay(self):
+        # 16 at a time: shards 16-31 of the second process wait for the first slot, then go together
+        self.assertEqual(identify_delay(16, 16, True), 5.0)
+        self.assertEqual([identify_delay(shard_id, 16, False) for shard_id in range(17, 32)], [0.0] * 15)
+        self.assertEqual(identify_delay(32, 16, False), 5.0)
+        # one at a time like discord.py
+        self.assertEqual([identify_delay(shard_id, 1, shard_id == 0) for shard_id in range(3)], [0.0, 5.0, 5.0])
+
+
+class ConfigWatcherTest(TestCase):
+    async def test_other_processes_forget_reconfigured_rankings(self):
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        guild = FakeGuild(1)
+        channel = FakeChannel(10, guild)
+        ranking = await Ranking.objects.acreate(name = "shared", token = "x")
+        await RankingChannel.objects.acreate(ranking = ranking, channel_id = channel.id, guild_id = guild.id)
+
+        # two shard processes
+        bot = FakeBot()
+        listening, configuring = RankingCog(bot), RankingCog(bot)
+        self.assertEqual(await db(listening.config.check)(), [])
+        self.assertEqual((await listening.channels.get(channel.id))[0].mappings, {})
+
+        ctx = FakeContext(channel = channel, author = FakeUser(2), bot = bot)
+        await configuring.add.callback(configuring, ctx, "big", 10.0, ranking.id)
+
+        self.assertEqual(await db(listening.config.check)(), [ranking.id])
+        listening.forget([ranking.id])
+        self.assertEqual((await listening.channels.get(channel.id))[0].mappings, {"big": 10.0})
+        self.assertEqual(await db(listening.config.check)(), [])
+
+
+class TimerWheelTest(SimpleTestCase):
+    def test_expires_in_order(self):
+        wheel = TimerWheel(tick = 1.0, slots = 8)
+        for i in range(20):
+            wheel.schedule(i, f"timer {i}", now = 0.0, delay = i + 0.5)
+        wheel.schedule(3, "moved", now = 0.0, delay = 30.0)
+        wheel.cancel(4)
+
+        self.assertEqual(wheel.advance(2.0), [(0, "timer 0"), (1, "timer 1")])
+        # a turn of the wheel is 8 ticks, timers further away wait for their turn
+        expired = wheel.advance(12.0)
+        self.assertEqual(sorted(key for key, _ in expired), [2, *range(5, 12)])
+        # falling behind more than a turn still expires everything that is due
+        self.assertEqual(sorted(key for key, _ in wheel.advance(100.0)), [3, *range(12, 20)])
+        self.assertEqual(len(wheel), 0)
+
+
+class ReactionDispatcherTest(SimpleTestCase):
+    def message(self, message_id: int = 1, channel_id: int = 3) -> FakeMessage:
+        return FakeMessage(id = message_id, content = "+1", author = FakeUser(2), channel = FakeChannel(channel_id))
+
+    async def test_coalesces_before_sending(self):
+        reactions = ReactionDispatcher(FakeBot(), rate = 1000)
+        first, second = self.message(1), self.message(2)
+        reactions.add(first, "✅")
+        reactions.add(first, "✅")
+        reactions.add(second, "🔁")
+        reactions.remove(second, "🔁")
+        self.assertEqual(len(reactions), 1)
+
+        reactions.start()
+        await reactions.drain()
+        self.assertEqual((first.reactions, second.reactions), (["✅"], []))
+        self.assertEqual((reactions.sent, reactions.coalesced), (1, 3))
+        await reactions.close()
+
+    async def test_flash_is_removed_after_the_last_edit(self):
+        reactions = ReactionDispatcher(FakeBot(), rate = 1000, tick = 0.01)
+        message = self.message()
+        reactions.start()
+        for _ in range(5):
+            reactions.flash(message, "🔁", 0.05)
+            await asyncio.sleep(0.02)
+        await reactions.drain()
+        self.assertEqual(message.reactions, ["🔁"])
+        self.assertEqual(reactions.stats()["timers"], 1)
+
+        await asyncio.sleep(0.1)
+        await reactions.drain()
+        self.assertEqual(message.reactions, [])
+        self.assertEqual(reactions.sent, 2)
+        await reactions.close()
+
+    async def test_drops_adds_when_full_and_removes_flashes_on_close(self):
+        reactions = ReactionDispatcher(FakeBot(), rate = 1000, queue_size = 2)
+        messages = [self.message(i) for i in range(3)]
+        for message in messages:
+            reactions.flash(message, "🔁", 60)
+        self.assertEqual(reactions.stats()["dropped"], 1)
+
+        reactions.start()
+        await reactions.drain()
+        self.assertEqual([message.reactions for message in messages], [["🔁"], ["🔁"], []])
+        await reactions.close()
+        self.assertEqual([message.reactions for message in messages], [[], [], []])
+        self.assertEqual(reactions.stats()["timers"], 0)
+        self.assertEqual(reactions.stats()["channels"], 0)
+
+    async def test_removals_are_never_dropped_and_go_first(self):
+        reactions = ReactionDispatcher(FakeBot(), rate = 1000, queue_size = 1)
+        flashed = self.message(1)
+        flashed.reactions.append("🔁")
+        added = self.message(2)
+        reactions.add(added, "✅")
+        reactions.remove(flashed, "🔁")
+        self.assertEqual((len(reactions), reactions.dropped), (2, 0))
+
+        reactions.start()
+        await asyncio.sleep(0)
+        self.assertEqual((flashed.reactions, added.reactions), ([], []))
+        await reactions.drain()
+        self.assertEqual(added.reactions, ["✅"])
+        await reactions.close()
+
+    async def test_paces_each_channel_on_its_own(self):
+        reactions = ReactionDispatcher(FakeBot(), rate = 2)
+        busy = [self.message(i, channel_id = 3) for i in range(3)]
+        quiet = self.message(10, channel_id = 4)
+        for message in busy:
+            reactions.add(message, "✅")
+        reactions.add(quiet, "✅")
+
+        reactions.start()
+        await asyncio.sleep(0.1)
+        # the quiet channel doesn't wait behind the busy one
+        self.assertEqual(quiet.reactions, ["✅"])
+        self.assertEqual(sum(len(message.reactions) for message in busy), 1)
+        await reactions.close()
+
+
+class CommittedMessage(FakeMessage):
+    """
+    Records whether its entries were in the database when it got its reaction
+    """
+    async def add_reaction(self, emoji: str) -> None:
+        self.committed = await Entry.objects.filter(message_id = self.id).aexists()
+        await super().add_reaction(emoji)
+
+
+class EntryWriterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ranking = Ranking.objects.create(name = "writer")
+        resolver.invalidate()
+
+    def pending(self, message_id: int, number: float = 1) -> PendingMessage:
+        message = CommittedMessage(id = message_id, content = f"+{number:g}", author = FakeUser(2), channel = FakeChannel(3))
+        return PendingMessage(message, [(self.ranking.id, 2, message_id, number)])
+
+    async def written(self) -> list[int]:
+        return [message_id async for message_id in Entry.objects.order_by("message_id").values_list("message_id", flat = True)]
+
+    async def wait_for(self, condition, timeout: float = 2.0) -> None:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not condition():
+            self.assertLess(loop.time(), deadline)
+            await asyncio.sleep(0.005)
+
+    async def test_flushes_a_full_batch_then_reacts(self):
+        writer = EntryWriter(FakeBot().logger, interval_ms = 60000, batch_size = 2)
+        writer.start()
+        batch = [self.pending(1), self.pending(2, 3)]
+        for pending in batch:
+            await writer.put(pending)
+
+        await self.wait_for(lambda: writer.flushes == 1 and all(pending.message.reactions for pending in batch))
+        self.assertEqual(await self.written(), [1, 2])
+        self.assertEqual([(pending.message.reactions, pending.message.committed) for pending in batch], [(["✅"], True)] * 2)
+        self.assertEqual(await db(check_scores)([self.ranking.id]), [])
+        await writer.close()
+
+    async def test_flushes_when_the_interval_expires(self):
+        writer = EntryWriter(FakeBot().logger, interval_ms = 100, batch_size = 100)
+        writer.start()
+        pending = self.pending(1)
+        await writer.put(pending)
+        await asyncio.sleep(0)
+        self.assertEqual(writer.flushes, 0)
+
+        await self.wait_for(lambda: pending.message.reactions)
+        self.assertEqual((writer.flushes, writer.last_batch_size), (1, 1))
+        self.assertEqual(await self.written(), [1])
+        self.assertTrue(pending.message.committed)
+        await writer.close()
+
+    async def test_close_writes_the_flushing_and_the_queued_batches(self):
+        writer = EntryWriter(FakeBot().logger, interval_ms = 60000, batch_size = 1)
+        writer.start()
+        flushing, queued = self.pending(1), self.pending(2)
+        await writer.put(flushing)
+        await self.wait_for(lambda: writer._flushing is not None)
+        await writer.put(queued)
+
+        await writer.close()
+        self.assertEqual(await self.written(), [1, 2])
+        self.assertEqual((flushing.message.reactions, queued.message.reactions), (["✅"], ["✅"]))
+        self.assertEqual(writer.flushed_entries, 2)
+
+    async def test_failed_batch_is_written_one_by_one(self):
+        await db(create_entry)(self.ranking.id, 2, 2, 1)
+        writer = EntryWriter(FakeBot().logger, interval_ms = 60000, batch_size = 3)
+        writer.start()
+        # the message that already has an entry fails the batch
+        batch = [self.pending(1), self.pending(2), self.pending(3)]
+        for pending in batch:
+            await writer.put(pending)
+
+        await self.wait_for(lambda: all(pending.message.reactions for pending in batch))
+        self.assertEqual([pending.message.reactions for pending in batch], [["✅"], ["❌"], ["✅"]])
+        self.assertEqual((writer.flushed_entries, writer.failed_entries), (2, 1))
+        self.assertEqual(await self.written(), [1, 2, 3])
+        self.assertEqual(await db(check_scores)([self.ranking.id]), [])
+        await writer.close()
+
+
+class LeaderboardTest(SimpleTestCase):
+    async def test_pages_are_rendered_on_demand(self):
+        ranking = Ranking(id = 1, name = "ranking")
+        rows = [(user, 100.0 - user) for user in range(100)]
+        users = {user: ("long name " * 6 if user % 2 else f"user {user}", False) for user, _ in rows}
+        fetched = []
+
+        async def fetch(offset: int, limit: int) -> list[tuple]:
+            fetched.append(offset)
+            return rows[offset:offset + limit]
+
+        async def render(rows: list[tuple]) -> list[str]:
+            return list(leaderboard_lines([ranking], rows, users))
+
+        view = LeaderboardView(Leaderboard("## ranking\n", fetch, render, page_rows = 25, limit = 500))
+        await view.update_buttons()
+        pages = [await view.leaderboard.page(0)]
+        self.assertEqual(fetched, [0])
+        self.assertTrue(view.previous.disabled)
+
+        while not view.next.disabled:
+            pages.append(await view.flip(1))
+        self.assertEqual(fetched, [0, 25, 50, 75, 100])
+        self.assertEqual(view.position.label, f"{len(pages)}/{len(pages)}")
+        self.assertEqual(await view.flip(-1), pages[-2])
+
+        self.assertTrue(all(len(page) <= 500 and page.startswith("## ranking\n") for page in pages))
+        self.assertEqual(
+            "".join(page.removeprefix("## ranking\n") for page in pages),
+            "".join(leaderboard_lines([ranking], rows, users))
+        )
+
+
+
+class QueryCountTest(TestCase):
+    """
+    Drives every command and listener of the ranking cog in a small channel with one ranking and a large channel
+    with many rankings, mappings, users and entries. The queries of a handler may grow with the rankings
+    it writes to, never with the rows it reads.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 1, rankings = 6, members = 200, entries = 3000)
+        cls.large = cls.seeded.channel_ids[0]
+        cls.small = cls.large + 1
+        ranking = Ranking.objects.create(name = "small", description = "", active = True)
+        cls.small_ranking = ranking.id
+        RankingChannel.objects.create(ranking = ranking, channel_id = cls.small, guild_id = cls.seeded.guild_ids[0])
+        for i, user in enumerate(cls.seeded.members[:3]):
+            create_entry(ranking_id = ranking.id, user = user, message_id = 1 + i, number = 1)
+
+    def setUp(self):
+        resolver.invalidate()
+        ranks.indexes.clear()
+        # like the bot process, which forgets reconfigured windows through its config watcher
+        resolver.check_versions = False
+        self.addCleanup(setattr, resolver, "check_versions", True)
+        self.bot = FakeBot()
+        self.guild = FakeGuild(
+            id = self.seeded.guild_ids[0],
+            members = [FakeUser(id = member, name = f"member {i}") for i, member in enumerate(self.seeded.members)]
+        )
+        self.bot.channels = {
+            channel_id: FakeChannel(id = channel_id, guild = self.guild)
+            for channel_id in (self.small, self.large)
+        }
+        self.message_ids = iter(range(10 ** 6, 2 * 10 ** 6))
+
+    def context(self, channel: FakeChannel) -> FakeContext:
+        return FakeContext(
+            channel = channel,
+            author = self.guild.members[0],
+            bot = self.bot,
+            message = self.message(channel, "°command")
+        )
+
+    def message(self, channel: FakeChannel, content: str) -> FakeMessage:
+        return FakeMessage(id = next(self.message_ids), content = content, author = self.guild.members[0], channel = channel)
+
+    async def queries(self, kind: str, handler: str, call) -> int:
+        """
+        Queries of one call of a handler on a fresh cog, so the caches start cold
+        """
+        from bot.extensions.ranking import Ranking as RankingCog
+
+        metrics.handlers.pop((kind, handler), None)
+        cog = RankingCog(self.bot)
+        await call(cog)
+        await cog.reactions.close(timeout = 0)
+        measured = metrics.handlers[(kind, handler)]
+        self.assertEqual(measured.errors, 0, handler)
+        return int(measured.queries.sum)
+
+    async def assertQueries(self, kind: str, handler: str, call, base: int, per_ranking: int = 0) -> None:
+        """
+        At most `base` queries plus `per_ranking` for every ranking linked to the channel, in both channels
+        """
+        for channel_id in (self.small, self.large):
+            rankings = await RankingChannel.objects.filter(channel_id = channel_id).acount()
+            queries = await self.queries(kind, handler, lambda cog: call(cog, self.bot.channels[channel_id]))
+            with self.subTest(handler = handler, rankings = rankings):
+                self.assertLessEqual(queries, base + per_ranking * rankings)
+
+    async def test_read_commands(self):
+        await self.assertQueries("command", "rankings", lambda cog, channel: cog.rankings.callback(cog, self.context(channel)), 1)
+        await self.assertQueries("command", "list", lambda cog, channel: cog.list.callback(cog, self.context(channel)), 2)
+        # the first page and the rows of the next one, named in two batches
+        await self.assertQueries("command", "show", lambda cog, channel: cog.show.callback(cog, self.context(channel)), 9)
+        # building a cold rank index reads the score rows of its window once
+        await self.assertQueries("command", "rank", lambda cog, channel: cog.rank.callback(cog, self.context(channel)), 2, 1)
+
+    async def test_config_commands(self):
+        await self.assertQueries("command", "create", lambda cog, channel: cog.create.callback(cog, self.context(channel), "new", "€"), 3)
+        await self.assertQueries("command", "link", lambda cog, channel: cog.link.callback(
+            cog, self.context(channel), self.small_ranking if channel.id == self.large else self.seeded.ranking_ids[0]
+        ), 3)
+        await self.assertQueries("command", "add", lambda cog, channel: cog.add.callback(cog, self.context(channel), f"x{channel.id}", 2.0), 3)
+        await self.assertQueries("command", "backfill", lambda cog, channel: cog.backfill.callback(cog, self.context(channel)), 3)
+        # every ranking closes one window and opens one, both are summed from the rollups
+        await self.assertQueries("command", "count", lambda cog, channel: cog.count.callback(cog, self.context(channel), "from", "now", "new"), 6, 4)
+
+    async def test_listeners(self):
+        # a message scores in every ranking of the channel, the scores and rollups of each are updated
+        await self.assertQueries("listener", "ranking_listener", lambda cog, channel: cog.ranking_listener(
+            self.message(channel, "+1 €1 1pt 1kg")
+        ), 6, 5)
+        await self.assertQueries("listener", "ranking_edit_listener", lambda cog, channel: cog.ranking_edit_listener(
+            FakeRawMessageUpdate.edit(FakeMessage(
+                id = self.seeded.message_ids[0] if channel.id == self.large else 1,
+                content = "+2 €2 2pt 2kg",
+                author = self.guild.members[0],
+                channel = channel
+            ))
+        ), 8, 1)
+        await self.assertQueries("listener", "on_member_update", lambda cog, channel: cog.on_member_update(
+            self.guild.members[0], FakeUser(id = self.guild.members[0].id, name = "renamed", guild = self.guild)
+        ), 1)
+
+
+class Busy(commands.Cog):
+    def __init__(self) -> None:
+        self.kept = []
+
+    @commands.command()
+    async def spin(self, ctx, seconds: float):
+        start = perf_counter()
+        while perf_counter() - start < seconds:
+            sum(range(1000))
+
+    @commands.Cog.listener("on_message")
+    async def hoard(self, message):
+        self.kept.append([str(i) for i in range(10000)])
+
+
+class ProfilerTest(SimpleTestCase):
+    async def start(self) -> None:
+        self.bot = Bot()
+        self.cog = Busy()
+        await self.bot.add_cog(self.cog)
+        self.profiler = Profiler(self.bot, max_seconds = 5, interval = 0.001)
+
+    async def test_cpu_profile_of_a_handler(self):
+        await self.start()
+        profile = asyncio.create_task(self.profiler.run("cpu", 0.3, ["spin"]))
+        await asyncio.sleep(0.01)
+        with self.assertRaises(RuntimeError):
+            await self.profiler.run("memory", 0.1)
+
+        await self.cog.spin.callback(self.cog, None, 0.2)
+        summary = await profile
+        self.assertIn("limited to spin", summary)
+        self.assertRegex(summary, r"100\.0  spin \(")
+        # the samples of the idle event loop don't count
+        self.assertNotIn("select", summary)
+
+    async def test_memory_profile_of_a_listener(self):
+        await self.start()
+        profile = asyncio.create_task(self.profiler.run("memory", 0.1, ["hoard"]))
+        await asyncio.sleep(0)
+        await self.cog.hoard(None)
+        summary = await profile
+        self.assertIn("memory profile", summary)
+        self.assertIn("tests.py", summary)
+        self.assertIsNone(self.profiler.running)
+
+    async def test_rejects_unknown_handlers_and_long_profiles(self):
+        await self.start()
+        with self.assertRaises(ValueError):
+            await self.profiler.run("cpu", 1, ["missing"])
+        with self.assertRaises(ValueError):
+            await self.profiler.run("cpu", 60)
+        with self.assertRaises(ValueError):
+            await self.profiler.run("wall", 1)
@@ -0,0 +1,164 @@
+import asyncio
+from contextlib import suppress
+from dataclasses import dataclass, field
+import logging
+from time import perf_counter
+import traceback
+
+from discord import Message
+
+from bot.db import db
+from bot.reactions import ReactionDispatcher
+from website.scores import create_entries, create_entry
+
+
+@dataclass
+class PendingMessage:
+    """
+    A scored message waiting to be written, with its (ranking_id, user, message_id, number) entries
+    """
+    message: Message
+    entries: list[tuple[int, int, int, float]] = field(default_factory = list)
+
+
+class EntryWriter:
+    """
+    Write-behind buffer for entries. Scored messages are queued and inserted in batches,
+    every `interval_ms` milliseconds or as soon as `batch_size` entries are waiting.
+    A message gets its reaction once the batch holding it is committed, through `reactions` when given.
+    """
+    def __init__(
+        self,
+        logger: logging.Logger,
+        interval_ms: int = 250,
+        batch_size: int = 200,
+        queue_size: int = 10000,
+        reactions: ReactionDispatcher | None = None
+    ) -> None:
+        self.logger = logger
+        self.reactions = reactions
+        self.interval_ms = interval_ms
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue[PendingMessage] = asyncio.Queue(maxsize = queue_size)
+
+        self.flushes = 0
+        self.flushed_entries = 0
+        self.failed_entries = 0
+        self.last_batch_size = 0
+        self.last_flush_ms = 0.0
+
+        self._batch: list[PendingMessage] = []
+        self._task: asyncio.Task | None = None
+        self._flushing: asyncio.Future | None = None
+        self._closed = False
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, pending: PendingMessage) -> None:
+        """
+        Queue a scored message, waits while the queue is full
+        """
+        if self._closed:
+            await self._flush([pending])
+            return
+
+        await self.queue.put(pending)
+
+    async def close(self) -> None:
+        """
+        Stop batching and write everything that is still pending
+        """
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+        if self._flushing is not None:
+            with suppress(Exception):
+                await self._flushing
+
+        batch, self._batch = self._batch, []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+
+        if batch:
+            await self._flush(batch)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "batch_size": self.batch_size,
+            "interval_ms": self.interval_ms,
+            "flushes": self.flushes,
+            "flushed_entries": self.flushed_entries,
+            "failed_entries": self.failed_entries,
+            "last_batch_size": self.last_batch_size,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+    def _pending_entries(self) -> int:
+        return sum(len(pending.entries) for pending in self._batch)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self.queue.get())
+            deadline = loop.time() + self.interval_ms / 1000
+
+            while self._pending_entries() < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self._batch = self._batch, []
+            # a flush that started must finish, even when the writer is closed meanwhile
+            self._flushing = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._flushing)
+            self._flushing = None
+
+    async def _flush(self, batch: list[PendingMessage]) -> None:
+        entries = [entry for pending in batch for entry in pending.entries]
+        failed: set[int] = set()
+        failed_entries = 0
+
+        start = perf_counter()
+        try:
+            await db(create_entries)(entries)
+
+        except Exception as e:
+            # one bad entry shouldn't lose the batch, retry them one by one
+            self.logger.error(f"Failed to write batch of {len(entries)} entries, retrying one by one: {e}")
+            for pending in batch:
+                for ranking_id, user, message_id, number in pending.entries:
+                    try:
+                        await db(create_entry)(ranking_id, user, message_id, number)
+                    except Exception as e:
+                        self.logger.error(f"Failed to create entry for message {message_id} in ranking #{ranking_id}: {e}")
+                        failed.add(pending.message.id)
+                        failed_entries += 1
+
+        self.flushes += 1
+        self.flushed_entries += len(entries) - failed_entries
+        self.failed_entries += failed_entries
+        self.last_batch_size = len(entries)
+        self.last_flush_ms = (perf_counter() - start) * 1000
+
+        for pending in batch:
+            emoji = "❌" if pending.message.id in failed else "✅"
+            if self.reactions is not None:
+                self.reactions.add(pending.message, emoji)
+                continue
+
+            try:
+                await pending.message.add_reaction(emoji)
+            except Exception:
+                self.logger.error(f"Failed to react to message {pending.message.id}: {traceback.format_exc()}")
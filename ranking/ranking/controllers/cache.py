@@ -0,0 +1,93 @@
+import functools
+import hashlib
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+
+from ranking.controllers.util import Response, wants_html
+
+
+class ResponseCache:
+    """
+    Rendered responses in one of the django caches. Keys hold the version of what the response shows,
+    so a write makes the old responses unreachable instead of deleting them, they expire with the TTL.
+    Hits and misses are counted per process.
+    """
+    def __init__(self, alias: str = "default", timeout: int | None = None, enabled: bool = True) -> None:
+        self.alias = alias
+        self.timeout = timeout
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, request: HttpRequest, *parts) -> str:
+        """
+        Key of a response, the media type and query string are part of it
+        """
+        query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+        return ":".join(["response", request.resolver_match.url_name, *map(str, parts), "html" if wants_html(request) else "json", query])
+
+    def get(self, key: str) -> HttpResponse | None:
+        cached = self.cache.get(key)
+        if cached is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        content, content_type = cached
+        return HttpResponse(content, content_type = content_type)
+
+    def set(self, key: str, response: HttpResponse) -> None:
+        self.cache.set(key, (response.content, response["Content-Type"]), self.timeout)
+
+    def stats(self) -> dict[str, float]:
+        requests = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+    def __call__(self, key_func: Callable[..., tuple | None]) -> Callable:
+        """
+        Decorate a view whose successful GET responses can be cached.
+        `key_func(request, *args, **kwargs)` returns what identifies the response, None to skip the cache.
+        """
+        def decorator(view: Callable[..., Response]) -> Callable[..., Response]:
+            @functools.wraps(view)
+            def wrapper(request: HttpRequest, *args, **kwargs) -> Response:
+                if not self.enabled or request.method not in ("GET", "HEAD"):
+                    return view(request, *args, **kwargs)
+
+                parts = key_func(request, *args, **kwargs)
+                if parts is None:
+                    return view(request, *args, **kwargs)
+
+                key = self.key(request, *parts)
+                response = self.get(key)
+                if response is not None:
+                    response["X-Cache"] = "HIT"
+                    return response
+
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    self.set(key, response)
+                response["X-Cache"] = "MISS"
+                return response
+
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache(
+    settings.RANKING_RESPONSE_CACHE_ALIAS,
+    settings.RANKING_RESPONSE_CACHE_TTL,
+    settings.RANKING_RESPONSE_CACHE,
+)
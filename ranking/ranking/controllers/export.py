@@ -0,0 +1,99 @@
+from asgiref.sync import sync_to_async
+from itertools import islice
+from typing import AsyncIterator, Iterator
+
+from django.conf import settings
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+
+from website.export import ENTRY_FIELDS, FORMATS, STANDING_FIELDS, entry_rows, export_lines, parse_time, standing_rows
+from website.models import Ranking, Subranking
+from website.subrankings import resolver
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def load_export(request: HttpRequest, ranking_id: int) -> tuple[Ranking, dict]:
+    """
+    The ranking and the filters of an export request.
+    `?subranking=` is the id of a subranking of the ranking or `active`, `?since=` and `?until=` are ISO 8601 times.
+    Raises Ranking.DoesNotExist, Subranking.DoesNotExist or BadRequest.
+    """
+    ranking = Ranking.objects.get(id = ranking_id)
+
+    subranking = request.GET.get("subranking")
+    if subranking == "active":
+        subranking = resolver.window(ranking).subranking
+    elif subranking is not None:
+        if not subranking.isdigit():
+            raise BadRequest(f"Invalid subranking {subranking}")
+        subranking = Subranking.objects.get(id = int(subranking), ranking_id = ranking.id)
+
+    user = request.GET.get("user")
+    if user is not None and not user.isdigit():
+        raise BadRequest(f"Invalid user {user}")
+
+    try:
+        since, until = (parse_time(request.GET[name]) if name in request.GET else None for name in ("since", "until"))
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+    return ranking, {
+        "subranking": subranking,
+        "user": int(user) if user is not None else None,
+        "since": since,
+        "until": until,
+    }
+
+async def alines(lines: Iterator[str], batch: int) -> AsyncIterator[str]:
+    """
+    Read `batch` lines at a time on the thread that holds the database cursor.
+    An asynchronous iterator keeps the ASGI handler from collecting a synchronous one in memory first.
+    """
+    read = sync_to_async(lambda: "".join(islice(lines, batch)))
+    while chunk := await read():
+        yield chunk
+
+async def export(request: HttpRequest, ranking_id: int, kind: str) -> StreamingHttpResponse | JsonResponse:
+    format = request.GET.get("format", "csv")
+    if format not in FORMATS:
+        return JsonResponse({"error": f"Unsupported format {format}, expected one of {', '.join(FORMATS)}"}, status = 400)
+
+    try:
+        ranking, filters = await sync_to_async(load_export)(request, ranking_id)
+    except Ranking.DoesNotExist:
+        return JsonResponse({"error": f"Ranking with ID {ranking_id} not found"}, status = 404)
+    except Subranking.DoesNotExist:
+        return JsonResponse({"error": f"Subranking not found in ranking #{ranking_id}"}, status = 404)
+    except BadRequest as e:
+        return JsonResponse({"error": str(e)}, status = 400)
+
+    if kind == "entries":
+        rows, fields = entry_rows(ranking.id, **filters), ENTRY_FIELDS
+    else:
+        filters.pop("user")
+        rows, fields = standing_rows(ranking, **filters), STANDING_FIELDS
+
+    content_type, _ = FORMATS[format]
+    chunk_size = settings.RANKING_EXPORT_CHUNK_SIZE
+    response = StreamingHttpResponse(
+        alines(export_lines(rows, fields, format, chunk_size), chunk_size),
+        content_type = content_type
+    )
+    response["Content-Disposition"] = f'attachment; filename="ranking-{ranking.id}-{kind}.{format}"'
+    return response
+
+async def entries(request: HttpRequest, ranking_id: int) -> StreamingHttpResponse | JsonResponse:
+    """
+    Every entry of a ranking, oldest first, as `?format=csv` (default) or `ndjson`.
+    Filtered by `?subranking=`, `?user=`, `?since=` and `?until=`.
+    """
+    return await export(request, ranking_id, "entries")
+
+async def standings(request: HttpRequest, ranking_id: int) -> StreamingHttpResponse | JsonResponse:
+    """
+    The full standings of a ranking, as `?format=csv` (default) or `ndjson`.
+    `?subranking=` picks the window, `?since=` and `?until=` sum only the entries of that time range.
+    """
+    return await export(request, ranking_id, "standings")
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse
+
+from bot.db import pool_stats
+from ranking.controllers.cache import response_cache
+from ranking.controllers.ranking import hub
+from website.metrics import CONTENT_TYPE, metrics as registry
+from website.ranks import ranks
+
+registry.register("db_pool", pool_stats)
+registry.register("response_cache", response_cache.stats)
+registry.register("live", hub.stats)
+registry.register("rank_index", ranks.stats)
+
+
+def allowed(request: HttpRequest) -> bool:
+    """
+    Whether the client may scrape, everyone when RANKING_METRICS_ALLOWED_HOSTS is empty
+    """
+    hosts = settings.RANKING_METRICS_ALLOWED_HOSTS
+    return not hosts or request.META.get("REMOTE_ADDR") in hosts
+
+def metrics(request: HttpRequest) -> HttpResponse | JsonResponse:
+    """
+    Latency, query and error metrics of the views of this process in the Prometheus text format
+    """
+    if not allowed(request):
+        return JsonResponse({"error": "Forbidden"}, status = 403)
+
+    return HttpResponse(registry.render(), content_type = CONTENT_TYPE)
@@ -0,0 +1,262 @@
+import asyncio
+import base64
+from datetime import datetime
+import json
+from typing import AsyncIterator
+
+from django.conf import settings
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
+
+from ranking.controllers.cache import response_cache
+from ranking.controllers.util import Response, respond
+from website.live import LeaderboardHub, Subscriber, SubscriberLimit
+from website.models import Ranking
+from website.ranks import Standing, ranks
+from website.scores import entries_page, leaderboard as leaderboard_page
+from website.subrankings import resolver
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+hub = LeaderboardHub(
+    poll_interval = settings.RANKING_LIVE_POLL_INTERVAL,
+    max_subscribers = settings.RANKING_LIVE_MAX_SUBSCRIBERS,
+    queue_size = settings.RANKING_LIVE_QUEUE_SIZE,
+    top = settings.RANKING_LIVE_TOP,
+)
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadRequest("Invalid cursor")
+
+def get_limit(request: HttpRequest) -> int:
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("Invalid limit")
+
+    return max(1, min(limit, MAX_LIMIT))
+
+def get_ranking(request: HttpRequest, ranking_id: int) -> Ranking | None:
+    """
+    The ranking of a request, looked up once for the conditional headers and the view
+    """
+    if not hasattr(request, "_ranking"):
+        request._ranking = Ranking.objects.filter(id = ranking_id).first()
+    return request._ranking
+
+def last_modified(request: HttpRequest, ranking_id: int) -> datetime | None:
+    """
+    Entry writes bump the version and the update time of their ranking
+    """
+    ranking = get_ranking(request, ranking_id)
+    return ranking.updated_at if ranking else None
+
+def window_id(ranking: Ranking) -> int:
+    window = resolver.window(ranking)
+    return window.subranking.id if window.subranking else 0
+
+def etag(request: HttpRequest, ranking_id: int) -> str | None:
+    """
+    Changes with every entry write and when the active subranking changes
+    """
+    ranking = get_ranking(request, ranking_id)
+    if ranking is None:
+        return None
+
+    return f"{ranking_id}-{ranking.version}-{window_id(ranking)}"
+
+def cache_key(request: HttpRequest, ranking_id: int) -> tuple | None:
+    ranking = get_ranking(request, ranking_id)
+    if ranking is None:
+        return None
+
+    return (ranking_id, ranking.version, window_id(ranking))
+
+def not_found(ranking_id: int) -> tuple[dict, int, str]:
+    return ({"error": f"Ranking with ID {ranking_id} not found"}, 404, "error.html")
+
+def get_leaderboard(request: HttpRequest, ranking_id: int) -> tuple[dict, int, str]:
+    ranking = get_ranking(request, ranking_id)
+    if ranking is None:
+        return not_found(ranking_id)
+
+    try:
+        limit = get_limit(request)
+        position = 0
+        after = None
+        if "cursor" in request.GET:
+            score, latest, user, position = decode_cursor(request.GET["cursor"])
+            after = (float(score), datetime.fromisoformat(latest), int(user))
+    except (BadRequest, TypeError, ValueError) as e:
+        return ({"error": str(e) or "Invalid cursor"}, 400, "error.html")
+
+    window = resolver.window(ranking)
+    rows = []
+    for row in leaderboard_page(ranking, window.subranking, after, limit):
+        position += 1
+        rows.append({
+            "position": position,
+            "user": row["user"],
+            "score": row["total"],
+            "latest": row["last_updated"],
+        })
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = encode_cursor(last["score"], last["latest"].isoformat(), last["user"], last["position"])
+
+    return ({
+        "ranking": {
+            "id": ranking.id,
+            "name": ranking.name,
+            "subranking": window.name or None,
+            "reverse_sort": ranking.reverse_sort,
+        },
+        "results": rows,
+        "next": next_cursor,
+    }, 200, "website/leaderboard.html")
+
+def get_entries(request: HttpRequest, ranking_id: int) -> tuple[dict, int, str]:
+    ranking = get_ranking(request, ranking_id)
+    if ranking is None:
+        return not_found(ranking_id)
+
+    try:
+        limit = get_limit(request)
+        user = int(request.GET["user"]) if "user" in request.GET else None
+        after = None
+        if "cursor" in request.GET:
+            created_at, entry_id = decode_cursor(request.GET["cursor"])
+            after = (datetime.fromisoformat(created_at), int(entry_id))
+    except (BadRequest, TypeError, ValueError) as e:
+        return ({"error": str(e) or "Invalid cursor"}, 400, "error.html")
+
+    rows = list(entries_page(ranking.id, after, limit, user))
+
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1]["created_at"].isoformat(), rows[-1]["id"])
+
+    return ({
+        "ranking": {"id": ranking.id, "name": ranking.name},
+        "results": rows,
+        "next": next_cursor,
+    }, 200, "website/entries.html")
+
+def neighbour(standing: Standing, other: Standing | None) -> dict | None:
+    if other is None:
+        return None
+
+    return {
+        "user": other.user,
+        "position": other.position,
+        "score": other.score,
+        "gap": abs(other.score - standing.score),
+    }
+
+def get_rank(request: HttpRequest, ranking_id: int, user: int) -> tuple[dict, int, str]:
+    ranking = get_ranking(request, ranking_id)
+    if ranking is None:
+        return not_found(ranking_id)
+
+    standing = ranks.standing(ranking, user)
+    if standing is None:
+        return ({"error": f"User {user} has no score in ranking #{ranking_id}"}, 404, "error.html")
+
+    return ({
+        "ranking": {
+            "id": ranking.id,
+            "name": ranking.name,
+            "subranking": ranking.subranking_name or None,
+        },
+        "user": user,
+        "position": standing.position,
+        "score": standing.score,
+        "of": standing.of,
+        "above": neighbour(standing, standing.above),
+        "below": neighbour(standing, standing.below),
+    }, 200, "website/rank.html")
+
+@vary_on_headers("Accept")
+@condition(etag_func = etag, last_modified_func = last_modified)
+@response_cache(cache_key)
+def leaderboard(request: HttpRequest, ranking_id: int) -> Response:
+    """
+    Top of the standings of a ranking in its active subranking, `?limit=` rows per page, `?cursor=` for the next page
+    """
+    return respond(request, get = get_leaderboard, ranking_id = ranking_id)
+
+@vary_on_headers("Accept")
+@condition(etag_func = etag, last_modified_func = last_modified)
+@response_cache(cache_key)
+def entries(request: HttpRequest, ranking_id: int) -> Response:
+    """
+    Entries of a ranking, newest first, `?user=` for a single user, `?limit=` rows per page, `?cursor=` for the next page
+    """
+    return respond(request, get = get_entries, ranking_id = ranking_id)
+
+@vary_on_headers("Accept")
+def rank(request: HttpRequest, ranking_id: int, user: int) -> Response:
+    """
+    Position and score of a user in the active subranking of a ranking, with the users right above and below
+    """
+    return respond(request, get = get_rank, ranking_id = ranking_id, user = user)
+
+async def events(subscriber: Subscriber, heartbeat: float) -> AsyncIterator[str]:
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle stream
+                yield ": ping\n\n"
+                continue
+
+            if message is None:
+                return
+            yield message
+
+    finally:
+        hub.unsubscribe(subscriber)
+
+async def live(request: HttpRequest, ranking_id: int) -> StreamingHttpResponse | JsonResponse:
+    """
+    Server-sent events of the top of the standings of a ranking: a `snapshot` event, then a `delta`
+    with the users whose score or position changed after every write. Needs an ASGI server.
+    """
+    try:
+        subscriber = await hub.subscribe(ranking_id)
+    except Ranking.DoesNotExist:
+        return JsonResponse({"error": f"Ranking with ID {ranking_id} not found"}, status = 404)
+    except SubscriberLimit:
+        response = JsonResponse({"error": "Too many subscribers, try again later"}, status = 503)
+        response["Retry-After"] = "30"
+        return response
+
+    response = StreamingHttpResponse(
+        events(subscriber, settings.RANKING_LIVE_HEARTBEAT),
+        content_type = "text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+def cache_stats(request: HttpRequest) -> JsonResponse:
+    """
+    Hit rate of the response cache in this process
+    """
+    return JsonResponse(response_cache.stats())
@@ -1,45 +1,72 @@
+from typing import Callable
+
 from django.http import HttpResponse, HttpRequest, JsonResponse
 from django.shortcuts import render
 
+from website.metrics import metrics
 from website.models import *
 
 Response = HttpResponse | JsonResponse
+Handler = Callable[..., tuple[dict, int, str]]
+
+def wants_html(request: HttpRequest) -> bool:
+    """
+    Whether `respond` renders the html template for a request, clients that ask for json by name get json
+    """
+    return request.accepts("text/html") and "application/json" not in request.headers.get("Accept", "")
 
 def respond(
     request: HttpRequest,
-    get: function[HttpRequest, tuple[dict, int, str]] = None,
-    post: function[HttpRequest, tuple[dict, int, str]] = None,
-    put: function[HttpRequest, tuple[dict, int, str]] = None,
-    delete: function[HttpRequest, tuple[dict, int, str]] = None,
+    get: Handler = None,
+    post: Handler = None,
+    put: Handler = None,
+    delete: Handler = None,
+    **kwargs,
 ) -> Response:
     """
     Respond to a request with the appropriate method.
+    Keyword arguments, like the parameters captured from the url, are passed on to the handler.
+    The handler is measured for the metrics under the name of the route.
     """
+    handler = request.resolver_match.url_name if request.resolver_match else request.path
+    with metrics.track(handler, "view") as invocation:
+        response = handle(request, get, post, put, delete, **kwargs)
+        invocation.failed = response.status_code >= 500
+    return response
+
+def handle(
+    request: HttpRequest,
+    get: Handler = None,
+    post: Handler = None,
+    put: Handler = None,
+    delete: Handler = None,
+    **kwargs,
+) -> Response:
     token = request.session.get("token")
 
     response: tuple[dict, int, str] = ({"error": "Internal server error"}, 500, "error.html")
     match request.method:
         case "GET":
             if get is not None:
-                response = get(request)
+                response = get(request, **kwargs)
             else:
                 response = ({"error": "GET method not allowed"}, 405, "error.html")
             
         case "POST":
             if post is not None:
-                response = post(request)
+                response = post(request, **kwargs)
             else:
                 response = ({"error": "POST method not allowed"}, 405, "error.html")
 
         case "PUT":
             if put is not None:
-                response = put(request)
+                response = put(request, **kwargs)
             else:
                 response = ({"error": "PUT method not allowed"}, 405, "error.html")
         
         case "DELETE":
             if delete is not None:
-                response = delete(request)
+                response = delete(request, **kwargs)
             else:
                 response = ({"error": "DELETE method not allowed"}, 405, "error.html")
         
@@ -47,7 +74,7 @@ def respond(
             response = ({"error": "Method not allowed"}, 405, "error.html")
         
     context, status, template_name = response
-    if request.accepts("text/html"):
+    if wants_html(request):
         return render(
             request, 
             template_name, 
@@ -84,9 +84,66 @@ DATABASES = {
         "PASSWORD": getenv("POSTGRES_PASSWORD") or "ranking",
         "HOST": getenv("POSTGRES_HOST") or "localhost",
         "PORT": "5432",
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
     }
 }
 
+# Connection pool (psycopg 3), a connection is only checked out while a query runs
+
+if (getenv("POSTGRES_POOL") or 'True') == 'True':
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(getenv("POSTGRES_POOL_MIN_SIZE") or 2),
+        "max_size": int(getenv("POSTGRES_POOL_MAX_SIZE") or 10),
+        # seconds a request waits for a free connection before failing
+        "timeout": float(getenv("POSTGRES_POOL_TIMEOUT") or 10),
+        "max_idle": float(getenv("POSTGRES_POOL_MAX_IDLE") or 300),
+        "max_lifetime": float(getenv("POSTGRES_POOL_MAX_LIFETIME") or 1800),
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[getenv("DJANGO_CACHE_BACKEND") or "locmem"],
+        "LOCATION": getenv("DJANGO_CACHE_LOCATION") or "ranking",
+        "TIMEOUT": int(getenv("DJANGO_CACHE_TIMEOUT") or 300),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(getenv("DJANGO_CACHE_MAX_ENTRIES") or 1000),
+        },
+    }
+}
+
+# Rendered leaderboard responses, keyed by the ranking version so entry writes never serve stale pages
+
+RANKING_RESPONSE_CACHE = (getenv("RANKING_RESPONSE_CACHE") or 'True') == 'True'
+RANKING_RESPONSE_CACHE_ALIAS = "default"
+RANKING_RESPONSE_CACHE_TTL = int(getenv("RANKING_RESPONSE_CACHE_TTL") or 60)
+
+# Live leaderboards, the versions of followed rankings are polled every interval and changes pushed to the subscribers
+
+RANKING_LIVE_POLL_INTERVAL = float(getenv("RANKING_LIVE_POLL_INTERVAL") or 1.0)
+RANKING_LIVE_MAX_SUBSCRIBERS = int(getenv("RANKING_LIVE_MAX_SUBSCRIBERS") or 200)
+RANKING_LIVE_QUEUE_SIZE = int(getenv("RANKING_LIVE_QUEUE_SIZE") or 32)
+RANKING_LIVE_TOP = int(getenv("RANKING_LIVE_TOP") or 100)
+RANKING_LIVE_HEARTBEAT = float(getenv("RANKING_LIVE_HEARTBEAT") or 15)
+
+# Size of the buckets entries are rolled up in to sum the scores of a window, "day" or "hour".
+# Run the rebuild_scores command after changing it.
+
+RANKING_ROLLUP_BUCKET = getenv("RANKING_ROLLUP_BUCKET") or "day"
+
+# Rows read from the database per round trip when streaming an export
+
+RANKING_EXPORT_CHUNK_SIZE = int(getenv("RANKING_EXPORT_CHUNK_SIZE") or 2000)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -124,6 +181,89 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+
+# Clients allowed to read /metrics, a comma separated list of addresses, empty allows everyone
+
+RANKING_METRICS_ALLOWED_HOSTS = [host.strip() for host in (getenv("RANKING_METRICS_ALLOWED_HOSTS") if getenv("RANKING_METRICS_ALLOWED_HOSTS") is not None else "127.0.0.1,::1").split(",") if host.strip()]
+
+
+# Bot
+# Number of channels whose ranking configuration the bot keeps in memory
+
+RANKING_CHANNEL_CACHE_SIZE = int(getenv("RANKING_CHANNEL_CACHE_SIZE") or 4096)
+
+# Number of user names, and of stored and absent users, the bot keeps in memory each
+
+BOT_NAME_CACHE_SIZE = int(getenv("BOT_NAME_CACHE_SIZE") or 100000)
+
+# Messages discord.py keeps in memory, 0 disables the message cache. Edits are handled from raw events and don't need it.
+
+BOT_MAX_MESSAGES = int(getenv("BOT_MAX_MESSAGES") or 0) or None
+
+# Member lists are not downloaded before the bot is ready, show asks discord for the members it can't name.
+# Member cache flags are a comma separated list of discord.MemberCacheFlags ("voice", "joined"), empty caches no members.
+
+BOT_CHUNK_GUILDS_AT_STARTUP = (getenv("BOT_CHUNK_GUILDS_AT_STARTUP") or 'False') == 'True'
+BOT_MEMBER_CACHE_FLAGS = getenv("BOT_MEMBER_CACHE_FLAGS", "joined")
+BOT_FETCH_MEMBERS = (getenv("BOT_FETCH_MEMBERS") or 'True') == 'True'
+
+# Buffer scored messages and insert them in batches, flushed every interval or once a batch is full
+
+RANKING_WRITE_BEHIND = (getenv("RANKING_WRITE_BEHIND") or 'False') == 'True'
+RANKING_WRITE_BEHIND_INTERVAL_MS = int(getenv("RANKING_WRITE_BEHIND_INTERVAL_MS") or 250)
+RANKING_WRITE_BEHIND_BATCH_SIZE = int(getenv("RANKING_WRITE_BEHIND_BATCH_SIZE") or 200)
+RANKING_WRITE_BEHIND_QUEUE_SIZE = int(getenv("RANKING_WRITE_BEHIND_QUEUE_SIZE") or 10000)
+
+# Lines per page of °show, more pages are rendered when their button is pressed within BOT_SHOW_TIMEOUT seconds
+
+BOT_SHOW_PAGE_ROWS = int(getenv("BOT_SHOW_PAGE_ROWS") or 25)
+BOT_SHOW_TIMEOUT = float(getenv("BOT_SHOW_TIMEOUT") or 180)
+
+# Reactions are sent at most BOT_REACTION_RATE per second in each channel, at most BOT_REACTION_QUEUE_SIZE adds wait.
+# The 🔁 of an edited message is removed BOT_EDIT_REACTION_SECONDS after its last edit.
+
+BOT_REACTION_RATE = float(getenv("BOT_REACTION_RATE") or 4)
+BOT_REACTION_QUEUE_SIZE = int(getenv("BOT_REACTION_QUEUE_SIZE") or 1000)
+BOT_EDIT_REACTION_SECONDS = float(getenv("BOT_EDIT_REACTION_SECONDS") or 20)
+
+# Backfill of the messages posted while the bot was offline: channels read at the same time,
+# messages per history request and seconds between the requests of a channel
+
+BOT_BACKFILL_CONCURRENCY = int(getenv("BOT_BACKFILL_CONCURRENCY") or 2)
+BOT_BACKFILL_PAGE_SIZE = int(getenv("BOT_BACKFILL_PAGE_SIZE") or 100)
+BOT_BACKFILL_PAGE_DELAY = float(getenv("BOT_BACKFILL_PAGE_DELAY") or 1.0)
+
+# Sharding: BOT_SHARD_COUNT shards in total, empty runs one unsharded connection and "auto" every shard discord recommends
+# in this process. A process runs the shards in BOT_SHARD_IDS ("0-3,8") or else range BOT_PROCESS_INDEX of BOT_PROCESS_COUNT.
+# BOT_IDENTIFY_CONCURRENCY shards connect at the same time, 0 asks discord for the max_concurrency of the bot.
+
+BOT_SHARD_COUNT = getenv("BOT_SHARD_COUNT") or ""
+BOT_SHARD_IDS = getenv("BOT_SHARD_IDS") or ""
+BOT_PROCESS_INDEX = int(getenv("BOT_PROCESS_INDEX") or 0)
+BOT_PROCESS_COUNT = int(getenv("BOT_PROCESS_COUNT") or 1)
+BOT_IDENTIFY_CONCURRENCY = int(getenv("BOT_IDENTIFY_CONCURRENCY") or 0)
+
+# Seconds between the checks for rankings another bot process reconfigured
+
+BOT_CONFIG_POLL_INTERVAL = float(getenv("BOT_CONFIG_POLL_INTERVAL") or 5)
+
+# Address of the bot's metrics endpoint, port 0 doesn't serve it
+
+BOT_METRICS_HOST = getenv("BOT_METRICS_HOST") or "127.0.0.1"
+BOT_METRICS_PORT = int(getenv("BOT_METRICS_PORT") or 0)
+
+# °profile and the /profile route of the metrics endpoint profile the bot for at most BOT_PROFILE_MAX_SECONDS,
+# sampling the stacks every BOT_PROFILE_INTERVAL_MS, and list the BOT_PROFILE_TOP busiest functions or allocation sites
+
+BOT_PROFILE_MAX_SECONDS = float(getenv("BOT_PROFILE_MAX_SECONDS") or 300)
+BOT_PROFILE_INTERVAL_MS = float(getenv("BOT_PROFILE_INTERVAL_MS") or 10)
+BOT_PROFILE_TOP = int(getenv("BOT_PROFILE_TOP") or 30)
+
+# Seconds between the background checks that drop stale database connections and log the pool usage
+
+BOT_DB_MAINTENANCE_INTERVAL = float(getenv("BOT_DB_MAINTENANCE_INTERVAL") or 60)
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from ranking.controllers import metrics
+
 urlpatterns = [
     # path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics, name = 'metrics'),
     path('ranking/', include('ranking.urls.ranking-routes')),
 ]
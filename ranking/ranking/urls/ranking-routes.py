@@ -17,6 +17,15 @@ Including another URLconf
 from django.urls import path
 from django.http import JsonResponse
 
+from ranking.controllers import export, ranking
+
 urlpatterns = [
-    path('test/', lambda request: JsonResponse({'message': 'Hello, World!'}))
+    path('test/', lambda request: JsonResponse({'message': 'Hello, World!'})),
+    path('<int:ranking_id>/leaderboard', ranking.leaderboard, name = 'leaderboard'),
+    path('<int:ranking_id>/entries', ranking.entries, name = 'entries'),
+    path('<int:ranking_id>/live', ranking.live, name = 'live'),
+    path('<int:ranking_id>/rank/<int:user>', ranking.rank, name = 'rank'),
+    path('<int:ranking_id>/export/entries', export.entries, name = 'export_entries'),
+    path('<int:ranking_id>/export/standings', export.standings, name = 'export_standings'),
+    path('cache/', ranking.cache_stats, name = 'cache_stats'),
 ]
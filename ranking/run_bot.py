@@ -4,7 +4,7 @@ import asyncio
 import logging
 
 import bot
-from bot.bot import Bot
+from bot.bot import create_bot
 
 import dotenv
 dotenv.load_dotenv()
@@ -15,7 +15,7 @@ if DISCORD_TOKEN is None:
     raise ValueError("DISCORD_TOKEN not set")
 
 async def start():
-    bot.instance = Bot()
+    bot.instance = create_bot()
 
     await bot.instance.load_extensions()
 
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class WebsiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'website'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from website.metrics import instrument
+
+        # count the queries of every handler for the metrics
+        connection_created.connect(instrument)
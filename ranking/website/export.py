@@ -0,0 +1,139 @@
+import csv
+from datetime import datetime
+import json
+from typing import Callable, Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, QuerySet, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from website.models import Entry, Ranking, Score, Subranking
+from website.scores import window_totals
+
+ENTRY_FIELDS = ["id", "user", "number", "message_id", "created_at", "updated_at"]
+STANDING_FIELDS = ["position", "user", "score", "count", "latest"]
+
+
+def parse_time(value: str) -> datetime:
+    """
+    An ISO 8601 time, in the current time zone when it has none
+    """
+    try:
+        time = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid time {value}, expected an ISO 8601 time")
+
+    return time if timezone.is_aware(time) else timezone.make_aware(time)
+
+def in_window(
+    entries: QuerySet,
+    subranking: Subranking | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None
+) -> QuerySet:
+    """
+    Keep the entries created inside the window of a subranking and the [since, until) range
+    """
+    if subranking is not None:
+        entries = entries.filter(created_at__gte = subranking.active_from)
+        if subranking.active_until is not None:
+            entries = entries.filter(created_at__lt = subranking.active_until)
+
+    if since is not None:
+        entries = entries.filter(created_at__gte = since)
+    if until is not None:
+        entries = entries.filter(created_at__lt = until)
+
+    return entries
+
+def entry_rows(
+    ranking_id: int,
+    subranking: Subranking | None = None,
+    user: int | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None
+) -> QuerySet:
+    """
+    The entries of a ranking, oldest first
+    """
+    entries = Entry.objects.filter(ranking_id = ranking_id)
+    if user is not None:
+        entries = entries.filter(user = user)
+
+    return in_window(entries, subranking, since, until).order_by("created_at", "id").values(*ENTRY_FIELDS)
+
+def window_rows(ranking: Ranking, start: datetime | None, end: datetime | None) -> Iterator[dict]:
+    """
+    The standings of a ranking in [start, end), summed from the rollups once iterated
+    """
+    totals = window_totals(ranking.id, start, end)
+    users = sorted(totals, key = lambda user: (
+        totals[user][0] if ranking.reverse_sort else -totals[user][0],
+        totals[user][2],
+        user
+    ))
+    for position, user in enumerate(users, 1):
+        score, count, latest = totals[user]
+        yield {"position": position, "user": user, "score": score, "count": count, "latest": latest}
+
+def standing_rows(
+    ranking: Ranking,
+    subranking: Subranking | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None
+) -> QuerySet | Iterator[dict]:
+    """
+    The standings of a ranking in the window of a subranking, in the order of `standings`.
+    They are read from the scores, or from the rollups when a time range is given.
+    """
+    if since is not None or until is not None:
+        start, end = since, until
+        if subranking is not None:
+            start = max(start or subranking.active_from, subranking.active_from)
+            if subranking.active_until is not None:
+                end = min(end or subranking.active_until, subranking.active_until)
+        return window_rows(ranking, start, end)
+
+    order = [
+        F("score").asc() if ranking.reverse_sort else F("score").desc(),
+        F("latest").asc(),
+        F("user").asc(),
+    ]
+    return Score.objects.filter(ranking_id = ranking.id, subranking = subranking).annotate(
+        score = F("total"),
+        latest = F("last_updated"),
+        position = Window(RowNumber(), order_by = order)
+    ).order_by(*order).values(*STANDING_FIELDS)
+
+def csv_lines(rows: Iterable[dict], fields: list[str]) -> Iterator[str]:
+    class Line:
+        def write(self, value: str) -> str:
+            return value
+
+    writer = csv.writer(Line())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(
+            row[name].isoformat() if isinstance(row[name], datetime) else row[name]
+            for name in fields
+        )
+
+def ndjson_lines(rows: Iterable[dict], fields: list[str]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps({name: row[name] for name in fields}, cls = DjangoJSONEncoder) + "\n"
+
+FORMATS: dict[str, tuple[str, Callable[[Iterable[dict], list[str]], Iterator[str]]]] = {
+    "csv": ("text/csv; charset=utf-8", csv_lines),
+    "ndjson": ("application/x-ndjson; charset=utf-8", ndjson_lines),
+}
+
+def export_lines(rows: QuerySet | Iterator[dict], fields: list[str], format: str = "csv", chunk_size: int = 2000) -> Iterator[str]:
+    """
+    Serialize rows while they are read, `chunk_size` rows at a time from a server side cursor,
+    so the memory used doesn't grow with the number of rows
+    """
+    _, lines = FORMATS[format]
+    if isinstance(rows, QuerySet):
+        rows = rows.iterator(chunk_size = chunk_size)
+    return lines(rows, fields)
@@ -0,0 +1,244 @@
+from asgiref.sync import sync_to_async
+import asyncio
+from dataclasses import dataclass, field
+import json
+import logging
+from typing import Callable
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from website.models import Ranking
+from website.scores import leaderboard
+from website.subrankings import resolver
+
+logger = logging.getLogger("website.live")
+
+Standings = dict[int, tuple[int, float]]
+"""user -> (position, score)"""
+
+
+class SubscriberLimit(Exception):
+    pass
+
+
+def event(name: str, data: dict) -> str:
+    """
+    A server-sent event, serialized once and shared by every subscriber
+    """
+    return f"event: {name}\nid: {data['version']}\ndata: {json.dumps(data, cls = DjangoJSONEncoder)}\n\n"
+
+def load_standings(ranking_id: int, top: int) -> tuple[tuple[int, int], str, Standings]:
+    """
+    The (version, subranking id), the name of the active subranking and the top of the standings of a ranking
+    """
+    ranking = Ranking.objects.get(id = ranking_id)
+    window = resolver.window(ranking)
+    standings = {
+        row["user"]: (position, row["total"])
+        for position, row in enumerate(leaderboard(ranking, window.subranking, limit = top), 1)
+    }
+    return (ranking.version, window.subranking.id if window.subranking else 0), window.name, standings
+
+def rows(standings: Standings, users = None) -> list[dict]:
+    return sorted(
+        (
+            {"position": position, "user": user, "score": score}
+            for user, (position, score) in standings.items()
+            if users is None or user in users
+        ),
+        key = lambda row: row["position"]
+    )
+
+
+class Subscriber:
+    """
+    A client of the live leaderboard. Events wait in a bounded queue; a client that falls
+    behind gets its backlog replaced by a single snapshot and is dropped when it keeps falling behind.
+    """
+    def __init__(self, ranking_id: int, queue_size: int, max_overflows: int = 3) -> None:
+        self.ranking_id = ranking_id
+        self.queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize = queue_size)
+        self.max_overflows = max_overflows
+        self.overflows = 0
+
+    def offer(self, message: str, snapshot: Callable[[], str]) -> None:
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        self.overflows += 1
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+        # the snapshot holds everything the dropped deltas did
+        self.queue.put_nowait(snapshot() if self.overflows <= self.max_overflows else None)
+
+    def close(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+@dataclass
+class Topic:
+    ranking_id: int
+    subscribers: set[Subscriber] = field(default_factory = set)
+    key: tuple[int, int] | None = None
+    name: str = ""
+    standings: Standings = field(default_factory = dict)
+    lock: asyncio.Lock = field(default_factory = asyncio.Lock)
+    _snapshot: str | None = None
+
+    def snapshot(self) -> str:
+        if self._snapshot is None:
+            self._snapshot = event("snapshot", {
+                "ranking": self.ranking_id,
+                "version": self.key[0],
+                "subranking": self.name or None,
+                "results": rows(self.standings),
+            })
+        return self._snapshot
+
+    def update(self, key: tuple[int, int], name: str, standings: Standings) -> str | None:
+        """
+        Take the new standings, returns the delta event when anything changed
+        """
+        changed = {
+            user for user, standing in standings.items()
+            if self.standings.get(user) != standing
+        }
+        removed = [user for user in self.standings if user not in standings]
+        window_changed = self.key is not None and key[1] != self.key[1]
+
+        self.key, self.name, self.standings = key, name, standings
+        self._snapshot = None
+        if window_changed:
+            # a new subranking starts over, send everything
+            return self.snapshot()
+
+        if not changed and not removed:
+            return None
+
+        return event("delta", {
+            "ranking": self.ranking_id,
+            "version": key[0],
+            "changed": rows(standings, changed),
+            "removed": removed,
+        })
+
+
+class LeaderboardHub:
+    """
+    In process fanout of leaderboard changes. One task polls the versions of every ranking
+    that has subscribers with a single query, and a changed ranking is recomputed and diffed once
+    however many clients follow it.
+    """
+    def __init__(self, poll_interval: float = 1.0, max_subscribers: int = 200, queue_size: int = 32, top: int = 100) -> None:
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.top = top
+
+        self.topics: dict[int, Topic] = {}
+        self.polls = 0
+        self.published = 0
+        self._task: asyncio.Task | None = None
+
+    async def subscribe(self, ranking_id: int) -> Subscriber:
+        """
+        Follow a ranking, the first event is a snapshot of its standings.
+        Raises Ranking.DoesNotExist or SubscriberLimit.
+        """
+        topic = self.topics.get(ranking_id)
+        if topic is None:
+            topic = self.topics[ranking_id] = Topic(ranking_id)
+
+        if len(topic.subscribers) >= self.max_subscribers:
+            raise SubscriberLimit(f"Ranking #{ranking_id} has {len(topic.subscribers)} subscribers")
+
+        subscriber = Subscriber(ranking_id, self.queue_size)
+        topic.subscribers.add(subscriber)
+        try:
+            async with topic.lock:
+                if topic.key is None:
+                    topic.update(*await sync_to_async(load_standings)(ranking_id, self.top))
+        except BaseException:
+            self.unsubscribe(subscriber)
+            raise
+
+        subscriber.offer(topic.snapshot(), topic.snapshot)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        topic = self.topics.get(subscriber.ranking_id)
+        if topic is None:
+            return
+
+        topic.subscribers.discard(subscriber)
+        if not topic.subscribers:
+            del self.topics[subscriber.ranking_id]
+
+    async def poll(self) -> None:
+        """
+        Publish the changes of every followed ranking since the last poll
+        """
+        self.polls += 1
+        ranking_ids = list(self.topics)
+        if not ranking_ids:
+            return
+
+        rows = await sync_to_async(
+            lambda: list(Ranking.objects.filter(id__in = ranking_ids).values_list("id", "version", "config_version"))
+        )()
+        versions = {ranking_id: version for ranking_id, version, _ in rows}
+        windows = await sync_to_async(resolver.resolve)(
+            ranking_ids, {ranking_id: config_version for ranking_id, _, config_version in rows}
+        )
+
+        for ranking_id in ranking_ids:
+            topic = self.topics.get(ranking_id)
+            if topic is None:
+                continue
+
+            if ranking_id not in versions:
+                # the ranking was deleted
+                for subscriber in list(topic.subscribers):
+                    subscriber.close()
+                self.topics.pop(ranking_id, None)
+                continue
+
+            window = windows[ranking_id]
+            key = (versions[ranking_id], window.subranking.id if window.subranking else 0)
+            if key == topic.key:
+                continue
+
+            async with topic.lock:
+                message = topic.update(*await sync_to_async(load_standings)(ranking_id, self.top))
+
+            if message is None:
+                continue
+
+            self.published += 1
+            for subscriber in list(topic.subscribers):
+                subscriber.offer(message, topic.snapshot)
+
+    async def _run(self) -> None:
+        while self.topics:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Failed to poll the live leaderboards: {e}")
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "rankings": len(self.topics),
+            "subscribers": sum(len(topic.subscribers) for topic in self.topics.values()),
+            "polls": self.polls,
+            "published": self.published,
+        }
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import QuerySet, Sum
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from bot.cache import channel_rankings
+from website.models import Entry, RankingChannel, Rollup, Score, User
+from website.scores import active_subrankings, entries_page, leaderboard, standings
+from website.subrankings import active_subranking_query
+from website.seed import seed
+
+def hot_queries() -> dict[str, QuerySet]:
+    """
+    The queries the bot runs per message, per edit and per show, aimed at existing data
+    """
+    channel = RankingChannel.objects.order_by("id").first()
+    entry = Entry.objects.order_by("-id").first()
+    if channel is None or entry is None:
+        return {}
+
+    rankings = list(channel_rankings(channel.channel_id))
+    ranking_ids = [ranking.id for ranking in rankings]
+    now = timezone.now()
+
+    return {
+        "channel rankings (message listener)": channel_rankings(channel.channel_id),
+        "entries by message (edit listener)": Entry.objects.filter(message_id = entry.message_id),
+        "active subrankings (show)": active_subranking_query(ranking_ids, now),
+        "standings (show)": standings(rankings, active_subrankings(ranking_ids)),
+        "user names (show)": User.objects.filter(guild_id = channel.guild_id, ranking_id__in = ranking_ids).values_list("ranking_id", "user", "name", "bot"),
+        "score row (entry write)": Score.objects.filter(ranking_id = entry.ranking_id, subranking = None, user = entry.user),
+        "user entries in window": Entry.objects.filter(
+            ranking_id = entry.ranking_id,
+            user__in = [entry.user],
+            created_at__gte = now - timedelta(days = 30)
+        ),
+        "ranking entries in window (rebuild)": Entry.objects.filter(
+            ranking_id = entry.ranking_id,
+            created_at__gte = now - timedelta(days = 30)
+        ).values("user").order_by(),
+        "window rollups (count, export)": Rollup.objects.filter(
+            ranking_id = entry.ranking_id,
+            bucket__gte = now - timedelta(days = 30)
+        ).values("user").annotate(total = Sum("total")).order_by(),
+        "leaderboard page (website)": leaderboard(entry.ranking, active_subrankings([entry.ranking_id])[entry.ranking_id]),
+        "entries page (website)": entries_page(entry.ranking_id),
+    }
+
+class Command(BaseCommand):
+    help = 'Print the query plans of the hot bot queries against a seeded test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type = int, default = 100000)
+        parser.add_argument('--members', type = int, default = 1000)
+        parser.add_argument('--rankings', type = int, default = 20)
+        parser.add_argument('--channels', type = int, default = 10)
+        parser.add_argument('--analyze', action = 'store_true', help = 'Run the queries (EXPLAIN ANALYZE, postgres only)')
+        parser.add_argument('--no-seed', action = 'store_true', help = 'Explain against the configured database as it is')
+
+    def handle(self, *args, entries = 100000, members = 1000, rankings = 20, channels = 10, analyze = False, no_seed = False, **kwargs):
+        if no_seed:
+            self.explain(analyze)
+            return
+
+        old_config = setup_databases(verbosity = 0, interactive = False)
+        try:
+            seed(channels = channels, rankings = rankings, members = members, entries = entries)
+            self.stdout.write(f"Seeded {entries} entries for {members} members in {rankings} rankings\n")
+            self.explain(analyze)
+        finally:
+            teardown_databases(old_config, verbosity = 0)
+
+    def explain(self, analyze: bool):
+        options = {"analyze": True} if analyze and connection.vendor == "postgresql" else {}
+
+        queries = hot_queries()
+        if not queries:
+            self.stdout.write("No entries to explain the queries with")
+            return
+
+        for name, query in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f"## {name}"))
+            self.stdout.write(str(query.query))
+            self.stdout.write(query.explain(**options) + "\n")
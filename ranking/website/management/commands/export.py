@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from website.export import ENTRY_FIELDS, FORMATS, STANDING_FIELDS, entry_rows, export_lines, parse_time, standing_rows
+from website.models import Ranking, Subranking
+from website.subrankings import resolver
+
+class Command(BaseCommand):
+    help = 'Stream the entries or the standings of a ranking as CSV or NDJSON, without loading them in memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices = ['entries', 'standings'])
+        parser.add_argument('ranking_id', type = int)
+        parser.add_argument('--format', choices = list(FORMATS), default = 'csv')
+        parser.add_argument('--subranking', help = 'Id of a subranking of the ranking, or "active" for the active one')
+        parser.add_argument('--user', type = int, help = 'Only the entries of this user')
+        parser.add_argument('--since', help = 'Only entries created at or after this ISO 8601 time')
+        parser.add_argument('--until', help = 'Only entries created before this ISO 8601 time')
+        parser.add_argument('--chunk-size', type = int, default = settings.RANKING_EXPORT_CHUNK_SIZE, help = 'Rows read per database round trip')
+        parser.add_argument('--output', help = 'Write to this file instead of stdout')
+
+    def handle(self, *args, kind, ranking_id, format, subranking = None, user = None, since = None, until = None, chunk_size = 2000, output = None, **kwargs):
+        try:
+            ranking = Ranking.objects.get(id = ranking_id)
+        except Ranking.DoesNotExist:
+            raise CommandError(f"Ranking with ID {ranking_id} not found")
+
+        if subranking == "active":
+            subranking = resolver.window(ranking).subranking
+        elif subranking is not None:
+            subranking = Subranking.objects.filter(id = subranking, ranking_id = ranking.id).first()
+            if subranking is None:
+                raise CommandError(f"Subranking not found in ranking #{ranking_id}")
+
+        try:
+            times = {name: parse_time(value) for name, value in (("since", since), ("until", until)) if value is not None}
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if kind == "entries":
+            rows, fields = entry_rows(ranking.id, subranking, user, **times), ENTRY_FIELDS
+        else:
+            rows, fields = standing_rows(ranking, subranking, **times), STANDING_FIELDS
+
+        lines = export_lines(rows, fields, format, chunk_size)
+        if output is None:
+            for line in lines:
+                self.stdout.write(line, ending = "")
+            return
+
+        with open(output, "w", newline = "") as f:
+            f.writelines(lines)
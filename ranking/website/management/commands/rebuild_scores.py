@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from website.scores import check_rollups, check_scores, rebuild_scores
+
+class Command(BaseCommand):
+    help = 'Rebuild the rollups and score aggregates from the raw entries, or check them with --check'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ranking_ids', nargs = '*', type = int, help = 'Rankings to rebuild (default: all)')
+        parser.add_argument('--check', action = 'store_true', help = 'Only compare the rollups and aggregates with the entries')
+
+    def handle(self, *args, ranking_ids = None, check = False, **kwargs):
+        ranking_ids = ranking_ids or None
+
+        if not check:
+            written = rebuild_scores(ranking_ids)
+            self.stdout.write(f"Rebuilt {written} score rows")
+
+        rollup_mismatches = check_rollups(ranking_ids)
+        for (ranking_id, user, bucket), expected, actual in rollup_mismatches:
+            self.stdout.write(
+                f"ranking #{ranking_id} user {user} bucket {bucket.isoformat()}: "
+                f"expected {expected}, found {actual}"
+            )
+
+        mismatches = check_scores(ranking_ids)
+        for (ranking_id, subranking_id, user), expected, actual in mismatches:
+            self.stdout.write(
+                f"ranking #{ranking_id} subranking {subranking_id} user {user}: "
+                f"expected {expected}, found {actual}"
+            )
+
+        if rollup_mismatches or mismatches:
+            raise CommandError(f"{len(rollup_mismatches) + len(mismatches)} rollup and score rows differ from the entries")
+
+        self.stdout.write(self.style.SUCCESS("Rollups and scores match the entries"))
@@ -0,0 +1,225 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import functools
+import inspect
+import logging
+import math
+import threading
+from time import perf_counter
+from typing import Callable, Iterator
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""seconds"""
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Histogram:
+    """
+    Cumulative histogram like the ones of the Prometheus client libraries
+    """
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[tuple[str, int]]:
+        """
+        (le, observations less than or equal to it) of every bucket, +Inf last
+        """
+        total = 0
+        for bound, count in zip([*map(format_value, self.buckets), "+Inf"], self.counts):
+            total += count
+            yield bound, total
+
+
+@dataclass
+class Invocation:
+    """
+    What one run of a handler did, the database queries of every thread it ran on included
+    """
+    handler: str
+    kind: str
+    queries: int = 0
+    db_seconds: float = 0.0
+    failed: bool = False
+
+
+@dataclass
+class HandlerMetrics:
+    seconds: Histogram = field(default_factory = lambda: Histogram(LATENCY_BUCKETS))
+    queries: Histogram = field(default_factory = lambda: Histogram(QUERY_BUCKETS))
+    db_seconds: Histogram = field(default_factory = lambda: Histogram(LATENCY_BUCKETS))
+    errors: int = 0
+
+
+current: ContextVar[Invocation | None] = ContextVar("invocation", default = None)
+"""sync_to_async copies the context into its thread, so queries made through `db` count for the handler"""
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def record_query(execute, sql, params, many, context):
+    """
+    Execute wrapper counting the queries and their time for the current invocation
+    """
+    invocation = current.get()
+    if invocation is None:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        invocation.queries += 1
+        invocation.db_seconds += perf_counter() - start
+
+def instrument(connection, **kwargs) -> None:
+    """
+    Count the queries of a database connection, connected to `connection_created`
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class ErrorFilter(logging.Filter):
+    """
+    Marks the current invocation failed when it logs an error, the handlers log their failures instead of raising
+    """
+    def filter(self, record: logging.LogRecord) -> bool:
+        invocation = current.get()
+        if invocation is not None and record.levelno >= logging.ERROR:
+            invocation.failed = True
+        return True
+
+
+class Metrics:
+    """
+    Latency, query count and database time histograms and error counts per handler, plus gauges read from
+    the `stats()` of the caches and pools when scraped, rendered in the Prometheus text format
+    """
+    def __init__(self, namespace: str = "ranking") -> None:
+        self.namespace = namespace
+        self.handlers: dict[tuple[str, str], HandlerMetrics] = {}
+        self.gauges: dict[str, Callable[[], dict[str, float]]] = {}
+        self.error_filter = ErrorFilter()
+        self.lock = threading.Lock()
+
+    def register(self, name: str, stats: Callable[[], dict[str, float]]) -> None:
+        """
+        Export the numbers of `stats()` as gauges named `<namespace>_<name>_<key>`
+        """
+        self.gauges[name] = stats
+
+    def observe(self, invocation: Invocation, seconds: float) -> None:
+        with self.lock:
+            handler = self.handlers.get((invocation.kind, invocation.handler))
+            if handler is None:
+                handler = self.handlers[(invocation.kind, invocation.handler)] = HandlerMetrics()
+            handler.seconds.observe(seconds)
+            handler.queries.observe(invocation.queries)
+            handler.db_seconds.observe(invocation.db_seconds)
+            handler.errors += invocation.failed
+
+    def error(self, handler: str, kind: str) -> None:
+        """
+        Count an error that happened outside a tracked invocation
+        """
+        with self.lock:
+            metrics = self.handlers.get((kind, handler))
+            if metrics is None:
+                metrics = self.handlers[(kind, handler)] = HandlerMetrics()
+            metrics.errors += 1
+
+    @contextmanager
+    def track(self, handler: str, kind: str) -> Iterator[Invocation]:
+        """
+        Measure the code of the with block as one invocation of a handler
+        """
+        invocation = Invocation(handler, kind)
+        token = current.set(invocation)
+        start = perf_counter()
+        try:
+            yield invocation
+        except Exception:
+            invocation.failed = True
+            raise
+        finally:
+            current.reset(token)
+            self.observe(invocation, perf_counter() - start)
+
+    def timed(self, handler: str, kind: str) -> Callable:
+        """
+        Decorate a coroutine function or a function to track every call of it
+        """
+        def decorator(function: Callable) -> Callable:
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with self.track(handler, kind):
+                        return await function(*args, **kwargs)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with self.track(handler, kind):
+                        return function(*args, **kwargs)
+            return wrapper
+
+        return decorator
+
+    def render(self) -> str:
+        lines = []
+        name = self.namespace
+        with self.lock:
+            handlers = sorted(self.handlers.items())
+            histograms = [
+                (f"{name}_handler_seconds", "Time a handler took", lambda metrics: metrics.seconds),
+                (f"{name}_handler_db_queries", "Database queries per handler invocation", lambda metrics: metrics.queries),
+                (f"{name}_handler_db_seconds", "Database time per handler invocation", lambda metrics: metrics.db_seconds),
+            ]
+            for metric, description, get in histograms:
+                lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+                for (kind, handler), metrics in handlers:
+                    labels = f'handler="{label(handler)}",kind="{label(kind)}"'
+                    histogram = get(metrics)
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f"{metric}_sum{{{labels}}} {format_value(histogram.sum)}")
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+
+            metric = f"{name}_handler_errors_total"
+            lines += [f"# HELP {metric} Handler invocations that failed", f"# TYPE {metric} counter"]
+            for (kind, handler), metrics in handlers:
+                lines.append(f'{metric}{{handler="{label(handler)}",kind="{label(kind)}"}} {metrics.errors}')
+
+        for group, stats in sorted(self.gauges.items()):
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)):
+                    metric = f"{name}_{group}_{key}"
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {format_value(value)}"]
+
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+metrics = Metrics()
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def populate_scores(apps, schema_editor):
+    Entry = apps.get_model('website', 'Entry')
+    Score = apps.get_model('website', 'Score')
+    Subranking = apps.get_model('website', 'Subranking')
+
+    aggregates = {'total': Sum('number'), 'count': Count('id'), 'last_updated': Max('updated_at')}
+    scores = [
+        Score(subranking=None, **row)
+        for row in Entry.objects.values('ranking_id', 'user').annotate(**aggregates).order_by()
+    ]
+    for subranking in Subranking.objects.all():
+        entries = Entry.objects.filter(ranking_id=subranking.ranking_id, created_at__gte=subranking.active_from)
+        if subranking.active_until is not None:
+            entries = entries.filter(created_at__lt=subranking.active_until)
+        scores += [
+            Score(ranking_id=subranking.ranking_id, subranking=subranking, **row)
+            for row in entries.values('user').annotate(**aggregates).order_by()
+        ]
+    Score.objects.bulk_create(scores)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0003_subranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Score',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.BigIntegerField()),
+                ('total', models.FloatField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('last_updated', models.DateTimeField()),
+                ('ranking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.ranking')),
+                ('subranking', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='website.subranking')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('subranking__isnull', False)), fields=('ranking', 'subranking', 'user'), name='unique_subranking_score'), models.UniqueConstraint(condition=models.Q(('subranking__isnull', True)), fields=('ranking', 'user'), name='unique_ranking_score')],
+            },
+        ),
+        migrations.RunPython(populate_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0004_score'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['message_id'], name='entry_message_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['ranking', 'user', 'created_at'], include=('number', 'updated_at'), name='entry_ranking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['ranking', 'created_at'], include=('user', 'number', 'updated_at'), name='entry_ranking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rankingchannel',
+            index=models.Index(fields=['channel_id'], include=('ranking',), name='rankingchannel_channel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subranking',
+            index=models.Index(fields=['ranking', 'active_from', 'active_until'], name='subranking_window_idx'),
+        ),
+    ]
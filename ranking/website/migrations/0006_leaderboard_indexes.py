@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['ranking', 'subranking', '-total', 'last_updated', 'user'], name='score_leaderboard_idx'),
+        ),
+    ]
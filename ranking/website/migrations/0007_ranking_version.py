@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0006_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0007_ranking_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='bot',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['ranking', 'guild_id'], name='user_ranking_guild_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:52
+
+from discord.utils import time_snowflake
+from django.db import migrations, models
+
+
+def checkpoint_existing(apps, schema_editor):
+    # the rankings made so far count from their creation on, a backfill doesn't score the messages before it
+    RankingChannel = apps.get_model('website', 'RankingChannel')
+
+    links = list(RankingChannel.objects.select_related('ranking'))
+    for link in links:
+        link.backfilled_until = time_snowflake(link.ranking.created_at)
+    RankingChannel.objects.bulk_update(links, ['backfilled_until'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_user_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingchannel',
+            name='backfilled_until',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(checkpoint_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.15 on 2026-10-18 03:58
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Trunc
+
+
+def populate_rollups(apps, schema_editor):
+    Entry = apps.get_model('website', 'Entry')
+    Rollup = apps.get_model('website', 'Rollup')
+
+    bucket = Trunc('created_at', getattr(settings, 'RANKING_ROLLUP_BUCKET', 'day'), tzinfo=datetime.timezone.utc)
+    rows = Entry.objects.annotate(bucket=bucket).values('ranking_id', 'user', 'bucket').annotate(
+        total=Sum('number'), count=Count('id'), last_updated=Max('updated_at')
+    ).order_by()
+    Rollup.objects.bulk_create(Rollup(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0009_rankingchannel_backfill'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.BigIntegerField()),
+                ('bucket', models.DateTimeField()),
+                ('total', models.FloatField(default=0)),
+                ('count', models.IntegerField(default=0)),
+                ('last_updated', models.DateTimeField()),
+                ('ranking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='website.ranking')),
+            ],
+            options={
+                'unique_together': {('ranking', 'bucket', 'user')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
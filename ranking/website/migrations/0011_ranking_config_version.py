@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0010_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ranking',
+            name='config_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -16,40 +16,47 @@ class Ranking(TimeStamp):
     description = models.TextField(blank = True)
     active = models.BooleanField(default = True)
     reverse_sort = models.BooleanField(default = False)
+    version = models.PositiveBigIntegerField(default = 0)
+    """incremented whenever an entry of the ranking is written"""
+    config_version = models.PositiveBigIntegerField(default = 0)
+    """incremented whenever the channels, mappings or subrankings of the ranking change"""
 
     def __str__(self):
         return self.name
     
+    @property
+    def active_window(self):
+        from website.subrankings import resolver
+        return resolver.window(self)
+
+    @property
+    def active_subranking(self) -> "Subranking | None":
+        return self.active_window.subranking
+
     @property
     def from_time(self) -> datetime:
-        active_subrankings = self.subranking_set.filter(
-            models.Q(active_until__isnull = True) | models.Q(active_until__gt = datetime.now()), 
-            active_from__lte = datetime.now()
-        )
-        if active_subrankings:
-            return min(active_subrankings, key = lambda x: x.active_from).active_from
-        return datetime(1970, 1, 1)
+        return self.active_window.start
 
     @property
     def subranking_name(self) -> str:
-        active_subrankings = self.subranking_set.filter(
-            models.Q(active_until__isnull = True) | models.Q(active_until__gt = datetime.now()), 
-            active_from__lte = datetime.now()
-        )
-        if active_subrankings:
-            return min(active_subrankings, key = lambda x: x.active_from).name
-        return ""
+        return self.active_window.name
 
 class RankingChannel(TimeStamp):
     ranking = models.ForeignKey(Ranking, on_delete = models.CASCADE)
     channel_id = models.BigIntegerField(blank = False)
     guild_id = models.BigIntegerField(blank = False)
+    backfilled_until = models.BigIntegerField(null = True, blank = True)
+    """id of the last message of the channel the backfill went through, it continues after it"""
 
     def __str__(self):
         return (self.ranking.name + " - " + self.channel_id)
     
     class Meta:
         unique_together = ('ranking', 'channel_id')
+        indexes = [
+            # channel -> rankings lookup of the message listener
+            models.Index(fields = ['channel_id'], include = ['ranking'], name = 'rankingchannel_channel_idx'),
+        ]
 
 
 class Entry(TimeStamp):
@@ -63,18 +70,42 @@ class Entry(TimeStamp):
     
     class Meta:
         unique_together = ('ranking', 'message_id')
+        indexes = [
+            # entries of an edited message
+            models.Index(fields = ['message_id'], name = 'entry_message_idx'),
+            # a user's entries in a ranking window
+            models.Index(
+                fields = ['ranking', 'user', 'created_at'],
+                include = ['number', 'updated_at'],
+                name = 'entry_ranking_user_created_idx'
+            ),
+            # all entries in a ranking window, grouped by user when rebuilding scores
+            models.Index(
+                fields = ['ranking', 'created_at'],
+                include = ['user', 'number', 'updated_at'],
+                name = 'entry_ranking_created_idx'
+            ),
+        ]
 
 class User(TimeStamp):
+    """
+    Last known display name of a user that scores in a ranking, per guild
+    """
     name = models.CharField(max_length = 200, blank = False)
     user = models.BigIntegerField(blank = False)
     ranking = models.ForeignKey(Ranking, on_delete = models.CASCADE)
     guild_id = models.BigIntegerField(blank = False)
+    bot = models.BooleanField(default = False)
 
     def __str__(self):
         return self.name
     
     class Meta:
         unique_together = ('user', 'ranking', 'guild_id')
+        indexes = [
+            # names of the users of a ranking in a guild
+            models.Index(fields = ['ranking', 'guild_id'], name = 'user_ranking_guild_idx'),
+        ]
 
 class Mapping(TimeStamp):
     ranking = models.ForeignKey(Ranking, on_delete = models.CASCADE)
@@ -98,4 +129,65 @@ class Subranking(TimeStamp):
         return self.name
     
     class Meta:
-        pass
\ No newline at end of file
+        indexes = [
+            # active subranking of a ranking
+            models.Index(fields = ['ranking', 'active_from', 'active_until'], name = 'subranking_window_idx'),
+        ]
+
+class Score(TimeStamp):
+    """
+    Running total of a user's entries in a ranking. Rows with a subranking only
+    count the entries created inside that subranking's window, the row without
+    a subranking counts every entry of the ranking.
+    """
+    ranking = models.ForeignKey(Ranking, on_delete = models.CASCADE)
+    subranking = models.ForeignKey(Subranking, on_delete = models.CASCADE, null = True, blank = True)
+    user = models.BigIntegerField(blank = False)
+    total = models.FloatField(default = 0)
+    count = models.IntegerField(default = 0)
+    last_updated = models.DateTimeField()
+
+    def __str__(self):
+        return (self.ranking.name + " - " + str(self.user) + " - " + str(self.total))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ['ranking', 'subranking', 'user'],
+                condition = models.Q(subranking__isnull = False),
+                name = 'unique_subranking_score'
+            ),
+            models.UniqueConstraint(
+                fields = ['ranking', 'user'],
+                condition = models.Q(subranking__isnull = True),
+                name = 'unique_ranking_score'
+            ),
+        ]
+        indexes = [
+            # keyset pagination of the leaderboard, in standings order
+            models.Index(
+                fields = ['ranking', 'subranking', '-total', 'last_updated', 'user'],
+                name = 'score_leaderboard_idx'
+            ),
+        ]
+
+
+class Rollup(TimeStamp):
+    """
+    Total of a user's entries in a ranking per time bucket, a day or an hour (RANKING_ROLLUP_BUCKET).
+    The scores of any window are summed from its whole buckets and the entries of the partial buckets at its edges.
+    """
+    ranking = models.ForeignKey(Ranking, on_delete = models.CASCADE)
+    user = models.BigIntegerField(blank = False)
+    bucket = models.DateTimeField()
+    """start of the bucket, in UTC"""
+    total = models.FloatField(default = 0)
+    count = models.IntegerField(default = 0)
+    last_updated = models.DateTimeField()
+
+    def __str__(self):
+        return (self.ranking.name + " - " + str(self.user) + " - " + str(self.bucket))
+
+    class Meta:
+        # the buckets of a window, grouped by user
+        unique_together = ('ranking', 'bucket', 'user')
@@ -0,0 +1,266 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import random
+import threading
+
+from website.models import Ranking, Score
+from website.subrankings import resolver
+
+RankKey = tuple[float, datetime, int]
+"""(score, last_updated, user), the score negated when higher scores rank first"""
+
+SYNC_MARGIN = timedelta(seconds = 5)
+"""score rows committed late with an older timestamp are still picked up"""
+
+
+@dataclass
+class Node:
+    key: RankKey
+    priority: float = field(default_factory = random.random)
+    size: int = 1
+    left: "Node | None" = None
+    right: "Node | None" = None
+
+    def update(self) -> "Node":
+        self.size = 1 + size(self.left) + size(self.right)
+        return self
+
+
+def size(node: Node | None) -> int:
+    return node.size if node is not None else 0
+
+def split(node: Node | None, key: RankKey) -> tuple[Node | None, Node | None]:
+    """
+    Split a treap into the keys before `key` and the keys from `key` on
+    """
+    if node is None:
+        return None, None
+
+    if node.key < key:
+        node.right, right = split(node.right, key)
+        return node.update(), right
+
+    left, node.left = split(node.left, key)
+    return left, node.update()
+
+def merge(left: Node | None, right: Node | None) -> Node | None:
+    """
+    Merge two treaps, every key of `left` before every key of `right`
+    """
+    if left is None or right is None:
+        return left or right
+
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return left.update()
+
+    right.left = merge(left, right.left)
+    return right.update()
+
+
+class OrderStatisticTree:
+    """
+    A treap of keys with the size of every subtree, so inserting, removing and finding
+    the position of a key or the key at a position take O(log n)
+    """
+    def __init__(self) -> None:
+        self.root: Node | None = None
+
+    def __len__(self) -> int:
+        return size(self.root)
+
+    def insert(self, key: RankKey) -> None:
+        left, right = split(self.root, key)
+        self.root = merge(merge(left, Node(key)), right)
+
+    def remove(self, key: RankKey) -> None:
+        left, right = split(self.root, key)
+        _, right = split(right, (key[0], key[1], key[2] + 1))
+        self.root = merge(left, right)
+
+    def rank(self, key: RankKey) -> int:
+        """
+        Number of keys before `key`
+        """
+        before = 0
+        node = self.root
+        while node is not None:
+            if node.key < key:
+                before += size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return before
+
+    def at(self, index: int) -> RankKey | None:
+        """
+        The key at a 0 based position
+        """
+        node = self.root
+        while node is not None:
+            left = size(node.left)
+            if index < left:
+                node = node.left
+            elif index == left:
+                return node.key
+            else:
+                index -= left + 1
+                node = node.right
+        return None
+
+
+@dataclass(frozen = True)
+class Standing:
+    user: int
+    position: int
+    score: float
+    of: int
+    """number of users in the standings"""
+    above: "Standing | None" = None
+    below: "Standing | None" = None
+
+
+class RankIndex:
+    """
+    The standings of a ranking in one window, ordered like `standings`: by score
+    (reversed with `reverse_sort`), ties to whoever got there first, then by user id.
+    It catches up with the score rows written since its last sync, so writes of any process show up.
+    """
+    def __init__(self, ranking_id: int, subranking_id: int | None, descending: bool = True) -> None:
+        self.ranking_id = ranking_id
+        self.subranking_id = subranking_id
+        self.descending = descending
+        self.version: int | None = None
+        self.synced_at: datetime | None = None
+        self.tree = OrderStatisticTree()
+        self.users: dict[int, tuple[RankKey, datetime]] = {}
+        """user -> (key, created_at of the score row)"""
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def key(self, user: int, total: float, last_updated: datetime) -> RankKey:
+        return (-total if self.descending else total, last_updated, user)
+
+    def score(self, key: RankKey) -> float:
+        return -key[0] if self.descending else key[0]
+
+    def scores(self):
+        return Score.objects.filter(ranking_id = self.ranking_id, subranking_id = self.subranking_id)
+
+    def load(self) -> None:
+        """
+        Read every score row of the window
+        """
+        self.tree = OrderStatisticTree()
+        self.users = {}
+        self.synced_at = None
+        self.apply(self.scores().values_list("user", "total", "last_updated", "created_at", "updated_at"))
+
+    def apply(self, rows) -> bool:
+        """
+        Move the users of changed score rows, returns False when a row was recreated by a rebuild
+        """
+        for user, total, last_updated, created_at, updated_at in rows:
+            current = self.users.get(user)
+            if current is not None:
+                if current[1] != created_at:
+                    return False
+                self.tree.remove(current[0])
+
+            key = self.key(user, total, last_updated)
+            self.tree.insert(key)
+            self.users[user] = (key, created_at)
+            if self.synced_at is None or updated_at > self.synced_at:
+                self.synced_at = updated_at
+
+        return True
+
+    def sync(self, version: int) -> None:
+        """
+        Catch up with the score rows changed since the last sync, once per ranking version
+        """
+        with self.lock:
+            if version == self.version:
+                return
+
+            if self.synced_at is None:
+                self.load()
+            else:
+                changed = self.scores().filter(updated_at__gte = self.synced_at - SYNC_MARGIN)
+                if not self.apply(changed.values_list("user", "total", "last_updated", "created_at", "updated_at")):
+                    # the scores were rebuilt, the rows that are gone must go too
+                    self.load()
+
+            self.version = version
+
+    def standing(self, user: int) -> Standing | None:
+        """
+        Position and score of a user with the users right above and below, None without a score
+        """
+        with self.lock:
+            current = self.users.get(user)
+            if current is None:
+                return None
+
+            index = self.tree.rank(current[0])
+            neighbours = []
+            for neighbour_index in (index - 1, index + 1):
+                key = self.tree.at(neighbour_index) if neighbour_index >= 0 else None
+                neighbours.append(
+                    Standing(key[2], neighbour_index + 1, self.score(key), len(self.tree))
+                    if key is not None else None
+                )
+
+            return Standing(user, index + 1, self.score(current[0]), len(self.tree), *neighbours)
+
+
+class RankIndexes:
+    """
+    The rank index of the active window of every ranking that was asked for, kept per process
+    """
+    def __init__(self) -> None:
+        self.indexes: dict[int, RankIndex] = {}
+        self.lock = threading.Lock()
+
+    def get(self, ranking: Ranking) -> RankIndex:
+        """
+        The up to date index of a ranking in its active window, built on first use
+        """
+        window = resolver.window(ranking)
+        subranking_id = window.subranking.id if window.subranking else None
+
+        with self.lock:
+            index = self.indexes.get(ranking.id)
+            if (
+                index is None
+                or index.subranking_id != subranking_id
+                or index.descending != (not ranking.reverse_sort)
+            ):
+                index = self.indexes[ranking.id] = RankIndex(ranking.id, subranking_id, not ranking.reverse_sort)
+
+        index.sync(ranking.version)
+        return index
+
+    def standing(self, ranking: Ranking, user: int) -> Standing | None:
+        return self.get(ranking).standing(user)
+
+    def warm(self, ranking_ids: list[int] | None = None) -> int:
+        """
+        Build the indexes of the given rankings (all active rankings if None) from the score rows.
+        Returns the number of users indexed.
+        """
+        rankings = Ranking.objects.filter(active = True)
+        if ranking_ids is not None:
+            rankings = Ranking.objects.filter(id__in = ranking_ids)
+        return sum(len(self.get(ranking)) for ranking in rankings)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "rankings": len(self.indexes),
+            "users": sum(len(index) for index in self.indexes.values()),
+        }
+
+
+ranks = RankIndexes()
@@ -0,0 +1,628 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from math import isclose
+from typing import Iterator
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Q, QuerySet, Sum, Window
+from django.db.models.functions import RowNumber, Trunc
+from django.utils import timezone
+
+from website.models import Entry, Ranking, Rollup, Score, Subranking
+from website.subrankings import active_subranking_query, resolver
+
+ScoreKey = tuple[int, int | None, int]
+"""(ranking_id, subranking_id, user)"""
+
+ScoreValue = tuple[float, int, datetime]
+"""(total, count, last_updated)"""
+
+RollupKey = tuple[int, int, datetime]
+"""(ranking_id, user, bucket)"""
+
+
+def subrankings_at(ranking_id: int, at: datetime) -> list[int]:
+    """
+    Get the ids of the subrankings of a ranking whose window contains a given time
+    """
+    return list(active_subranking_query([ranking_id], at).values_list("id", flat = True))
+
+def entry_windows(entries: list[Entry]) -> list[tuple[int, ...]]:
+    """
+    The ids of the subrankings whose window contains the created_at of every entry, read with one query.
+    Called inside the transaction that writes the entries, so a window another process just created counts.
+    """
+    if not entries:
+        return []
+
+    first = min(entry.created_at for entry in entries)
+    last = max(entry.created_at for entry in entries)
+    subrankings = list(Subranking.objects.filter(
+        Q(active_until__isnull = True) | Q(active_until__gt = first),
+        ranking_id__in = {entry.ranking_id for entry in entries},
+        active_from__lte = last
+    ).order_by("id"))
+
+    return [
+        tuple(
+            subranking.id for subranking in subrankings
+            if subranking.ranking_id == entry.ranking_id
+            and subranking.active_from <= entry.created_at
+            and (subranking.active_until is None or subranking.active_until > entry.created_at)
+        )
+        for entry in entries
+    ]
+
+def bump_versions(ranking_ids: list[int] | None = None) -> None:
+    """
+    Mark the given rankings (all rankings if None) as changed once the current transaction commits
+    """
+    def bump():
+        rankings = Ranking.objects.all()
+        if ranking_ids is not None:
+            rankings = rankings.filter(id__in = ranking_ids)
+        rankings.update(version = F("version") + 1, updated_at = timezone.now())
+
+    # after the commit, so concurrent writers don't queue on the ranking row
+    transaction.on_commit(bump)
+
+def bucket_size() -> timedelta:
+    return timedelta(hours = 1) if settings.RANKING_ROLLUP_BUCKET == "hour" else timedelta(days = 1)
+
+def bucket_of(at: datetime) -> datetime:
+    """
+    Start of the rollup bucket a time falls in
+    """
+    at = at.astimezone(dt_timezone.utc)
+    if settings.RANKING_ROLLUP_BUCKET == "hour":
+        return at.replace(minute = 0, second = 0, microsecond = 0)
+    return at.replace(hour = 0, minute = 0, second = 0, microsecond = 0)
+
+def apply_rollup(ranking_id: int, user: int, delta: float, count: int, created_at: datetime, updated_at: datetime) -> None:
+    """
+    Add `delta` and `count` to the rollup bucket of an entry created at `created_at`.
+    Must be called inside the transaction that writes the entry.
+    """
+    rollups = Rollup.objects.filter(ranking_id = ranking_id, bucket = bucket_of(created_at), user = user)
+    changes = {"total": F("total") + delta, "count": F("count") + count, "last_updated": updated_at}
+    if rollups.update(**changes):
+        return
+
+    try:
+        with transaction.atomic():
+            Rollup.objects.create(
+                ranking_id = ranking_id,
+                bucket = bucket_of(created_at),
+                user = user,
+                total = delta,
+                count = count,
+                last_updated = updated_at
+            )
+    except IntegrityError:
+        # Another writer created the row in the meantime
+        rollups.update(**changes)
+
+def apply_score(
+    ranking_id: int,
+    user: int,
+    delta: float,
+    count: int,
+    created_at: datetime,
+    updated_at: datetime,
+    subranking_ids: tuple[int, ...] | None = None
+) -> None:
+    """
+    Add `delta` and `count` to every score row an entry created at `created_at` counts towards.
+    `subranking_ids` are the subrankings active at `created_at`, looked up when not given.
+    Must be called inside the transaction that writes the entry.
+    """
+    if subranking_ids is None:
+        subranking_ids = subrankings_at(ranking_id, created_at)
+
+    for subranking_id in [None, *subranking_ids]:
+        scores = Score.objects.filter(
+            ranking_id = ranking_id,
+            subranking_id = subranking_id,
+            user = user
+        )
+        # update() skips auto_now, the rank indexes catch up on the rows with a newer updated_at
+        changes = {
+            "total": F("total") + delta,
+            "count": F("count") + count,
+            "last_updated": updated_at,
+            "updated_at": timezone.now(),
+        }
+        if scores.update(**changes):
+            continue
+
+        try:
+            with transaction.atomic():
+                Score.objects.create(
+                    ranking_id = ranking_id,
+                    subranking_id = subranking_id,
+                    user = user,
+                    total = delta,
+                    count = count,
+                    last_updated = updated_at
+                )
+        except IntegrityError:
+            # Another writer created the row in the meantime
+            scores.update(**changes)
+
+@transaction.atomic
+def create_entry(ranking_id: int, user: int, message_id: int, number: float) -> Entry:
+    """
+    Create an entry and add it to the scores of its user
+    """
+    entry = Entry.objects.create(
+        ranking_id = ranking_id,
+        number = number,
+        user = user,
+        message_id = message_id
+    )
+    # the windows are read in the transaction, the cached ones of this process may be behind another process
+    apply_score(ranking_id, user, number, 1, entry.created_at, entry.updated_at)
+    apply_rollup(ranking_id, user, number, 1, entry.created_at, entry.updated_at)
+    bump_versions([ranking_id])
+    return entry
+
+@transaction.atomic
+def create_entries(entries: list[tuple[int, int, int, float]]) -> list[Entry]:
+    """
+    Create many (ranking_id, user, message_id, number) entries with one insert
+    and add them to the scores and rollups of their users, one update per user and window or bucket
+    """
+    created = Entry.objects.bulk_create(
+        Entry(ranking_id = ranking_id, number = number, user = user, message_id = message_id)
+        for ranking_id, user, message_id, number in entries
+    )
+
+    totals: dict[tuple[int, int, tuple[int, ...]], list] = {}
+    rollups: dict[RollupKey, list] = {}
+    for entry, window in zip(created, entry_windows(created)):
+        for key, group in (
+            ((entry.ranking_id, entry.user, window), totals),
+            ((entry.ranking_id, entry.user, bucket_of(entry.created_at)), rollups)
+        ):
+            if key not in group:
+                group[key] = [0.0, 0, entry.created_at, entry.updated_at]
+            total = group[key]
+            total[0] += entry.number
+            total[1] += 1
+            total[3] = max(total[3], entry.updated_at)
+
+    for (ranking_id, user, window), (delta, count, created_at, updated_at) in totals.items():
+        apply_score(ranking_id, user, delta, count, created_at, updated_at, window)
+    for (ranking_id, user, _), (delta, count, created_at, updated_at) in rollups.items():
+        apply_rollup(ranking_id, user, delta, count, created_at, updated_at)
+
+    bump_versions(list({ranking_id for ranking_id, _, _ in totals}))
+    return created
+
+def insert_new_entries(entries: list[tuple[int, int, int, float, datetime]], batch_size: int = 500) -> list[Entry]:
+    """
+    Insert (ranking_id, user, message_id, number, created_at) entries, skipping the messages that already have
+    an entry in the ranking, and return the inserted ones. ON CONFLICT DO NOTHING RETURNING only returns the rows
+    this insert wrote, so an entry another transaction wrote for the same message meanwhile is never mistaken for one.
+    """
+    names = ("ranking_id", "user", "message_id", "number", "created_at", "updated_at")
+    fields = [Entry._meta.get_field(name) for name in ("ranking", "user", "message_id", "number", "created_at", "updated_at")]
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in fields)
+    conflict = ", ".join(quote(Entry._meta.get_field(name).column) for name in ("ranking", "message_id"))
+
+    now = timezone.now()
+    rows = {
+        (ranking_id, message_id): (ranking_id, user, message_id, number, created_at, now)
+        for ranking_id, user, message_id, number, created_at in entries
+    }
+    values = list(rows.values())
+    inserted = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {quote(Entry._meta.db_table)} ({columns}) "
+                f"VALUES {', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(batch))} "
+                f"ON CONFLICT ({conflict}) DO NOTHING RETURNING {quote(Entry._meta.pk.column)}, {conflict}",
+                [field.get_db_prep_save(value, connection) for row in batch for field, value in zip(fields, row)]
+            )
+            for entry_id, ranking_id, message_id in cursor.fetchall():
+                inserted.append(Entry(id = entry_id, **dict(zip(names, rows[(ranking_id, message_id)]))))
+    return inserted
+
+@transaction.atomic
+def import_entries(entries: list[tuple[int, int, int, float, datetime]]) -> int:
+    """
+    Insert (ranking_id, user, message_id, number, created_at) entries of older messages with one insert,
+    skipping the messages that already have an entry in the ranking, and add the inserted entries to the scores
+    of the windows and the rollup buckets their message was posted in, one update per user and window or bucket.
+    Entries count from the time their message was posted. Returns the number of entries inserted.
+    """
+    if not entries:
+        return 0
+
+    inserted = insert_new_entries(entries)
+    if not inserted:
+        return 0
+
+    ranking_ids = list({entry.ranking_id for entry in inserted})
+    totals: dict[tuple[int, int, tuple[int, ...]], list] = {}
+    rollups: dict[RollupKey, list] = {}
+    for entry, window in zip(inserted, entry_windows(inserted)):
+        for key, group in (
+            ((entry.ranking_id, entry.user, window), totals),
+            ((entry.ranking_id, entry.user, bucket_of(entry.created_at)), rollups)
+        ):
+            if key not in group:
+                group[key] = [0.0, 0, entry.created_at, entry.updated_at]
+            total = group[key]
+            total[0] += entry.number
+            total[1] += 1
+            total[3] = max(total[3], entry.updated_at)
+
+    for (ranking_id, user, window), (delta, count, created_at, updated_at) in totals.items():
+        apply_score(ranking_id, user, delta, count, created_at, updated_at, window)
+    for (ranking_id, user, _), (delta, count, created_at, updated_at) in rollups.items():
+        apply_rollup(ranking_id, user, delta, count, created_at, updated_at)
+
+    bump_versions(ranking_ids)
+    return len(inserted)
+
+@transaction.atomic
+def rescore_entries(message_id: int, numbers: dict[int, float]) -> int:
+    """
+    Set the number of the entries of a message, `numbers` maps ranking ids to the new number.
+    All entries are written with one bulk update and the differences moved into the scores.
+    Returns the number of entries of the message in those rankings.
+    """
+    entries = list(Entry.objects.select_for_update().filter(
+        message_id = message_id,
+        ranking_id__in = numbers.keys()
+    ))
+    if not entries:
+        return 0
+
+    now = timezone.now()
+    deltas = []
+    for entry in entries:
+        number = numbers[entry.ranking_id]
+        deltas.append(number - entry.number)
+        entry.number = number
+        # bulk_update skips auto_now
+        entry.updated_at = now
+
+    Entry.objects.bulk_update(entries, ["number", "updated_at"])
+    for entry, delta in zip(entries, deltas):
+        apply_score(entry.ranking_id, entry.user, delta, 0, entry.created_at, entry.updated_at)
+        apply_rollup(entry.ranking_id, entry.user, delta, 0, entry.created_at, entry.updated_at)
+
+    bump_versions(list(numbers))
+    return len(entries)
+
+def expected_scores(ranking_ids: list[int] | None = None) -> Iterator[tuple[ScoreKey, ScoreValue]]:
+    """
+    Compute the scores from the raw entries
+    """
+    entries = Entry.objects.all()
+    subrankings = Subranking.objects.all()
+    if ranking_ids is not None:
+        entries = entries.filter(ranking_id__in = ranking_ids)
+        subrankings = subrankings.filter(ranking_id__in = ranking_ids)
+
+    aggregates = {"total": Sum("number"), "count": Count("id"), "last_updated": Max("updated_at")}
+    for row in entries.values("ranking_id", "user").annotate(**aggregates).order_by():
+        yield (row["ranking_id"], None, row["user"]), (row["total"], row["count"], row["last_updated"])
+
+    for subranking in subrankings:
+        window = entries.filter(ranking_id = subranking.ranking_id, created_at__gte = subranking.active_from)
+        if subranking.active_until is not None:
+            window = window.filter(created_at__lt = subranking.active_until)
+
+        for row in window.values("user").annotate(**aggregates).order_by():
+            yield (subranking.ranking_id, subranking.id, row["user"]), (row["total"], row["count"], row["last_updated"])
+
+def expected_rollups(ranking_ids: list[int] | None = None) -> Iterator[tuple[RollupKey, ScoreValue]]:
+    """
+    Compute the rollups from the raw entries
+    """
+    entries = Entry.objects.all()
+    if ranking_ids is not None:
+        entries = entries.filter(ranking_id__in = ranking_ids)
+
+    rows = entries.annotate(
+        bucket = Trunc("created_at", settings.RANKING_ROLLUP_BUCKET, tzinfo = dt_timezone.utc)
+    ).values("ranking_id", "user", "bucket").annotate(
+        total = Sum("number"), count = Count("id"), last_updated = Max("updated_at")
+    ).order_by()
+    for row in rows:
+        yield (row["ranking_id"], row["user"], row["bucket"]), (row["total"], row["count"], row["last_updated"])
+
+def window_totals(ranking_id: int, start: datetime | None = None, end: datetime | None = None) -> dict[int, ScoreValue]:
+    """
+    Sum the entries of a ranking created in [start, end) per user, from the rollups of the buckets inside the window
+    and the entries of the partial buckets at its edges, so the cost follows the number of users instead of entries
+    """
+    rollups = Rollup.objects.filter(ranking_id = ranking_id)
+    entries = Entry.objects.filter(ranking_id = ranking_id)
+
+    # the whole buckets are [first, last)
+    first = None
+    if start is not None:
+        first = bucket_of(start)
+        if first != start:
+            first += bucket_size()
+    last = bucket_of(end) if end is not None else None
+
+    if first is not None and last is not None and first >= last:
+        # no whole bucket in the window
+        rollups = rollups.none()
+        entries = entries.filter(created_at__gte = start, created_at__lt = end)
+
+    else:
+        edges = Q(pk__in = [])
+        if first is not None:
+            rollups = rollups.filter(bucket__gte = first)
+            edges |= Q(created_at__gte = start, created_at__lt = first)
+        if last is not None:
+            rollups = rollups.filter(bucket__lt = last)
+            edges |= Q(created_at__gte = last, created_at__lt = end)
+        entries = entries.filter(edges)
+
+    totals: dict[int, ScoreValue] = {}
+    rows = [
+        rollups.values("user").annotate(total = Sum("total"), count = Sum("count"), last_updated = Max("last_updated")).order_by(),
+        entries.values("user").annotate(total = Sum("number"), count = Count("id"), last_updated = Max("updated_at")).order_by(),
+    ]
+    for row in (row for query in rows for row in query):
+        if row["user"] in totals:
+            total, count, last_updated = totals[row["user"]]
+            totals[row["user"]] = (total + row["total"], count + row["count"], max(last_updated, row["last_updated"]))
+        else:
+            totals[row["user"]] = (row["total"], row["count"], row["last_updated"])
+
+    return totals
+
+def rollup_scores(
+    ranking_ids: list[int] | None = None,
+    subrankings_only: bool = False,
+    subranking_ids: list[int] | None = None
+) -> Iterator[tuple[ScoreKey, ScoreValue]]:
+    """
+    Compute the scores from the rollups, of the windows of `subranking_ids` only if given
+    """
+    rollups = Rollup.objects.all()
+    subrankings = Subranking.objects.all()
+    if ranking_ids is not None:
+        rollups = rollups.filter(ranking_id__in = ranking_ids)
+        subrankings = subrankings.filter(ranking_id__in = ranking_ids)
+    if subranking_ids is not None:
+        subrankings = subrankings.filter(id__in = subranking_ids)
+
+    if not subrankings_only:
+        rows = rollups.values("ranking_id", "user").annotate(
+            total = Sum("total"), count = Sum("count"), last_updated = Max("last_updated")
+        ).order_by()
+        for row in rows:
+            yield (row["ranking_id"], None, row["user"]), (row["total"], row["count"], row["last_updated"])
+
+    for subranking in subrankings:
+        for user, value in window_totals(subranking.ranking_id, subranking.active_from, subranking.active_until).items():
+            yield (subranking.ranking_id, subranking.id, user), value
+
+def write_scores(scores: QuerySet, rows: Iterator[tuple[ScoreKey, ScoreValue]]) -> int:
+    scores.delete()
+    created = Score.objects.bulk_create(
+        Score(
+            ranking_id = ranking_id,
+            subranking_id = subranking_id,
+            user = user,
+            total = total,
+            count = count,
+            last_updated = last_updated
+        )
+        for (ranking_id, subranking_id, user), (total, count, last_updated) in rows
+    )
+    return len(created)
+
+@transaction.atomic
+def rebuild_scores(ranking_ids: list[int] | None = None) -> int:
+    """
+    Throw away the rollups and scores of the given rankings (all rankings if None) and recompute them from the entries.
+    The entries are read once into the rollups and the scores are summed from those.
+    Returns the number of score rows written.
+    """
+    rollups = Rollup.objects.all()
+    scores = Score.objects.all()
+    if ranking_ids is not None:
+        rollups = rollups.filter(ranking_id__in = ranking_ids)
+        scores = scores.filter(ranking_id__in = ranking_ids)
+
+    rollups.delete()
+    Rollup.objects.bulk_create(
+        Rollup(ranking_id = ranking_id, user = user, bucket = bucket, total = total, count = count, last_updated = last_updated)
+        for (ranking_id, user, bucket), (total, count, last_updated) in expected_rollups(ranking_ids)
+    )
+
+    written = write_scores(scores, rollup_scores(ranking_ids))
+    bump_versions(ranking_ids)
+    return written
+
+@transaction.atomic
+def rebuild_windows(ranking_ids: list[int], subranking_ids: list[int] | None = None) -> int:
+    """
+    Recompute the subranking scores of the given rankings from the rollups,
+    after a subranking was created or its window changed. Only the windows of
+    `subranking_ids` are recomputed if given, every window costs two queries.
+    Returns the number of score rows written.
+    """
+    scores = Score.objects.filter(ranking_id__in = ranking_ids, subranking__isnull = False)
+    if subranking_ids is not None:
+        scores = scores.filter(subranking_id__in = subranking_ids)
+    written = write_scores(scores, rollup_scores(ranking_ids, subrankings_only = True, subranking_ids = subranking_ids))
+    bump_versions(ranking_ids)
+    return written
+
+def check_rollups(ranking_ids: list[int] | None = None) -> list[tuple[RollupKey, ScoreValue | None, ScoreValue | None]]:
+    """
+    Compare the rollups with the raw entries.
+    Returns a list of (key, expected, actual) for every rollup that differs.
+    """
+    rollups = Rollup.objects.all()
+    if ranking_ids is not None:
+        rollups = rollups.filter(ranking_id__in = ranking_ids)
+
+    actual = {
+        (rollup.ranking_id, rollup.user, rollup.bucket): (rollup.total, rollup.count, rollup.last_updated)
+        for rollup in rollups
+    }
+
+    mismatches = []
+    for key, value in expected_rollups(ranking_ids):
+        current = actual.pop(key, None)
+        if (
+            current is None
+            or not isclose(current[0], value[0], abs_tol = 1e-9)
+            or current[1] != value[1]
+            or current[2] != value[2]
+        ):
+            mismatches.append((key, value, current))
+
+    for key, current in actual.items():
+        if current[1] != 0 or not isclose(current[0], 0, abs_tol = 1e-9):
+            mismatches.append((key, None, current))
+
+    return mismatches
+
+def check_scores(ranking_ids: list[int] | None = None) -> list[tuple[ScoreKey, ScoreValue | None, ScoreValue | None]]:
+    """
+    Compare the scores with the raw entries.
+    Returns a list of (key, expected, actual) for every score that differs.
+    """
+    scores = Score.objects.all()
+    if ranking_ids is not None:
+        scores = scores.filter(ranking_id__in = ranking_ids)
+
+    actual = {
+        (score.ranking_id, score.subranking_id, score.user): (score.total, score.count, score.last_updated)
+        for score in scores
+    }
+
+    mismatches = []
+    for key, value in expected_scores(ranking_ids):
+        current = actual.pop(key, None)
+        if (
+            current is None
+            or not isclose(current[0], value[0], abs_tol = 1e-9)
+            or current[1] != value[1]
+            or current[2] != value[2]
+        ):
+            mismatches.append((key, value, current))
+
+    for key, current in actual.items():
+        # Rows without entries are fine as long as they are empty
+        if current[1] != 0 or not isclose(current[0], 0, abs_tol = 1e-9):
+            mismatches.append((key, None, current))
+
+    return mismatches
+
+def active_subrankings(ranking_ids: list[int]) -> dict[int, Subranking | None]:
+    """
+    Get the active subranking of every ranking, with at most one query.
+    Like `Ranking.active_subranking`, the earliest started subranking wins when several are active.
+    """
+    return {
+        ranking_id: window.subranking
+        for ranking_id, window in resolver.resolve(ranking_ids).items()
+    }
+
+def standings(
+    rankings: list[Ranking],
+    subrankings: dict[int, Subranking | None],
+    descending: bool = True
+) -> QuerySet:
+    """
+    Sum the scores of every user over the given rankings, each ranking counted from its subranking.
+    Rows are dicts with `user`, `score`, `latest` (last update), `position` and, when more than one
+    ranking is given, a `ranking_<id>` breakdown per ranking (None if the user has no score there).
+    Rows are ordered by score, ties go to whoever got there first.
+    """
+    if not rankings:
+        return Score.objects.none()
+
+    condition = Q()
+    for ranking in rankings:
+        condition |= Q(ranking_id = ranking.id, subranking = subrankings.get(ranking.id))
+
+    scores = Score.objects.filter(condition)
+
+    breakdown = {}
+    if len(rankings) > 1:
+        breakdown = {
+            f"ranking_{ranking.id}": Sum("total", filter = Q(ranking_id = ranking.id))
+            for ranking in rankings
+        }
+
+    order = [
+        F("score").desc() if descending else F("score").asc(),
+        F("latest").asc(),
+        F("user").asc(),
+    ]
+    return scores.values("user").annotate(
+        score = Sum("total"),
+        latest = Max("last_updated"),
+        **breakdown
+    ).annotate(
+        position = Window(RowNumber(), order_by = order)
+    ).order_by(*order)
+
+def leaderboard(
+    ranking: Ranking,
+    subranking: Subranking | None,
+    after: tuple[float, datetime, int] | None = None,
+    limit: int = 50
+) -> QuerySet:
+    """
+    A page of the standings of a single ranking, in the same order as `standings`.
+    Pages continue after the (score, latest, user) of the last row of the previous page,
+    so a deep page costs as much as the first one.
+    """
+    descending = not ranking.reverse_sort
+    scores = Score.objects.filter(ranking_id = ranking.id, subranking = subranking)
+
+    if after is not None:
+        score, latest, user = after
+        beyond = Q(total__lt = score) if descending else Q(total__gt = score)
+        scores = scores.filter(
+            beyond
+            | Q(total = score, last_updated__gt = latest)
+            | Q(total = score, last_updated = latest, user__gt = user)
+        )
+
+    return scores.order_by(
+        F("total").desc() if descending else F("total").asc(),
+        "last_updated",
+        "user"
+    ).values("user", "total", "last_updated")[:limit]
+
+def entries_page(
+    ranking_id: int,
+    after: tuple[datetime, int] | None = None,
+    limit: int = 50,
+    user: int | None = None
+) -> QuerySet:
+    """
+    A page of the entries of a ranking, newest first.
+    Pages continue after the (created_at, id) of the last entry of the previous page.
+    """
+    entries = Entry.objects.filter(ranking_id = ranking_id)
+    if user is not None:
+        entries = entries.filter(user = user)
+
+    if after is not None:
+        created_at, entry_id = after
+        entries = entries.filter(Q(created_at__lt = created_at) | Q(created_at = created_at, id__lt = entry_id))
+
+    return entries.order_by("-created_at", "-id").values(
+        "id", "user", "number", "message_id", "created_at", "updated_at"
+    )[:limit]
@@ -0,0 +1,130 @@
+from dataclasses import dataclass, field
+from datetime import timedelta
+import random
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from website.models import Entry, Mapping, Ranking, RankingChannel, Subranking
+from website.scores import rebuild_scores
+
+GUILD_BASE = 10 ** 17
+CHANNEL_BASE = 2 * 10 ** 17
+USER_BASE = 3 * 10 ** 17
+MESSAGE_BASE = 10 ** 18
+TOKENS = [None, None, "€", "pt", "kg"]
+
+
+@dataclass
+class SeedResult:
+    """
+    The ids of the synthetic data, so callers can aim queries at it
+    """
+    guild_ids: list[int] = field(default_factory = list)
+    channel_ids: list[int] = field(default_factory = list)
+    ranking_ids: list[int] = field(default_factory = list)
+    channel_rankings: dict[int, list[int]] = field(default_factory = dict)
+    members: list[int] = field(default_factory = list)
+    message_ids: list[int] = field(default_factory = list)
+
+
+@transaction.atomic
+def seed(
+    guilds: int = 1,
+    channels: int = 10,
+    rankings: int = 20,
+    mappings: int = 3,
+    members: int = 1000,
+    entries: int = 100000,
+    days: int = 90,
+    seed: int = 0,
+    batch_size: int = 5000,
+) -> SeedResult:
+    """
+    Fill the database with synthetic guilds, channels, rankings, mappings, subrankings and entries.
+    Entries are spread over the last `days` days and a few users write most of them, like in a real channel.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    result = SeedResult(
+        guild_ids = [GUILD_BASE + i for i in range(guilds)],
+        channel_ids = [CHANNEL_BASE + i for i in range(channels)],
+        members = [USER_BASE + i for i in range(members)],
+    )
+
+    created_rankings = Ranking.objects.bulk_create(
+        Ranking(
+            name = f"ranking {i}",
+            token = rng.choice(TOKENS),
+            description = "",
+            active = True,
+            reverse_sort = rng.random() < 0.1
+        )
+        for i in range(rankings)
+    )
+    result.ranking_ids = [ranking.id for ranking in created_rankings]
+
+    ranking_channels = []
+    for i, ranking in enumerate(created_rankings):
+        # every channel gets at least one ranking, some rankings are linked to two channels
+        linked = {result.channel_ids[i % channels]}
+        if rng.random() < 0.2:
+            linked.add(rng.choice(result.channel_ids))
+        for channel_id in linked:
+            result.channel_rankings.setdefault(channel_id, []).append(ranking.id)
+            ranking_channels.append(RankingChannel(
+                ranking = ranking,
+                channel_id = channel_id,
+                guild_id = result.guild_ids[channel_id % guilds]
+            ))
+    RankingChannel.objects.bulk_create(ranking_channels)
+
+    Mapping.objects.bulk_create(
+        Mapping(ranking = ranking, string = f"m{j}", value = rng.choice([0.5, 2.0, 10.0]))
+        for ranking in created_rankings
+        for j in range(mappings)
+    )
+
+    subrankings = []
+    for ranking in created_rankings[::2]:
+        middle = now - timedelta(days = days / 2)
+        subrankings.append(Subranking(ranking = ranking, name = "old", active_from = now - timedelta(days = days), active_until = middle))
+        subrankings.append(Subranking(ranking = ranking, name = "current", active_from = middle, active_until = None))
+    Subranking.objects.bulk_create(subrankings)
+
+    weights = [1 / (i + 1) for i in range(members)]
+    first_id = None
+    for start in range(0, entries, batch_size):
+        count = min(batch_size, entries - start)
+        users = rng.choices(result.members, weights = weights, k = count)
+        created = Entry.objects.bulk_create(
+            Entry(
+                ranking_id = rng.choice(result.ranking_ids),
+                number = rng.choice([1.0, 1.0, 2.0, 0.5, -1.0, 5.0]),
+                user = user,
+                message_id = MESSAGE_BASE + start + i
+            )
+            for i, user in enumerate(users)
+        )
+        if first_id is None and created:
+            first_id = created[0].id
+    result.message_ids = [MESSAGE_BASE + i for i in range(entries)]
+
+    if first_id is not None:
+        # auto_now_add can't be overridden on insert, spread the entries over time afterwards
+        buckets = max(1, min(days, entries))
+        per_bucket = -(-entries // buckets)
+        for bucket in range(buckets):
+            created_at = now - timedelta(days = days) + timedelta(days = days * bucket / buckets)
+            Entry.objects.filter(
+                id__gte = first_id + bucket * per_bucket,
+                id__lt = first_id + (bucket + 1) * per_bucket
+            ).update(created_at = created_at, updated_at = created_at)
+
+    rebuild_scores(result.ranking_ids)
+
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    return result
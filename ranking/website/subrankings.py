@@ -0,0 +1,144 @@
+from dataclasses import dataclass
+from datetime import datetime
+import threading
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from website.models import Ranking, Subranking
+
+EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass(frozen = True)
+class ActiveWindow:
+    """
+    The window a ranking currently counts in. Without an active subranking it counts every entry.
+    """
+    subranking: Subranking | None = None
+    subranking_ids: tuple[int, ...] = ()
+    """every active subranking, entries count towards all of them"""
+
+    @property
+    def start(self) -> datetime:
+        return self.subranking.active_from if self.subranking else EPOCH
+
+    @property
+    def end(self) -> datetime | None:
+        return self.subranking.active_until if self.subranking else None
+
+    @property
+    def name(self) -> str:
+        return self.subranking.name if self.subranking else ""
+
+
+def active_subranking_query(ranking_ids: list[int], at: datetime) -> QuerySet:
+    """
+    The subrankings of the given rankings whose window contains a given time
+    """
+    return Subranking.objects.filter(
+        Q(active_until__isnull = True) | Q(active_until__gt = at),
+        ranking_id__in = ranking_ids,
+        active_from__lte = at
+    )
+
+
+class SubrankingResolver:
+    """
+    Resolves the active window of many rankings with one query and keeps it
+    until the next time a subranking starts or ends. With `check_versions` a kept window
+    is only used while the config version of its ranking didn't move, so a subranking another
+    process created shows up on the next resolve. A process that invalidates the windows
+    itself when the configuration changes can turn the check off and save that query.
+    Writes don't use the kept windows, see `entry_windows`.
+    """
+    def __init__(self, check_versions: bool = True) -> None:
+        self.check_versions = check_versions
+        self.hits = 0
+        self.misses = 0
+        self._windows: dict[int, tuple[ActiveWindow, datetime | None, int | None]] = {}
+        """ranking_id -> (window, when it changes, config version it was read at)"""
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def resolve(self, ranking_ids: list[int], versions: dict[int, int] | None = None) -> dict[int, ActiveWindow]:
+        """
+        The active window of every ranking. `versions` are the config versions of rankings the caller
+        already read, the versions of the others are read with one query when they are checked.
+        """
+        now = timezone.now()
+        versions = dict(versions or {})
+        unknown = [ranking_id for ranking_id in ranking_ids if ranking_id not in versions]
+        if not self.check_versions:
+            versions = {}
+        elif unknown:
+            # read before the subrankings, a change in between only costs another read
+            versions.update(Ranking.objects.filter(id__in = unknown).values_list("id", "config_version"))
+
+        windows = {}
+        missing = []
+        with self._lock:
+            generation = self._generation
+            for ranking_id in ranking_ids:
+                cached = self._windows.get(ranking_id)
+                if (
+                    cached is None
+                    or (cached[1] is not None and now >= cached[1])
+                    or versions.get(ranking_id) != cached[2]
+                ):
+                    missing.append(ranking_id)
+                else:
+                    windows[ranking_id] = cached[0]
+
+        self.hits += len(windows)
+        self.misses += len(missing)
+        if not missing:
+            return windows
+
+        # current and future subrankings, the future ones tell when the window changes
+        subrankings: dict[int, list[Subranking]] = {ranking_id: [] for ranking_id in missing}
+        for subranking in Subranking.objects.filter(
+            Q(active_until__isnull = True) | Q(active_until__gt = now),
+            ranking_id__in = missing
+        ).order_by("active_from", "id"):
+            subrankings[subranking.ranking_id].append(subranking)
+
+        with self._lock:
+            for ranking_id, candidates in subrankings.items():
+                active = [subranking for subranking in candidates if subranking.active_from <= now]
+                boundaries = [
+                    subranking.active_until if subranking.active_from <= now else subranking.active_from
+                    for subranking in candidates
+                    if subranking.active_from > now or subranking.active_until is not None
+                ]
+
+                window = ActiveWindow(
+                    subranking = active[0] if active else None,
+                    subranking_ids = tuple(subranking.id for subranking in active)
+                )
+                # don't keep what was read before an invalidation
+                if generation == self._generation:
+                    self._windows[ranking_id] = (window, min(boundaries, default = None), versions.get(ranking_id))
+                windows[ranking_id] = window
+
+        return windows
+
+    def window(self, ranking: Ranking) -> ActiveWindow:
+        """
+        The active window of a ranking row, checked against the config version it was read with
+        """
+        return self.resolve([ranking.id], {ranking.id: ranking.config_version})[ranking.id]
+
+    def invalidate(self, ranking_id: int | None = None) -> None:
+        """
+        Forget the window of a ranking, or of all rankings
+        """
+        with self._lock:
+            self._generation += 1
+            if ranking_id is None:
+                self._windows.clear()
+            else:
+                self._windows.pop(ranking_id, None)
+
+
+resolver = SubrankingResolver()
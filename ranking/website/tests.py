@@ -1,3 +1,451 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+import csv
+from datetime import timedelta
+import random
+from io import StringIO
+import json
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, F, Max, Sum
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from website.metrics import metrics
+from website.live import LeaderboardHub, SubscriberLimit, load_standings
+from website.models import Entry, Ranking, Subranking
+from website.ranks import OrderStatisticTree, RankIndexes, ranks
+from website.scores import (
+    active_subrankings, check_rollups, check_scores, create_entries, create_entry, rebuild_scores, rebuild_windows, rescore_entries, standings,
+    window_totals
+)
+from website.seed import seed
+from website.subrankings import resolver
+
+
+class LeaderboardTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 2, rankings = 3, members = 40, entries = 600)
+
+    def setUp(self):
+        cache.clear()
+
+    def pages(self, url: str, limit: int, **params) -> list[dict]:
+        rows = []
+        cursor = None
+        while True:
+            query = {"limit": limit, **params}
+            if cursor:
+                query["cursor"] = cursor
+            response = self.client.get(url, query, HTTP_ACCEPT = "application/json")
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            rows += body["results"]
+            cursor = body["next"]
+            if cursor is None:
+                return rows
+
+    def test_pages_follow_standings(self):
+        for ranking in Ranking.objects.filter(id__in = self.seeded.ranking_ids):
+            with self.subTest(ranking = ranking.id):
+                expected = [
+                    (row["position"], row["user"], row["score"])
+                    for row in standings([ranking], active_subrankings([ranking.id]), descending = not ranking.reverse_sort)
+                ]
+                rows = self.pages(f"/ranking/{ranking.id}/leaderboard", 7)
+                self.assertEqual([(row["position"], row["user"], row["score"]) for row in rows], expected)
+
+    def test_entry_pages_are_newest_first(self):
+        ranking_id = self.seeded.ranking_ids[0]
+        expected = list(Entry.objects.filter(ranking_id = ranking_id).order_by("-created_at", "-id").values_list("id", flat = True))
+        rows = self.pages(f"/ranking/{ranking_id}/entries", 50)
+        self.assertEqual([row["id"] for row in rows], expected)
+
+    def test_unchanged_leaderboard_is_not_modified(self):
+        ranking_id = self.seeded.ranking_ids[0]
+        url = f"/ranking/{ranking_id}/leaderboard"
+        response = self.client.get(url, HTTP_ACCEPT = "application/json")
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        response = self.client.get(url, HTTP_ACCEPT = "application/json", HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute = True):
+            create_entry(ranking_id, self.seeded.members[0], 1, 1.0)
+        response = self.client.get(url, HTTP_ACCEPT = "application/json", HTTP_IF_NONE_MATCH = etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_until_an_entry_is_written(self):
+        ranking_id = self.seeded.ranking_ids[0]
+        url = f"/ranking/{ranking_id}/leaderboard"
+        first = self.client.get(url, HTTP_ACCEPT = "application/json")
+        self.assertEqual(first["X-Cache"], "MISS")
+
+        with self.assertNumQueries(1):
+            second = self.client.get(url, HTTP_ACCEPT = "application/json")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.content, first.content)
+
+        html = self.client.get(url, HTTP_ACCEPT = "text/html")
+        self.assertEqual(html["X-Cache"], "MISS")
+        self.assertTrue(html["Content-Type"].startswith("text/html"))
+
+        with self.captureOnCommitCallbacks(execute = True):
+            create_entry(ranking_id, self.seeded.members[-1], 2, 1000.0)
+        third = self.client.get(url, HTTP_ACCEPT = "application/json")
+        self.assertEqual(third["X-Cache"], "MISS")
+        self.assertEqual(third.json()["results"][0]["user"], self.seeded.members[-1])
+
+    def test_new_subranking_shows_up(self):
+        # the bot process of another container counts from now on
+        ranking_id = self.seeded.ranking_ids[1]
+        url = f"/ranking/{ranking_id}/leaderboard"
+        first = self.client.get(url, HTTP_ACCEPT = "application/json")
+        self.assertIsNone(first.json()["ranking"]["subranking"])
+
+        with self.captureOnCommitCallbacks(execute = True):
+            Subranking.objects.create(ranking_id = ranking_id, name = "new", active_from = timezone.now() - timedelta(days = 1))
+            rebuild_windows([ranking_id])
+            Ranking.objects.filter(id = ranking_id).update(config_version = F("config_version") + 1)
+
+        second = self.client.get(url, HTTP_ACCEPT = "application/json", HTTP_IF_NONE_MATCH = first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["ranking"]["subranking"], "new")
+        self.assertNotEqual(second.json()["results"], first.json()["results"])
+
+    def test_bad_cursor(self):
+        response = self.client.get(f"/ranking/{self.seeded.ranking_ids[0]}/leaderboard", {"cursor": "nope"}, HTTP_ACCEPT = "application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_ranking(self):
+        response = self.client.get("/ranking/0/leaderboard", HTTP_ACCEPT = "application/json")
+        self.assertEqual(response.status_code, 404)
+
+
+class LiveLeaderboardTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 1, rankings = 1, members = 20, entries = 200)
+        cls.ranking_id = cls.seeded.ranking_ids[0]
+
+    @staticmethod
+    def data(message: str) -> tuple[str, dict]:
+        lines = dict(line.split(": ", 1) for line in message.strip().split("\n"))
+        return lines["event"], json.loads(lines["data"])
+
+    def create_entry(self, user: int, number: float) -> None:
+        with self.captureOnCommitCallbacks(execute = True):
+            create_entry(self.ranking_id, user, number, number)
+
+    async def write(self, user: int, number: float) -> None:
+        await sync_to_async(self.create_entry)(user, number)
+
+    async def test_subscribers_share_one_delta(self):
+        hub = LeaderboardHub(top = 5)
+        first = await hub.subscribe(self.ranking_id)
+        second = await hub.subscribe(self.ranking_id)
+
+        name, snapshot = self.data(first.queue.get_nowait())
+        self.assertEqual(name, "snapshot")
+        self.assertEqual(len(snapshot["results"]), 5)
+        second.queue.get_nowait()
+
+        await hub.poll()
+        self.assertTrue(first.queue.empty())
+
+        await self.write(self.seeded.members[-1], 1000.0)
+        await hub.poll()
+        message = first.queue.get_nowait()
+        self.assertIs(message, second.queue.get_nowait())
+
+        name, delta = self.data(message)
+        self.assertEqual(name, "delta")
+        self.assertEqual(delta["changed"][0]["position"], 1)
+        self.assertEqual(delta["changed"][0]["user"], self.seeded.members[-1])
+
+        # the delta turns the snapshot into the new standings
+        standings = {row["user"]: row for row in snapshot["results"]}
+        for user in delta["removed"]:
+            del standings[user]
+        standings.update({row["user"]: row for row in delta["changed"]})
+        _, _, expected = await sync_to_async(load_standings)(self.ranking_id, 5)
+        self.assertEqual({user: (row["position"], row["score"]) for user, row in standings.items()}, expected)
+
+    async def test_slow_subscriber_gets_a_snapshot(self):
+        hub = LeaderboardHub(top = 5, queue_size = 1)
+        subscriber = await hub.subscribe(self.ranking_id)
+        for i in range(3):
+            await self.write(self.seeded.members[-1 - i], 1000.0 * (i + 1))
+            await hub.poll()
+
+        name, snapshot = self.data(subscriber.queue.get_nowait())
+        self.assertEqual(name, "snapshot")
+        self.assertEqual(snapshot["results"][0]["user"], self.seeded.members[-3])
+        self.assertTrue(subscriber.queue.empty())
+
+    async def test_subscriber_limit(self):
+        hub = LeaderboardHub(max_subscribers = 1)
+        subscriber = await hub.subscribe(self.ranking_id)
+        with self.assertRaises(SubscriberLimit):
+            await hub.subscribe(self.ranking_id)
+
+        hub.unsubscribe(subscriber)
+        self.assertEqual(hub.stats()["subscribers"], 0)
+        await hub.subscribe(self.ranking_id)
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 1, rankings = 2, members = 30, entries = 500)
+        cls.ranking = Ranking.objects.get(id = cls.seeded.ranking_ids[0])
+
+    async def export(self, kind: str, **params) -> tuple[str, str]:
+        response = await self.async_client.get(f"/ranking/{self.ranking.id}/export/{kind}", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response["Content-Type"], "".join([chunk.decode() async for chunk in response.streaming_content])
+
+    async def test_entries_csv(self):
+        user = self.seeded.members[0]
+        since = (await Entry.objects.filter(ranking = self.ranking).order_by("created_at").values_list("created_at", flat = True)[10:11].aget())
+        content_type, content = await self.export("entries", user = user, since = since.isoformat())
+        self.assertTrue(content_type.startswith("text/csv"))
+
+        rows = list(csv.DictReader(StringIO(content)))
+        expected = [
+            entry async for entry in Entry.objects.filter(ranking = self.ranking, user = user, created_at__gte = since).order_by("created_at", "id").values_list("id", flat = True)
+        ]
+        self.assertEqual([int(row["id"]) for row in rows], expected)
+
+    async def test_standings_ndjson(self):
+        _, content = await self.export("standings", format = "ndjson")
+        rows = [json.loads(line) for line in content.splitlines()]
+        expected = await sync_to_async(lambda: [
+            (row["position"], row["user"], row["score"])
+            for row in standings([self.ranking], active_subrankings([self.ranking.id]) | {self.ranking.id: None}, not self.ranking.reverse_sort)
+        ])()
+        self.assertEqual([(row["position"], row["user"], row["score"]) for row in rows], expected)
+
+    async def test_bad_requests(self):
+        response = await self.async_client.get(f"/ranking/{self.ranking.id}/export/entries", {"format": "xml"})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(f"/ranking/{self.ranking.id}/export/entries", {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get("/ranking/0/export/standings")
+        self.assertEqual(response.status_code, 404)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("export", "entries", str(self.ranking.id), "--format", "ndjson", "--chunk-size", "7", stdout = out)
+        self.assertEqual(len(out.getvalue().splitlines()), Entry.objects.filter(ranking = self.ranking).count())
+
+
+class RollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 1, rankings = 2, members = 30, entries = 800, days = 20)
+        cls.ranking_id = cls.seeded.ranking_ids[0]
+
+    def brute_force(self, start, end) -> dict:
+        entries = Entry.objects.filter(ranking_id = self.ranking_id)
+        if start is not None:
+            entries = entries.filter(created_at__gte = start)
+        if end is not None:
+            entries = entries.filter(created_at__lt = end)
+
+        return {
+            row["user"]: (row["total"], row["count"], row["last_updated"])
+            for row in entries.values("user").annotate(total = Sum("number"), count = Count("id"), last_updated = Max("updated_at")).order_by()
+        }
+
+    def assertTotals(self, actual: dict, expected: dict):
+        self.assertEqual(actual.keys(), expected.keys())
+        for user, (total, count, last_updated) in expected.items():
+            self.assertAlmostEqual(actual[user][0], total)
+            self.assertEqual(actual[user][1:], (count, last_updated))
+
+    def test_windows_match_the_entries(self):
+        now = timezone.now()
+        windows = [
+            (None, None),
+            (now - timedelta(days = 5, hours = 7, minutes = 13), None),
+            (None, now - timedelta(days = 3, hours = 2)),
+            (now - timedelta(days = 12, minutes = 1), now - timedelta(days = 2, hours = 20)),
+            # inside a single bucket
+            (now - timedelta(days = 4, hours = 3), now - timedelta(days = 4, hours = 1)),
+        ]
+        for start, end in windows:
+            with self.subTest(start = start, end = end):
+                # the whole buckets and the edges, each read with a single query
+                with CaptureQueriesContext(connection) as queries:
+                    totals = window_totals(self.ranking_id, start, end)
+                self.assertLessEqual(len(queries), 2)
+                self.assertTotals(totals, self.brute_force(start, end))
+
+    def test_rollups_follow_writes(self):
+        members = self.seeded.members
+        entry = create_entry(self.ranking_id, members[0], 1, 3.0)
+        create_entries([(self.ranking_id, members[1], 2, 4.0), (self.seeded.ranking_ids[1], members[1], 2, 5.0)])
+        rescore_entries(entry.message_id, {self.ranking_id: -1.0})
+        self.assertEqual(check_rollups(self.seeded.ranking_ids), [])
+
+    def test_new_window_is_summed_from_rollups(self):
+        Subranking.objects.create(
+            ranking_id = self.ranking_id,
+            name = "recent",
+            active_from = timezone.now() - timedelta(days = 6, hours = 5)
+        )
+        resolver.invalidate(self.ranking_id)
+        rebuild_windows([self.ranking_id])
+        self.assertEqual(check_scores([self.ranking_id]), [])
+
+    def test_writes_count_in_windows_the_process_hasnt_seen(self):
+        # a shard process that didn't poll the config version yet
+        resolver.check_versions = False
+        self.addCleanup(setattr, resolver, "check_versions", True)
+        ranking_id = self.seeded.ranking_ids[1]
+        self.assertEqual(resolver.resolve([ranking_id])[ranking_id].subranking_ids, ())
+
+        Subranking.objects.create(ranking_id = ranking_id, name = "new", active_from = timezone.now() - timedelta(hours = 1))
+        rebuild_windows([ranking_id])
+        members = self.seeded.members
+        create_entry(ranking_id, members[0], 1, 3.0)
+        create_entries([(ranking_id, members[1], 2, 4.0), (ranking_id, members[2], 3, 5.0)])
+        self.assertEqual(resolver.resolve([ranking_id])[ranking_id].subranking_ids, ())
+        self.assertEqual(check_scores([ranking_id]), [])
+
+    def test_only_the_changed_windows_are_rebuilt(self):
+        windows = list(Subranking.objects.filter(ranking_id = self.ranking_id))
+        recent = Subranking.objects.create(
+            ranking_id = self.ranking_id,
+            name = "recent",
+            active_from = timezone.now() - timedelta(days = 2, hours = 7)
+        )
+        resolver.invalidate(self.ranking_id)
+        with CaptureQueriesContext(connection) as changed:
+            rebuild_windows([self.ranking_id], [recent.id])
+        self.assertEqual(check_scores([self.ranking_id]), [])
+
+        with CaptureQueriesContext(connection) as every:
+            rebuild_windows([self.ranking_id])
+        # the other windows keep their scores and aren't summed again
+        self.assertTrue(windows)
+        self.assertEqual(len(every) - len(changed), 2 * len(windows))
+
+
+class OrderStatisticTreeTest(SimpleTestCase):
+    def test_matches_a_sorted_list(self):
+        rng = random.Random(0)
+        tree = OrderStatisticTree()
+        keys = []
+        for i in range(2000):
+            if keys and rng.random() < 0.3:
+                key = keys.pop(rng.randrange(len(keys)))
+                tree.remove(key)
+            else:
+                key = (rng.randint(-50, 50), timezone.now(), i)
+                keys.append(key)
+                tree.insert(key)
+
+        keys.sort()
+        self.assertEqual(len(tree), len(keys))
+        for index, key in enumerate(keys):
+            self.assertEqual(tree.rank(key), index)
+            self.assertEqual(tree.at(index), key)
+        self.assertIsNone(tree.at(len(keys)))
+
+
+class RankTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 2, rankings = 4, members = 40, entries = 800)
+
+    def setUp(self):
+        ranks.indexes.clear()
+        resolver.invalidate()
+
+    def assertMatchesStandings(self, indexes: RankIndexes, ranking: Ranking):
+        rows = list(standings([ranking], active_subrankings([ranking.id]), not ranking.reverse_sort))
+        for row in rows:
+            standing = indexes.standing(ranking, row["user"])
+            self.assertEqual((standing.position, standing.score, standing.of), (row["position"], row["score"], len(rows)))
+            if standing.above is not None:
+                self.assertEqual(standing.above.user, rows[row["position"] - 2]["user"])
+
+    def test_positions_follow_writes(self):
+        indexes = RankIndexes()
+        for ranking in Ranking.objects.filter(id__in = self.seeded.ranking_ids):
+            with self.subTest(ranking = ranking.id, reverse_sort = ranking.reverse_sort):
+                self.assertMatchesStandings(indexes, ranking)
+
+                last = standings([ranking], active_subrankings([ranking.id]), not ranking.reverse_sort).last()
+                with self.captureOnCommitCallbacks(execute = True):
+                    create_entry(ranking.id, last["user"], ranking.id, -1000.0 if ranking.reverse_sort else 1000.0)
+                ranking.refresh_from_db()
+                self.assertEqual(indexes.standing(ranking, last["user"]).position, 1)
+                self.assertMatchesStandings(indexes, ranking)
+
+                with self.captureOnCommitCallbacks(execute = True):
+                    rebuild_scores([ranking.id])
+                ranking.refresh_from_db()
+                self.assertMatchesStandings(indexes, ranking)
+
+    def test_endpoint(self):
+        ranking = Ranking.objects.get(id = self.seeded.ranking_ids[0])
+        first, second = standings([ranking], active_subrankings([ranking.id]), not ranking.reverse_sort)[:2]
+
+        response = self.client.get(f"/ranking/{ranking.id}/rank/{second['user']}", HTTP_ACCEPT = "application/json")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["position"], 2)
+        self.assertEqual(body["above"]["user"], first["user"])
+        self.assertEqual(body["above"]["gap"], abs(first["score"] - second["score"]))
+
+        response = self.client.get(f"/ranking/{ranking.id}/rank/1", HTTP_ACCEPT = "application/json")
+        self.assertEqual(response.status_code, 404)
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(channels = 1, rankings = 1, members = 20, entries = 200)
+
+    def setUp(self):
+        metrics.handlers.clear()
+        cache.clear()
+
+    def sample(self, text: str, name: str) -> float:
+        for line in text.splitlines():
+            if line.startswith(name + " "):
+                return float(line.rsplit(" ", 1)[1])
+        self.fail(f"{name} not in the metrics")
+
+    def test_views_are_measured(self):
+        ranking_id = self.seeded.ranking_ids[0]
+        # different pages, the cached responses skip the view
+        for limit in range(1, 4):
+            self.client.get(f"/ranking/{ranking_id}/entries?limit={limit}", HTTP_ACCEPT = "application/json")
+        self.client.get("/ranking/0/rank/1", HTTP_ACCEPT = "application/json")
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+
+        labels = 'handler="entries",kind="view"'
+        self.assertEqual(self.sample(text, f"ranking_handler_seconds_count{{{labels}}}"), 3)
+        self.assertEqual(self.sample(text, f'ranking_handler_seconds_bucket{{{labels},le="+Inf"}}'), 3)
+        self.assertGreater(self.sample(text, f"ranking_handler_db_queries_sum{{{labels}}}"), 0)
+        self.assertEqual(self.sample(text, f"ranking_handler_errors_total{{{labels}}}"), 0)
+        self.assertEqual(self.sample(text, 'ranking_handler_seconds_count{handler="rank",kind="view"}'), 1)
+        self.assertIn("ranking_response_cache_misses ", text)
+
+    def test_only_allowed_hosts_scrape(self):
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR = "10.0.0.1").status_code, 403)
+        with self.settings(RANKING_METRICS_ALLOWED_HOSTS = []):
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR = "10.0.0.1").status_code, 200)